@@ -0,0 +1,126 @@
+"""
+Execução em lote do gerador de mapas: várias planilhas distribuídas entre processos.
+"""
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dataset_cache import DatasetCache
+from map_pipeline import generate_map
+
+# Cache reaproveitado por todas as planilhas do mesmo processo (inclusive em cada worker)
+_cache: Optional[DatasetCache] = None
+
+
+def _get_cache(cache_dir: Optional[str]) -> DatasetCache:
+    global _cache
+    if _cache is None or (cache_dir and _cache.cache_dir != cache_dir):
+        _cache = DatasetCache(cache_dir)
+    return _cache
+
+
+def _run_job(tarefa: Tuple) -> Dict:
+    """
+    Gera o mapa de uma planilha. Nunca propaga exceção: o erro volta no
+    resultado para que uma planilha com problema não interrompa o lote.
+    """
+    (excel_path, output_path, cores, cache_dir, usar_cache, parse_options, compressao, kmz_path,
+     geofence_m, deviation_m, geofence_gap_s, map_options) = tarefa
+    inicio = time.perf_counter()
+    try:
+        cache = _get_cache(cache_dir) if usar_cache else None
+        resultado = generate_map(excel_path, output_path, cores, cache=cache,
+                                 parse_options=parse_options, compressao=compressao, kmz_path=kmz_path,
+                                 geofence_m=geofence_m, deviation_m=deviation_m,
+                                 geofence_gap_s=geofence_gap_s, **map_options)
+        resultado['ok'] = True
+        resultado['erro'] = None
+    except Exception as e:
+        resultado = {
+            'arquivo': excel_path,
+            'saida': output_path,
+            'ok': False,
+            'erro': f"{type(e).__name__}: {e}",
+            'traceback': traceback.format_exc(),
+            'tempos': {'total': time.perf_counter() - inicio},
+        }
+    resultado['pid'] = os.getpid()
+    return resultado
+
+
+class BatchMapRunner:
+    """
+    Gera um mapa por planilha, em paralelo entre processos.
+
+    Cada resultado traz 'ok', 'erro' (e 'traceback'), tempos por etapa e o
+    processo que executou; o callback de progresso é chamado a cada planilha
+    concluída com (concluídas, total, resultado).
+    """
+
+    def __init__(self, workers: Optional[int] = None, cache_dir: Optional[str] = None, usar_cache: bool = True,
+                 progress: Optional[Callable[[int, int, Dict], None]] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.usar_cache = usar_cache
+        self.progress = progress
+
+    def run(self, arquivos: List[Tuple[str, str]], mapeamento_cores: Optional[Dict[str, str]] = None,
+            parse_options: Optional[Dict] = None, compressao: Optional[str] = None,
+            kmz_path: Optional[str] = None, geofence_m: float = 0.0, deviation_m: float = 0.0,
+            geofence_gap_s: Optional[float] = None, **map_options) -> List[Dict]:
+        """
+        arquivos: pares (planilha, html de saída). Retorna os resultados na mesma
+        ordem da entrada, independentemente da ordem de conclusão. kmz_path
+        (checkpoints e rota planejada), geofence_m, deviation_m e geofence_gap_s
+        valem para todas as planilhas.
+        """
+        tarefas = [(excel, saida, mapeamento_cores, self.cache_dir, self.usar_cache, parse_options, compressao,
+                    kmz_path, geofence_m, deviation_m, geofence_gap_s, map_options)
+                   for excel, saida in arquivos]
+        resultados: List[Optional[Dict]] = [None] * len(tarefas)
+        total = len(tarefas)
+        workers = min(self.workers, total)
+
+        if workers <= 1:
+            for i, tarefa in enumerate(tarefas):
+                resultados[i] = _run_job(tarefa)
+                self._notify(i + 1, total, resultados[i])
+            return resultados
+
+        concluidas = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futuros = {pool.submit(_run_job, tarefa): i for i, tarefa in enumerate(tarefas)}
+            for futuro in as_completed(futuros):
+                i = futuros[futuro]
+                try:
+                    resultados[i] = futuro.result()
+                except Exception as e:
+                    # Worker encerrado de forma anormal (ex.: falta de memória)
+                    excel, saida = arquivos[i]
+                    resultados[i] = {'arquivo': excel, 'saida': saida, 'ok': False,
+                                     'erro': f"{type(e).__name__}: {e}", 'tempos': {}}
+                concluidas += 1
+                self._notify(concluidas, total, resultados[i])
+        return resultados
+
+    def _notify(self, concluidas: int, total: int, resultado: Dict) -> None:
+        if self.progress:
+            self.progress(concluidas, total, resultado)
+
+    @staticmethod
+    def summary(resultados: List[Dict]) -> Dict:
+        """Totais do lote: quantidade de sucessos/falhas e soma dos tempos por etapa."""
+        ok = [r for r in resultados if r.get('ok')]
+        tempos = {}
+        for r in ok:
+            for etapa, segundos in r.get('tempos', {}).items():
+                tempos[etapa] = tempos.get(etapa, 0.0) + segundos
+        return {
+            'total': len(resultados),
+            'sucesso': len(ok),
+            'falhas': len(resultados) - len(ok),
+            'pontos': sum(r.get('pontos', 0) for r in ok),
+            'tempos': tempos,
+        }
@@ -4,6 +4,8 @@ import tkinter as tk
 from tkinter import colorchooser
 from tkinter import ttk
 
+from ui_helpers import CORES_PADRAO
+
 
 class ColorPickerUI:
     def __init__(self, tipos_encontrados):
@@ -18,11 +20,7 @@ class ColorPickerUI:
         self.resultado_cores = {}
 
         # Paleta de cores aprimorada
-        self.cores_default = [
-            "#2563eb", "#dc2626", "#16a34a", "#9333ea",
-            "#ea580c", "#0891b2", "#ca8a04", "#db2777",
-            "#0d9488", "#4f46e5", "#f59e0b", "#8b5cf6"
-        ]
+        self.cores_default = list(CORES_PADRAO)
 
         self._criar_interface()
 
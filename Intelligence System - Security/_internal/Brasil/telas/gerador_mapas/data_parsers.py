@@ -4,10 +4,15 @@ Parsers para dados de Excel e arquivos KMZ/KML - Versão Categorias (Tipo).
 import zipfile
 import xml.etree.ElementTree as ET
 import re
+import hashlib
+import warnings
+import numpy as np
 import pandas as pd
+from datetime import datetime
 from decimal import Decimal
-from typing import Optional, Tuple, List, Dict
-from ui_helpers import normalize_money, format_brl, normalize_string, html_escape
+from typing import Optional, Tuple, List, Dict, Iterator
+from ui_helpers import normalize_money, format_brl, normalize_string, html_escape, valid_name_mask
+from trajectory_processing import snap_positions, detect_stops, points_in_polygon
 
 
 class KMZParser:
@@ -20,54 +25,135 @@ class KMZParser:
         self.pontos_info = []
         self.linhas = []
 
-    def parse(self, caminho: str) -> Tuple[List[Dict], List[Tuple]]:
+    def parse(self, caminho: str) -> Tuple[List[Dict], List[np.ndarray]]:
+        """
+        Lê o KML/KMZ inteiro: (checkpoints, uma array (N, 2) de [lat, lon] por
+        LineString). As LineStrings ficam separadas para que rotas diferentes
+        não sejam ligadas entre si.
+        """
+        pontos_info = []
+        linhas = []
+        for tipo, registro in self.iter_records(caminho):
+            if tipo == 'ponto':
+                pontos_info.append(registro)
+            else:
+                linhas.append(registro)
+        self.pontos_info, self.linhas = pontos_info, linhas
+        return pontos_info, linhas
+
+    def iter_records(self, caminho: str) -> Iterator[Tuple[str, object]]:
+        """
+        Percorre o KML (ou o .kml dentro do KMZ) em streaming, sem carregá-lo
+        inteiro: lê direto do membro do zip e gera ('ponto', dict) para cada
+        Placemark com Point e ('linha', array (N, 2) de [lat, lon]) para cada LineString.
+        """
         if caminho.lower().endswith('.kml'):
             with open(caminho, 'rb') as f:
-                return self._parse_kml_bytes(f.read())
+                yield from self._iter_kml(f)
         else:
             with zipfile.ZipFile(caminho, 'r') as z:
                 kml_nome = next((n for n in z.namelist() if n.lower().endswith('.kml')), None)
                 if not kml_nome:
                     raise RuntimeError('KMZ não contém .kml')
-                return self._parse_kml_bytes(z.read(kml_nome))
+                with z.open(kml_nome) as f:
+                    yield from self._iter_kml(f)
 
-    def _parse_kml_bytes(self, kml_bytes: bytes) -> Tuple[List[Dict], List[Tuple]]:
-        root = ET.fromstring(kml_bytes)
-        pontos_info = []
-        linhas = []
+    @staticmethod
+    def _local(tag: str) -> str:
+        return tag.rsplit('}', 1)[-1]
 
-        for pm in root.findall('.//kml:Placemark', self.NS):
-            coords_el = pm.find('.//kml:Point/kml:coordinates', self.NS)
-            if coords_el is None or not (coords_el.text or '').strip():
+    def _iter_kml(self, arquivo) -> Iterator[Tuple[str, object]]:
+        """
+        Passada única com iterparse: cada Placemark é resumido ao terminar e
+        removido da árvore (assim como LineStrings soltas), mantendo a memória
+        limitada ao elemento em leitura.
+        """
+        pilha = []        # elementos abertos (para saber o contexto e remover do pai)
+        placemark = None  # campos do Placemark em leitura
+        for evento, el in ET.iterparse(arquivo, events=('start', 'end')):
+            nome = self._local(el.tag)
+            if evento == 'start':
+                pilha.append(el)
+                if nome == 'Placemark':
+                    placemark = {'coords': None, 'name': '', 'address': '', 'description': '', 'valor': None}
                 continue
 
-            coords = self._parse_coordinates_block(coords_el.text)
-            if not coords: continue
+            pilha.pop()
+            pai = self._local(pilha[-1].tag) if pilha else ''
 
-            lat, lon = coords[0]
-            name = self._first_text(pm, 'kml:name') or ''
-            address = self._first_text(pm, 'kml:address') or ''
+            if nome == 'coordinates':
+                if pai == 'LineString':
+                    coords = self._parse_coordinates_array(el.text)
+                    if len(coords):
+                        yield 'linha', coords
+                elif pai == 'Point' and placemark is not None and placemark['coords'] is None:
+                    placemark['coords'] = self._parse_coordinates_array(el.text)
+                # O texto das coordenadas pode ter dezenas de MB: liberado assim que lido
+                el.clear()
+            elif placemark is not None and pai == 'Placemark' and nome in ('name', 'address', 'description'):
+                placemark[nome] = (el.text or '').strip()
+            elif placemark is not None and nome == 'Data' and placemark['valor'] is None:
+                placemark['valor'] = self._valor_de_data(el)
+            elif nome == 'Placemark':
+                registro = self._registro_ponto(placemark)
+                placemark = None
+                if registro:
+                    yield 'ponto', registro
 
-            valor_raw = self._extract_valor_from_extendeddata(pm)
-            if not valor_raw:
-                valor_raw = self._extract_valor_from_description(pm)
+            # Libera o que já foi lido: Placemarks e LineStrings fora deles
+            if nome == 'Placemark' or (nome == 'LineString' and placemark is None):
+                el.clear()
+                if pilha:
+                    pilha[-1].remove(el)
 
-            valor_fmt = format_brl(valor_raw) if valor_raw else None
+    def _registro_ponto(self, placemark: Dict) -> Optional[Dict]:
+        """Checkpoint a partir dos campos coletados de um Placemark (None se não tiver Point)."""
+        if placemark['coords'] is None or not len(placemark['coords']):
+            return None
+        lat, lon = placemark['coords'][0].tolist()
+        valor_raw = placemark['valor']
+        if not valor_raw and placemark['description']:
+            valor_raw = self._valor_da_descricao(placemark['description'])
+        valor_fmt = format_brl(valor_raw) if valor_raw else None
+        return {
+            'lat': lat, 'lon': lon,
+            'name': placemark['name'], 'address': placemark['address'],
+            'valor_raw': valor_raw, 'valor_fmt': valor_fmt
+        }
 
-            pontos_info.append({
-                'lat': lat, 'lon': lon,
-                'name': name, 'address': address,
-                'valor_raw': valor_raw, 'valor_fmt': valor_fmt
-            })
-
-        for el in root.findall('.//kml:LineString/kml:coordinates', self.NS):
-            linhas += self._parse_coordinates_block(el.text)
+    def _valor_de_data(self, data: ET.Element) -> Optional[Decimal]:
+        """Valor monetário de um <Data name="...valor..."><value>...</value></Data>."""
+        name = (data.get('name') or '').strip().lower()
+        if 'valor' not in name:
+            return None
+        value_el = next((c for c in data if self._local(c.tag) == 'value'), None)
+        raw = (value_el.text or '').strip() if value_el is not None and value_el.text else ''
+        return normalize_money(raw) if raw else None
 
-        return pontos_info, linhas
+    def _parse_coordinates_array(self, texto: str) -> np.ndarray:
+        """
+        Bloco <coordinates> ("lon,lat[,alt] ...") -> array (N, 2) de [lat, lon].
 
-    def _first_text(self, node, xpath: str) -> str:
-        el = node.find(xpath, self.NS)
-        return (el.text or '').strip() if el is not None and el.text else ''
+        Caso comum (todas as tuplas com o mesmo número de valores): uma única
+        conversão vetorizada; blocos irregulares ou com valores inválidos usam a
+        leitura token a token, que descarta só as tuplas inválidas.
+        """
+        primeiro = texto.split(None, 1) if texto else []
+        if not primeiro:
+            return np.empty((0, 2))
+        dims = primeiro[0].count(',') + 1
+        if dims >= 2:
+            try:
+                # Valor inválido no meio do bloco: o numpy só avisa e trunca; aqui vira erro
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error')
+                    valores = np.fromstring(texto.replace(',', ' '), sep=' ')
+                n = valores.size // dims
+                if valores.size == n * dims and texto.count(',') == n * (dims - 1):
+                    return valores.reshape(n, dims)[:, [1, 0]]
+            except (ValueError, DeprecationWarning):
+                pass
+        return np.array(self._parse_coordinates_block(texto), dtype=float).reshape(-1, 2)
 
     def _parse_coordinates_block(self, texto: str) -> List[Tuple]:
         coords = []
@@ -80,19 +166,8 @@ class KMZParser:
                 except: pass
         return coords
 
-    def _extract_valor_from_extendeddata(self, pm: ET.Element) -> Optional[Decimal]:
-        for data in pm.findall('.//kml:ExtendedData/kml:Data', self.NS):
-            name = (data.get('name') or '').strip().lower()
-            value_el = data.find('kml:value', self.NS)
-            raw = (value_el.text or '').strip() if value_el is not None and value_el.text else ''
-            if raw and 'valor' in name:
-                norm = normalize_money(raw)
-                if norm is not None: return norm
-        return None
-
-    def _extract_valor_from_description(self, pm: ET.Element) -> Optional[Decimal]:
-        desc = self._first_text(pm, 'kml:description')
-        if not desc: return None
+    @staticmethod
+    def _valor_da_descricao(desc: str) -> Optional[Decimal]:
         m = re.search(r'VALOR.*?(\d[\d\s.,]*)', desc, flags=re.I)
         return normalize_money(m.group(1)) if m else None
 
@@ -100,18 +175,100 @@ class KMZParser:
 class ExcelParser:
     """Parser para arquivos Excel com dados de trajeto."""
 
-    def __init__(self, excel_path: str):
+    # Únicas colunas usadas pelo gerador; o restante da planilha nem é carregado
+    COLUNAS_UTEIS = ('Data/Hora', 'Latitude', 'Longitude', 'Evento', 'Ignição',
+                     'Observações', 'Tipo', 'Veículo', 'NOME_PESSOA')
+    # Colunas guardadas por evento (uma linha por registro da planilha) em df_eventos
+    COLUNAS_EVENTOS = ('Data/Hora', 'Evento', 'Observações')
+    CHUNK_SIZE = 50000
+    # Incrementar sempre que a lógica de parsing mudar (invalida o cache em disco)
+    PARSER_VERSION = 6
+    # Janela padrão da junção de posições próximas: intervalo máximo entre leituras
+    SNAP_JANELA_S = 30 * 60
+    # Detecção de paradas: velocidade e deslocamento máximos entre leituras paradas
+    VEL_PARADA_KMH = 3.0
+    RAIO_PARADA_M = 100.0
+
+    # Formatos de Data/Hora testados numa amostra; o do modelo mapa.xlsx vem primeiro
+    FORMATOS_DATA = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+                     '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S',
+                     '%d-%m-%Y %H:%M:%S', '%d/%m/%y %H:%M:%S', '%d/%m/%y %H:%M')
+    AMOSTRA_DATAS = 500
+    # Data serial do Excel: dias desde 30/12/1899 (sistema 1900, com o bug do ano bissexto)
+    ORIGEM_SERIAL_EXCEL = pd.Timestamp('1899-12-30')
+    # Mesma resolução que o pd.to_datetime da versão instalada do pandas produz (ns no 2.x, us no 3.x)
+    DTYPE_DATA = pd.to_datetime(pd.Series(['01/01/2000 00:00:00']), format='%d/%m/%Y %H:%M:%S').dtype
+
+    def __init__(self, excel_path: str, streaming: bool = False, chunk_size: Optional[int] = None,
+                 cache=None, snap_radius_m: float = 0.0, snap_window_s: Optional[float] = None,
+                 stop_min_s: float = 0.0, time_start=None, time_end=None,
+                 bbox: Optional[Tuple[float, float, float, float]] = None,
+                 polygon: Optional[List[Tuple[float, float]]] = None,
+                 tipos: Optional[List[str]] = None, eventos: Optional[List[str]] = None):
         self.excel_path = excel_path
+        self.streaming = streaming
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.cache = cache
+        # Junção de posições a até snap_radius_m metros (0 = agrupamento por coordenada exata)
+        self.snap_radius_m = snap_radius_m
+        self.snap_window_s = self.SNAP_JANELA_S if snap_window_s is None else snap_window_s
+        # Paradas de pelo menos stop_min_s segundos viram um único ponto (0 = desativado)
+        self.stop_min_s = stop_min_s
+        # Filtros aplicados na leitura, antes do agrupamento (None = sem filtro):
+        # intervalo de Data/Hora, bbox (lat_min, lon_min, lat_max, lon_max),
+        # polígono [(lat, lon), ...], Tipos e eventos (sem diferenciar maiúsculas)
+        self.time_start = self._converter_limite(time_start)
+        self.time_end = self._converter_limite(time_end)
+        self.bbox = tuple(bbox) if bbox else None
+        self.polygon = [tuple(v) for v in polygon] if polygon else None
+        self.tipos = {str(t).strip().lower() for t in tipos} if tipos else None
+        self.eventos = {str(e).strip().lower() for e in eventos} if eventos else None
+        # Linhas válidas descartadas pelos filtros de leitura
+        self.filtered_out_rows = 0
+        self.from_cache = False
         self.df = None
         self.df_grouped = None
+        self.df_eventos = None
+        self.center_location = [0.0, 0.0]
+        # Linhas de Data/Hora fora do formato detectado (interpretadas uma a uma)
+        self.datetime_fallback_rows = 0
+
+    def cache_key(self) -> str:
+        """Identifica versão e opções do parser que alteram o resultado."""
+        chave = f"v{self.PARSER_VERSION}"
+        if self.snap_radius_m > 0:
+            chave += f"-snap{self.snap_radius_m:g}m{self.snap_window_s:g}s"
+        if self.stop_min_s > 0:
+            chave += f"-parada{self.stop_min_s:g}s"
+        filtros = self._descricao_filtros()
+        if filtros:
+            chave += "-filtro" + hashlib.md5(filtros.encode('utf-8')).hexdigest()[:12]
+        return chave
 
     def parse(self) -> pd.DataFrame:
         """Carrega o Excel e unifica Tipo/Veículo e NOME_PESSOA."""
-        self.df = pd.read_excel(self.excel_path)
+        if self.cache is not None:
+            dados = self.cache.load(self.excel_path, self.cache_key())
+            if dados is not None:
+                self.df_grouped = dados['df_grouped']
+                self.df_eventos = dados['df_eventos']
+                self.center_location = dados['center_location']
+                self.datetime_fallback_rows = dados.get('datetime_fallback_rows', 0)
+                self.filtered_out_rows = dados.get('filtered_out_rows', 0)
+                self.from_cache = True
+                return self.df_grouped
 
-        # 1. Datas e Limpeza
-        self.df['Data/Hora'] = pd.to_datetime(self.df['Data/Hora'], dayfirst=True, errors='coerce')
-        self.df = self.df.dropna(subset=['Data/Hora', 'Latitude', 'Longitude'])
+        # 1. Datas e Limpeza (em lotes no modo streaming, para manter a memória limitada)
+        if self.streaming and self._suporta_streaming():
+            partes = [self._limpar_linhas(chunk) for chunk in self._iter_chunks()]
+            self.df = pd.concat([p for p in partes if not p.empty] or partes[:1])
+        else:
+            self.df = self._limpar_linhas(self._read_colunas_uteis())
+        # O pandas infere o dtype de texto pelo conteúdo (da planilha toda ou de cada lote);
+        # com object nas duas leituras o resultado não depende de lotes nem de filtros
+        for coluna in self.df.columns:
+            if isinstance(self.df[coluna].dtype, pd.StringDtype):
+                self.df[coluna] = self.df[coluna].astype(object)
         self.df = self.df.sort_values('Data/Hora')
 
         # 2. Tratamento do campo NOME_PESSOA
@@ -129,27 +286,346 @@ class ExcelParser:
         else:
             self.df['Tipo'] = 'Geral'
 
-        # 4. Agrupar os dados (Mantendo o NOME_PESSOA vivo)
-        self.df_grouped = self.df.groupby(['Latitude', 'Longitude', 'Tipo'], sort=False).agg({
-            'Data/Hora': list,
-            'Evento': list,
-            'Ignição': 'last',
-            'Observações': list,
-            'NOME_PESSOA': 'first' # PEGA O NOME PARA O MARCADOR
-        }).reset_index()
+        # 3.1 Juntar posições quase idênticas (opcional), antes do agrupamento exato
+        if self.snap_radius_m > 0:
+            self._snap_posicoes()
+
+        # 3.2 Paradas (opcional): cada parada vira um único ponto, com a duração em Parada_s
+        if self.stop_min_s > 0:
+            self._colapsar_paradas()
+
+        # 4. Agrupar os dados (Mantendo o NOME_PESSOA vivo). Os eventos de cada ponto
+        # ficam em colunas planas (df_eventos), ordenadas por grupo: o ponto usa as
+        # linhas ev_inicio:ev_fim, na mesma ordem cronológica das antigas listas por grupo
+        chaves = ['Latitude', 'Longitude', 'Tipo']
+        agrupado = self.df.groupby(chaves, sort=False)
+        grupo_id = agrupado.ngroup().to_numpy()
+        ordem = np.argsort(grupo_id, kind='stable')
+        self.df_eventos = self.df[list(self.COLUNAS_EVENTOS)].iloc[ordem].reset_index(drop=True)
+
+        agregacoes = dict(
+            Ignição=('Ignição', 'last'),
+            NOME_PESSOA=('NOME_PESSOA', 'first'),  # PEGA O NOME PARA O MARCADOR
+            Data_Inicial=('Data/Hora', 'min'),
+        )
+        if 'Parada_s' in self.df.columns:
+            agregacoes['Parada_s'] = ('Parada_s', 'max')
+        self.df_grouped = agrupado.agg(**agregacoes).reset_index()
+        contagem = np.bincount(grupo_id, minlength=len(self.df_grouped))
+        fins = np.cumsum(contagem)
+        self.df_grouped['ev_inicio'] = fins - contagem
+        self.df_grouped['ev_fim'] = fins
 
         # 5. Ordenação
-        self.df_grouped['Data_Inicial'] = self.df_grouped['Data/Hora'].apply(lambda x: min(x) if x else None)
         self.df_grouped = self.df_grouped.sort_values('Data_Inicial').reset_index(drop=True)
 
+        if not self.df.empty:
+            self.center_location = [self.df['Latitude'].mean(), self.df['Longitude'].mean()]
+
+        if self.cache is not None:
+            self.cache.save(self.excel_path, self.cache_key(), {
+                'df_grouped': self.df_grouped,
+                'df_eventos': self.df_eventos,
+                'center_location': self.center_location,
+                'datetime_fallback_rows': self.datetime_fallback_rows,
+                'filtered_out_rows': self.filtered_out_rows
+            })
+
         return self.df_grouped
 
+    def _snap_posicoes(self) -> None:
+        """
+        Move para uma mesma coordenada as leituras de um Tipo a até snap_radius_m
+        umas das outras (ruído do GPS parado), para que caiam num único ponto
+        agrupado com o histórico de eventos de todas elas. Pontos com nome
+        válido mantêm a coordenada original.
+        """
+        if len(self.df) < 2:
+            return
+        tempos = self.df['Data/Hora'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+        grupos = pd.factorize(self.df['Tipo'])[0]
+        lat, lon = snap_positions(self.df['Latitude'].to_numpy(dtype=float),
+                                  self.df['Longitude'].to_numpy(dtype=float),
+                                  tempos, grupos, self.snap_radius_m, self.snap_window_s,
+                                  fixos=valid_name_mask(self.df['NOME_PESSOA']).to_numpy())
+        self.df['Latitude'] = lat
+        self.df['Longitude'] = lon
+
+    def _colapsar_paradas(self) -> None:
+        """
+        Detecta as paradas de cada Tipo (velocidade entre leituras, ignição e
+        tempo parado) e move todas as leituras de uma parada para a posição
+        mediana dela; o agrupamento então gera um único ponto por parada, com o
+        histórico completo de eventos e a duração em Parada_s.
+        """
+        self.df['Parada_s'] = 0.0
+        if len(self.df) < 2:
+            return
+        tempos = self.df['Data/Hora'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+        grupos = pd.factorize(self.df['Tipo'])[0]
+        ignicao = self.df['Ignição'].map(str).str.strip().str.upper()
+        desligada = (ignicao.eq('D') | ignicao.str.contains('DESLIG|OFF')).to_numpy(dtype=bool)
+        parada_id, duracao = detect_stops(
+            self.df['Latitude'].to_numpy(dtype=float), self.df['Longitude'].to_numpy(dtype=float),
+            tempos, grupos, desligada, self.VEL_PARADA_KMH, self.RAIO_PARADA_M, self.stop_min_s,
+            fixos=valid_name_mask(self.df['NOME_PESSOA']).to_numpy())
+        em_parada = parada_id >= 0
+        if not em_parada.any():
+            return
+        ids = pd.Series(parada_id[em_parada])
+        for coluna in ('Latitude', 'Longitude'):
+            valores = pd.Series(self.df[coluna].to_numpy(dtype=float)[em_parada])
+            coluna_nova = self.df[coluna].to_numpy(dtype=float).copy()
+            coluna_nova[em_parada] = valores.groupby(ids).transform('median').to_numpy()
+            self.df[coluna] = coluna_nova
+        self.df['Parada_s'] = duracao
+
+    def _read_colunas_uteis(self) -> pd.DataFrame:
+        """Leitura direta carregando apenas as colunas usadas (caminho colunar)."""
+        return pd.read_excel(self.excel_path, usecols=lambda c: c in self.COLUNAS_UTEIS)
+
+    def _limpar_linhas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Converte Data/Hora e descarta linhas sem data ou coordenadas."""
+        df['Data/Hora'], lentas = self.parse_datas(df['Data/Hora'])
+        self.datetime_fallback_rows += lentas
+        return self._filtrar_linhas(df.dropna(subset=['Data/Hora', 'Latitude', 'Longitude']))
+
+    def _filtrar_linhas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Aplica os filtros de leitura (intervalo, região, Tipo, evento) a um lote
+        já limpo; no modo streaming cada lote é reduzido antes da concatenação.
+        """
+        if not self._descricao_filtros() or df.empty:
+            return df
+        manter = np.ones(len(df), dtype=bool)
+        if self.time_start is not None:
+            manter &= (df['Data/Hora'] >= self.time_start).to_numpy()
+        if self.time_end is not None:
+            manter &= (df['Data/Hora'] <= self.time_end).to_numpy()
+        if self.bbox or self.polygon:
+            lat = pd.to_numeric(df['Latitude'], errors='coerce').to_numpy(dtype=float)
+            lon = pd.to_numeric(df['Longitude'], errors='coerce').to_numpy(dtype=float)
+            if self.bbox:
+                lat_min, lon_min, lat_max, lon_max = self.bbox
+                manter &= (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+            if self.polygon:
+                manter &= points_in_polygon(lat, lon, self.polygon)
+        if self.tipos:
+            # Mesma unificação do passo 3 do parse: Tipo, senão Veículo, senão 'Geral'
+            coluna = 'Tipo' if 'Tipo' in df.columns else 'Veículo' if 'Veículo' in df.columns else None
+            tipos = df[coluna].astype(str).str.strip().str.lower() if coluna else pd.Series('geral', index=df.index)
+            manter &= tipos.isin(self.tipos).to_numpy()
+        if self.eventos:
+            manter &= df['Evento'].map(str).str.strip().str.lower().isin(self.eventos).to_numpy()
+        self.filtered_out_rows += int((~manter).sum())
+        return df[manter]
+
+    def _descricao_filtros(self) -> str:
+        """Representação estável dos filtros de leitura ('' quando não há filtro)."""
+        filtros = {
+            'inicio': self.time_start.isoformat() if self.time_start is not None else None,
+            'fim': self.time_end.isoformat() if self.time_end is not None else None,
+            'bbox': self.bbox, 'poligono': self.polygon,
+            'tipos': sorted(self.tipos) if self.tipos else None,
+            'eventos': sorted(self.eventos) if self.eventos else None,
+        }
+        filtros = {k: v for k, v in filtros.items() if v is not None}
+        return repr(sorted(filtros.items())) if filtros else ''
+
+    @staticmethod
+    def _converter_limite(valor) -> Optional[pd.Timestamp]:
+        """Limite do intervalo: datetime/Timestamp ou texto (dd/mm/aaaa [HH:MM[:SS]] ou ISO)."""
+        if valor is None or valor == '':
+            return None
+        if isinstance(valor, str):
+            iso = re.match(r'\d{4}-', valor.strip()) is not None
+            return pd.to_datetime(valor.strip(), dayfirst=not iso)
+        return pd.Timestamp(valor)
+
+    @classmethod
+    def parse_datas(cls, serie: pd.Series) -> Tuple[pd.Series, int]:
+        """
+        Converte a coluna Data/Hora para datetime sem inferência por elemento.
+
+        - células já lidas como data passam direto;
+        - números são datas seriais do Excel, convertidas por aritmética;
+        - textos usam o formato detectado numa amostra, em uma única chamada vetorizada.
+        Só os textos fora do formato detectado caem na interpretação genérica, célula
+        a célula (dayfirst, exceto ISO aaaa-mm-dd); a quantidade dessas linhas é
+        retornada junto com a série.
+        Datas com fuso (ex.: '2024-01-01 10:00:00+00:00') são levadas para UTC sem fuso.
+        """
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return cls._sem_fuso(serie), 0
+
+        resultado = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+        if serie.empty:
+            return resultado, 0
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            return cls._serial_excel(serie).astype(cls.DTYPE_DATA), 0
+
+        # Coluna homogênea (caso comum) evita classificar célula por célula
+        conteudo = pd.api.types.infer_dtype(serie, skipna=True)
+        if conteudo == 'string':
+            eh_texto = serie.notna().to_numpy(dtype=bool)
+            eh_data = eh_numero = np.zeros(len(serie), dtype=bool)
+        elif conteudo in ('datetime', 'datetime64', 'date'):
+            return cls._para_datas(serie).astype(cls.DTYPE_DATA), 0
+        else:
+            eh_data = serie.map(lambda v: isinstance(v, datetime)).to_numpy(dtype=bool)
+            eh_numero = serie.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool)
+                                  and v == v).to_numpy(dtype=bool)
+            eh_texto = serie.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+
+        if eh_data.any():
+            resultado[eh_data] = cls._para_datas(serie[eh_data]).to_numpy()
+        if eh_numero.any():
+            resultado[eh_numero] = cls._serial_excel(serie[eh_numero]).to_numpy()
+
+        lentas = 0
+        if eh_texto.any():
+            textos = serie[eh_texto].str.strip()
+            textos = textos[textos != '']
+            formato = cls._detectar_formato(textos)
+            if formato:
+                convertidas = pd.to_datetime(textos, format=formato, errors='coerce')
+            else:
+                convertidas = pd.Series(pd.NaT, index=textos.index, dtype='datetime64[ns]')
+            falhas = convertidas.isna().to_numpy()
+            if falhas.any():
+                lentas = int(falhas.sum())
+                convertidas = convertidas.astype('datetime64[ns]')
+                convertidas[falhas] = cls._datas_genericas(textos[falhas]).to_numpy()
+            resultado.loc[textos.index] = convertidas.to_numpy()
+
+        return resultado.astype(cls.DTYPE_DATA), lentas
+
+    @classmethod
+    def _datas_genericas(cls, textos: pd.Series) -> pd.Series:
+        """
+        Textos em formatos variados, interpretados um a um. O pandas aplica dayfirst
+        também a '2024-01-02' (virando 1º de fevereiro), então os ISO vão à parte.
+        """
+        iso = textos.str.match(r'\d{4}-').to_numpy(dtype=bool)
+        datas = pd.Series(pd.NaT, index=textos.index, dtype=cls.DTYPE_DATA)
+        if iso.any():
+            datas[iso] = cls._para_datas(textos[iso], format='mixed').to_numpy()
+        if not iso.all():
+            datas[~iso] = cls._para_datas(textos[~iso], format='mixed', dayfirst=True).to_numpy()
+        return datas
+
+    @classmethod
+    def _para_datas(cls, valores: pd.Series, **opcoes) -> pd.Series:
+        """pd.to_datetime com errors='coerce'; valores com fuso (mesmo misturados a outros) viram UTC sem fuso."""
+        return cls._sem_fuso(pd.to_datetime(valores, errors='coerce', utc=True, **opcoes))
+
+    @staticmethod
+    def _sem_fuso(datas: pd.Series) -> pd.Series:
+        """Série datetime com fuso -> mesmo instante em UTC, sem fuso (as demais passam direto)."""
+        if isinstance(datas.dtype, pd.DatetimeTZDtype):
+            return datas.dt.tz_convert(None)
+        return datas
+
+    @classmethod
+    def _serial_excel(cls, numeros: pd.Series) -> pd.Series:
+        """Data serial do Excel (dias, fração = horário) -> datetime; fora de 1900..2200 vira NaT."""
+        dias = pd.to_numeric(numeros, errors='coerce').astype(float)
+        dias = dias.where((dias > 0) & (dias < 110000))
+        return (cls.ORIGEM_SERIAL_EXCEL + pd.to_timedelta(dias, unit='D').dt.round('s')).astype('datetime64[ns]')
+
+    @classmethod
+    def _detectar_formato(cls, textos: pd.Series) -> Optional[str]:
+        """Formato de FORMATOS_DATA que converte a maior parte da amostra (None se nenhum)."""
+        amostra = textos.head(cls.AMOSTRA_DATAS)
+        if amostra.empty:
+            return None
+        melhor, acertos_melhor = None, 0
+        for formato in cls.FORMATOS_DATA:
+            acertos = int(pd.to_datetime(amostra, format=formato, errors='coerce').notna().sum())
+            if acertos > acertos_melhor:
+                melhor, acertos_melhor = formato, acertos
+                if acertos == len(amostra):
+                    break
+        return melhor
+
+    def _suporta_streaming(self) -> bool:
+        # O openpyxl só lê .xlsx/.xlsm; .xls antigo cai na leitura direta
+        return self.excel_path.lower().endswith(('.xlsx', '.xlsm'))
+
+    def _iter_chunks(self):
+        """
+        Lê a primeira planilha em lotes de `chunk_size` linhas, mantendo só as
+        colunas úteis. Cada lote passa pelo mesmo TextParser usado pelo
+        pd.read_excel, então tipos e valores nulos saem iguais aos da leitura direta.
+        """
+        from openpyxl import load_workbook
+        from pandas.io.parsers import TextParser
+
+        wb = load_workbook(self.excel_path, read_only=True, data_only=True)
+        try:
+            linhas = wb.worksheets[0].iter_rows(values_only=True)
+            cabecalho = next(linhas, None)
+            if cabecalho is None:
+                return
+            posicoes = [i for i, c in enumerate(cabecalho) if c in self.COLUNAS_UTEIS]
+            nomes = [cabecalho[i] for i in posicoes]
+
+            inicio = 0
+            lote = []
+            for linha in linhas:
+                lote.append([self._converter_celula(linha[i]) if i < len(linha) else ""
+                             for i in posicoes])
+                if len(lote) >= self.chunk_size:
+                    yield self._montar_lote(TextParser, nomes, lote, inicio)
+                    inicio += len(lote)
+                    lote = []
+            if lote or inicio == 0:
+                yield self._montar_lote(TextParser, nomes, lote, inicio)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _montar_lote(text_parser, nomes: List, lote: List[List], inicio: int) -> pd.DataFrame:
+        df = text_parser([list(nomes)] + lote, header=0, skip_blank_lines=False).read()
+        df.index = pd.RangeIndex(inicio, inicio + len(df))
+        return df
+
+    @staticmethod
+    def _converter_celula(valor):
+        """Mesma conversão de célula feita pelo leitor openpyxl do pandas."""
+        if valor is None:
+            return ""
+        if isinstance(valor, float) and valor.is_integer():
+            return int(valor)
+        return valor
+
     def get_unique_events(self) -> List[str]:
         """Retorna lista de eventos únicos encontrados."""
-        eventos = set()
-        for sublist in self.df_grouped['Evento']:
-            eventos.update(sublist)
-        return sorted([str(e) for e in eventos if e])
+        eventos = set(self.df_eventos['Evento'].tolist())
+        return sorted({str(e) for e in eventos if e})
+
+    def get_event_points(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (linhas de df_grouped na ordem de ev_inicio, linha de df_grouped de cada
+        linha de df_eventos).
+        """
+        contagem = (self.df_grouped['ev_fim'] - self.df_grouped['ev_inicio']).to_numpy()
+        ordem = np.argsort(self.df_grouped['ev_inicio'].to_numpy(), kind='stable')
+        return ordem, np.repeat(ordem, contagem[ordem])
+
+    def get_readings(self) -> pd.DataFrame:
+        """
+        Uma linha por leitura da planilha (Latitude, Longitude, Tipo, Data/Hora), na
+        ordem de df_eventos, reconstruída de df_grouped; 'ponto' é a linha de df_grouped.
+        """
+        _, ponto = self.get_event_points()
+        return pd.DataFrame({
+            'Latitude': self.df_grouped['Latitude'].to_numpy()[ponto],
+            'Longitude': self.df_grouped['Longitude'].to_numpy()[ponto],
+            'Tipo': self.df_grouped['Tipo'].to_numpy()[ponto],
+            'Data/Hora': self.df_eventos['Data/Hora'].to_numpy(),
+            'ponto': ponto,
+        })
 
     def get_unique_types(self) -> List[str]:
         """Retorna lista de Tipos/Veículos únicos."""
@@ -157,5 +633,4 @@ class ExcelParser:
 
     def get_center_location(self) -> List[float]:
         """Retorna a média das coordenadas para centralizar o mapa."""
-        if self.df.empty: return [0.0, 0.0]
-        return [self.df['Latitude'].mean(), self.df['Longitude'].mean()]
\ No newline at end of file
+        return self.center_location
\ No newline at end of file
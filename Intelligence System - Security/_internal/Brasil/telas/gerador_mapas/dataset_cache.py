@@ -0,0 +1,190 @@
+"""
+Cache em disco do resultado do ExcelParser, indexado pelo conteúdo do arquivo.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from typing import Optional, Dict
+
+
+class DatasetCache:
+    """
+    Guarda o DataFrame agrupado (e metadados) de cada planilha já processada.
+
+    A chave é o hash SHA-256 do conteúdo do Excel combinado com a chave do
+    parser (versão + opções), então renomear o arquivo não invalida o cache e
+    qualquer alteração no conteúdo ou na lógica de parsing gera uma nova entrada.
+
+    Cada entrada é um .npz colunar (o pyarrow não faz parte da distribuição, então
+    não há Parquet): colunas numéricas e de data como arrays do numpy, colunas de
+    texto como JSON. A leitura usa allow_pickle=False, então um arquivo adulterado
+    na pasta do cache não executa código; entradas inválidas são descartadas.
+    """
+
+    MAX_ENTRADAS = 20
+    EXTENSAO = '.npz'
+    # Entradas do formato anterior (pickle), nunca lidas: removidas na limpeza
+    EXTENSOES_ANTIGAS = ('.pkl',)
+    FORMATO = 1
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        if cache_dir is None:
+            base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+            cache_dir = os.path.join(base, 'gerador_mapas', 'cache')
+        self.cache_dir = cache_dir
+        self._hashes = {}
+
+    def file_hash(self, caminho: str, bloco: int = 1024 * 1024) -> str:
+        """Calcula o SHA-256 do arquivo lendo em blocos (memorizado por tamanho/mtime)."""
+        st = os.stat(caminho)
+        assinatura = (os.path.abspath(caminho), st.st_size, st.st_mtime_ns)
+        if assinatura in self._hashes:
+            return self._hashes[assinatura]
+
+        h = hashlib.sha256()
+        with open(caminho, 'rb') as f:
+            for parte in iter(lambda: f.read(bloco), b''):
+                h.update(parte)
+        self._hashes[assinatura] = h.hexdigest()
+        return self._hashes[assinatura]
+
+    def _entry_path(self, caminho: str, chave_parser: str) -> str:
+        chave = hashlib.sha256(f"{self.file_hash(caminho)}|{chave_parser}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, chave + self.EXTENSAO)
+
+    def load(self, caminho: str, chave_parser: str) -> Optional[Dict]:
+        """Retorna o conteúdo salvo para o arquivo ou None se não houver entrada válida."""
+        entrada = self._entry_path(caminho, chave_parser)
+        if not os.path.exists(entrada):
+            return None
+        try:
+            dados = self._ler(entrada)
+            os.utime(entrada)  # Marca como usado recentemente
+            return dados
+        except Exception:
+            # Entrada corrompida, adulterada ou de outro formato: descarta
+            try:
+                os.remove(entrada)
+            except OSError:
+                pass
+            return None
+
+    def save(self, caminho: str, chave_parser: str, dados: Dict) -> None:
+        """
+        Grava a entrada de forma atômica e remove as entradas mais antigas.
+        Valores sem representação no formato (ver _coluna_texto) não são gravados.
+        """
+        try:
+            arrays = self._serializar(dados)
+        except (TypeError, ValueError):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entrada = self._entry_path(caminho, chave_parser)
+        temporario = entrada + '.tmp'
+        with open(temporario, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporario, entrada)
+        self._prune()
+
+    @classmethod
+    def _serializar(cls, dados: Dict) -> Dict[str, np.ndarray]:
+        """
+        Arrays do .npz: 'meta' (JSON com os valores simples e a descrição de cada
+        DataFrame) e uma array por coluna.
+        """
+        arrays = {}
+        meta = {'formato': cls.FORMATO, 'valores': {}, 'tabelas': {}}
+        for nome, valor in dados.items():
+            if not isinstance(valor, pd.DataFrame):
+                meta['valores'][nome] = valor
+                continue
+            if not valor.index.equals(pd.RangeIndex(len(valor))):
+                raise ValueError(f"{nome}: índice diferente de 0..n-1")
+            colunas = []
+            for coluna in valor.columns:
+                chave = f"c{len(arrays)}"
+                serie = valor[coluna]
+                texto = not (pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_dtype(serie))
+                arrays[chave] = cls._coluna_texto(serie) if texto else serie.to_numpy()
+                colunas.append({'nome': coluna, 'chave': chave, 'texto': texto, 'dtype': str(serie.dtype)})
+            meta['tabelas'][nome] = {'linhas': len(valor), 'colunas': colunas}
+        arrays['meta'] = cls._json_bytes(meta)
+        return arrays
+
+    @staticmethod
+    def _json_bytes(valor) -> np.ndarray:
+        def converter(v):
+            if isinstance(v, np.generic):
+                return v.item()
+            if isinstance(v, datetime):
+                return {'$data': v.isoformat()}
+            raise TypeError(f"valor sem representação no cache: {type(v).__name__}")
+        texto = json.dumps(valor, default=converter, ensure_ascii=False)
+        return np.frombuffer(texto.encode('utf-8'), dtype=np.uint8)
+
+    @classmethod
+    def _coluna_texto(cls, serie: pd.Series) -> np.ndarray:
+        """
+        Coluna de texto (ou mista) em JSON: textos, números, datas e nulos (None
+        e NaN continuam distintos; pd.NA e NaT viram None); qualquer outro tipo
+        de valor levanta TypeError.
+        """
+        return cls._json_bytes([None if v is pd.NA or v is pd.NaT else v for v in serie.astype(object).tolist()])
+
+    @staticmethod
+    def _ler_json(array: np.ndarray):
+        def converter(d):
+            return datetime.fromisoformat(d['$data']) if set(d) == {'$data'} else d
+        return json.loads(array.tobytes().decode('utf-8'), object_hook=converter)
+
+    @classmethod
+    def _ler(cls, entrada: str) -> Dict:
+        """Lê uma entrada gravada por save (sem pickle); levanta exceção se o conteúdo for inválido."""
+        with np.load(entrada, allow_pickle=False) as arquivo:
+            meta = cls._ler_json(arquivo['meta'])
+            if meta.get('formato') != cls.FORMATO:
+                raise ValueError("formato de cache desconhecido")
+            dados = dict(meta['valores'])
+            for nome, tabela in meta['tabelas'].items():
+                colunas = {}
+                for coluna in tabela['colunas']:
+                    if coluna['texto']:
+                        serie = pd.Series(cls._ler_json(arquivo[coluna['chave']]), dtype=object)
+                        if coluna['dtype'] != 'object':
+                            serie = serie.astype(coluna['dtype'])
+                    else:
+                        serie = pd.Series(arquivo[coluna['chave']])
+                    if len(serie) != tabela['linhas']:
+                        raise ValueError(f"{nome}: coluna {coluna['nome']!r} com tamanho inválido")
+                    colunas[coluna['nome']] = serie
+                dados[nome] = pd.DataFrame(colunas, index=pd.RangeIndex(tabela['linhas']))
+        return dados
+
+    def _prune(self) -> None:
+        for n in os.listdir(self.cache_dir):
+            if n.endswith(self.EXTENSOES_ANTIGAS):
+                try:
+                    os.remove(os.path.join(self.cache_dir, n))
+                except OSError:
+                    pass
+        entradas = [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir)
+                    if n.endswith(self.EXTENSAO)]
+        if len(entradas) <= self.MAX_ENTRADAS:
+            return
+        entradas.sort(key=os.path.getmtime, reverse=True)
+        for antiga in entradas[self.MAX_ENTRADAS:]:
+            try:
+                os.remove(antiga)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Remove todas as entradas do cache."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for n in os.listdir(self.cache_dir):
+            if n.endswith(self.EXTENSAO):
+                os.remove(os.path.join(self.cache_dir, n))
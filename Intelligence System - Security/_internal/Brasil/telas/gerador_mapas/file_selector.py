@@ -16,6 +16,19 @@ class FileSelector:
         root.destroy()
         return file_path if file_path else None
 
+    @staticmethod
+    def select_kmz() -> Optional[str]:
+        """Abre janela para escolher o KML/KMZ com os checkpoints dos clientes."""
+        root = tk.Tk()
+        root.withdraw()
+        root.attributes("-topmost", True)
+        file_path = filedialog.askopenfilename(
+            title="Selecione o arquivo KMZ/KML dos checkpoints",
+            filetypes=[("Arquivos KMZ/KML", "*.kmz *.kml")]
+        )
+        root.destroy()
+        return file_path if file_path else None
+
     @staticmethod
     def save_file_dest(sugestao_nome: str) -> Optional[str]:
         """Abre janela para o usuário escolher onde salvar o arquivo final."""
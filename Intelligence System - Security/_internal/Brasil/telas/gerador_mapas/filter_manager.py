@@ -39,6 +39,17 @@ class FilterManager:
             for ev in sorted(eventos_unicos):
                 eventos_options += f'<option value="{html_escape(str(ev).lower())}">{html_escape(str(ev))}</option>'
 
+        # Seletor de cliente dos checkpoints KMZ (apenas quando há KMZ carregado)
+        kmz_html = ""
+        if kmz_cliente_opts:
+            kmz_html = f'''<div style="margin-bottom: 12px; background: #fff8e6; padding: 8px; border-radius: 4px; border: 1px solid #ffe0a3;">
+                    <b>Cliente (Checkpoints KMZ)</b><br>
+                    <select id="kmzClienteFiltro" onchange="window.filterKmzCliente(this.value)" style="width: 100%; padding: 3px; margin-top:5px;">
+                        <option value="">-- Todos --</option>
+                        {kmz_cliente_opts}
+                    </select>
+                </div>'''
+
         return f'''
         <style>
             /* CSS para ocultação completa */
@@ -179,6 +190,7 @@ class FilterManager:
                     </div>
                 </div>
 
+                {kmz_html}
                 <div style="margin-bottom: 12px; background: #f0f8ff; padding: 8px; border-radius: 4px; border: 1px solid #d1e7ff;">
                     <b>Labels dos Marcadores</b><br>
                     <div style="display: flex; flex-direction: column; gap: 5px; margin-top: 5px;">
@@ -218,6 +230,13 @@ class FilterManager:
         </div>
         '''
 
+    @staticmethod
+    def build_kmz_cliente_opts(clientes: Dict[str, str]) -> str:
+        """<option>s do seletor de cliente: valor = chave normalizada (data-clientkey), texto = nome."""
+        ordenados = sorted(clientes.items(), key=lambda item: item[1].lower())
+        return "".join(f'<option value="{html_escape(chave)}">{html_escape(nome)}</option>'
+                       for chave, nome in ordenados)
+
     def build_filter_js(self, map_name: str, marker_coords: List[List[float]], total_markers: int) -> str:
         return f'''
         <script>
@@ -235,9 +254,11 @@ class FilterManager:
             lineWeight: 2
         }};
 
-        // Controlador de reaplicação de filtros
-        window.filterReapplied = false;
-        window.layerChangeInProgress = false;
+        // Controlador de reaplicação de filtros (eventos do Leaflet agrupados por debounce)
+        window.reapplyTimer = null;
+        window.reapplyPendentes = {{}};
+        // Custo por tipo de evento: {{ eventos, execucoes, totalMs, maxMs, ultimoMs }}
+        window.filterStats = {{}};
 
         // Variável para o marcador de busca
         window.searchMarker = null;
@@ -351,23 +372,21 @@ class FilterManager:
             document.getElementById('coordStatus').innerHTML = '';
         }};
 
-        // Função FORÇADA para reaplicar filtros imediatamente
-        window.forceReapplyFilters = function() {{
-            if (window.layerChangeInProgress) return;
+        // Reaplica os filtros uma única vez depois de uma rajada de eventos do mapa.
+        // Os marcadores de pontos se atualizam sozinhos no evento 'add' (ver
+        // registrarIndiceFiltro), então aqui só entram os ajustes globais.
+        window.forceReapplyFilters = function(motivo) {{
+            motivo = motivo || 'manual';
+            window.reapplyPendentes[motivo] = (window.reapplyPendentes[motivo] || 0) + 1;
+            clearTimeout(window.reapplyTimer);
 
-            window.layerChangeInProgress = true;
-
-            // Salvar estado atual
-            window.saveFilterState();
+            window.reapplyTimer = setTimeout(function() {{
+                var pendentes = window.reapplyPendentes;
+                window.reapplyPendentes = {{}};
+                var t0 = performance.now();
 
-            // Reaplicar IMEDIATAMENTE
-            setTimeout(function() {{
                 window.restoreFilterState();
-
-                // Reaplicar todas as configurações
-                window.refreshAllColors();
                 window.filterMarkers();
-                window.toggleLabelType(window.currentFilters.labelType);
                 window.toggleTrajeto();
 
                 // Atualizar peso da linha
@@ -376,67 +395,75 @@ class FilterManager:
                     window.updateLineWeight(lineWeight.value);
                 }}
 
-                window.layerChangeInProgress = false;
-            }}, 10);
+                var custo = performance.now() - t0;
+                Object.keys(pendentes).forEach(function(m) {{
+                    var st = window.filterStats[m] = window.filterStats[m] || {{ eventos: 0, execucoes: 0, totalMs: 0, maxMs: 0, ultimoMs: 0 }};
+                    st.eventos += pendentes[m];
+                    st.execucoes += 1;
+                    st.totalMs += custo;
+                    st.ultimoMs = custo;
+                    if (custo > st.maxMs) st.maxMs = custo;
+                }});
+            }}, 100);
         }};
 
-        // Função para observar mudanças no mapa e reaplicar filtros IMEDIATAMENTE
+        // Liga a reaplicação aos eventos do Leaflet (camadas ligadas no controle,
+        // grupos/trajetos adicionados e fim de zoom)
         window.setupMapLayerObserver = function() {{
-            // Observar mudanças no controle de camadas
-            var layerControl = document.querySelector('.leaflet-control-layers');
-            if (layerControl) {{
-                var observer = new MutationObserver(function(mutations) {{
-                    if (!window.layerChangeInProgress) {{
-                        window.forceReapplyFilters();
-                    }}
-                }});
-
-                observer.observe(layerControl, {{ 
-                    attributes: true, 
-                    childList: true, 
-                    subtree: true 
-                }});
-            }}
+            var mapa = window.{map_name};
+            if (!mapa) return;
 
-            // Observar o container do mapa para qualquer reconstrução
-            var mapContainer = document.querySelector('.leaflet-container');
-            if (mapContainer) {{
-                var mapObserver = new MutationObserver(function(mutations) {{
-                    mutations.forEach(function(mutation) {{
-                        if (mutation.type === 'childList' && !window.filterReapplied) {{
-                            window.forceReapplyFilters();
-                        }}
-                    }});
-                }});
+            mapa.on('overlayadd', function() {{ window.forceReapplyFilters('overlayadd'); }});
+            mapa.on('zoomend', function() {{
+                window.atualizarNivelTrajeto();
+                window.forceReapplyFilters('zoomend');
+            }});
+            mapa.on('layeradd', function(e) {{
+                // Pontos individuais são tratados pelo próprio índice
+                var layer = e.layer;
+                if (layer && layer.options && (layer.options.isTrajeto || layer.eachLayer)) {{
+                    window.forceReapplyFilters('layeradd');
+                }}
+            }});
+        }};
 
-                mapObserver.observe(mapContainer, {{ 
-                    childList: true, 
-                    subtree: true 
+        // Níveis de detalhe do trajeto (options.lodMinZoom/lodMaxZoom): só o nível do
+        // zoom atual fica no grupo; ao trocar, o novo nível herda o estilo do anterior
+        window.trajetoLOD = [];
+
+        window.setupTrajetoLOD = function() {{
+            var mapa = window.{map_name};
+            if (!mapa) return;
+            mapa.eachLayer(function(grupo) {{
+                if (!grupo.eachLayer) return;
+                grupo.eachLayer(function(layer) {{
+                    if (layer.options && layer.options.isTrajeto && layer.options.lodMinZoom !== undefined) {{
+                        window.trajetoLOD.push({{ layer: layer, grupo: grupo }});
+                    }}
                 }});
-            }}
-
-            // Observar especificamente o painel de marcadores
-            var checkMarkerPane = setInterval(function() {{
-                var markerPane = document.querySelector('.leaflet-marker-pane');
-                if (markerPane) {{
-                    clearInterval(checkMarkerPane);
-
-                    var markerObserver = new MutationObserver(function(mutations) {{
-                        mutations.forEach(function(mutation) {{
-                            if (mutation.addedNodes.length > 0 || mutation.removedNodes.length > 0) {{
-                                if (!window.filterReapplied) {{
-                                    window.forceReapplyFilters();
-                                }}
-                            }}
-                        }});
-                    }});
+            }});
+            window.atualizarNivelTrajeto();
+        }};
 
-                    markerObserver.observe(markerPane, {{ 
-                        childList: true, 
-                        subtree: true 
-                    }});
+        window.atualizarNivelTrajeto = function() {{
+            var mapa = window.{map_name};
+            if (!mapa || !window.trajetoLOD.length) return;
+            var zoom = mapa.getZoom();
+            var ativos = {{}};
+            window.trajetoLOD.forEach(function(n) {{
+                if (n.grupo.hasLayer(n.layer)) ativos[n.layer.options.vehicleType] = n.layer;
+            }});
+            window.trajetoLOD.forEach(function(n) {{
+                var o = n.layer.options;
+                var noZoom = (zoom >= o.lodMinZoom && zoom <= o.lodMaxZoom);
+                var atual = ativos[o.vehicleType];
+                if (noZoom && !n.grupo.hasLayer(n.layer)) {{
+                    if (atual) n.layer.setStyle({{ color: atual.options.color, weight: atual.options.weight, opacity: atual.options.opacity }});
+                    n.grupo.addLayer(n.layer);
+                }} else if (!noZoom && n.grupo.hasLayer(n.layer)) {{
+                    n.grupo.removeLayer(n.layer);
                 }}
-            }}, 300);
+            }});
         }};
 
         // Função para salvar estado atual dos filtros
@@ -510,25 +537,171 @@ class FilterManager:
             }}
         }};
 
+        // Índice de filtro: um segmento por Tipo com arrays tipados (sequência, código
+        // de ignição, bitset de eventos) e o estado atual de cada ponto
+        // (0 = oculto, 1 = visível, 2 = destaque). Preenchido por MarkerFilterIndex.
+        window.markerIndex = window.markerIndex || {{ segmentos: [], porTipo: {{}} }};
+
+        window.registrarIndiceFiltro = function(tipo, dados, grupo) {{
+            var n = dados.ign.length;
+            var palavras = Math.max(1, Math.ceil(dados.eventos.length / 32));
+            var seg = {{
+                tipo: tipo, n: n, grupo: grupo,
+                seq: new Int32Array(n),
+                ignicao: Uint16Array.from(dados.ign), ignicoes: dados.ignicoes,
+                eventos: dados.eventos, palavras: palavras, bits: new Uint32Array(n * palavras),
+                estado: new Uint8Array(n).fill(1),
+                cores: dados.cores.slice(),
+                camadas: new Array(n),
+                pontos: (window.dataPointsByTipo || {{}})[tipo] || null
+            }};
+            for (var i = 0; i < n; i++) {{
+                seg.seq[i] = i + 1;
+                for (var k = dados.evInicio[i]; k < dados.evInicio[i + 1]; k++) {{
+                    var id = dados.evIds[k];
+                    seg.bits[i * palavras + (id >>> 5)] |= (1 << (id & 31));
+                }}
+            }}
+
+            // Marcadores DivIcon (inclusive dentro de MarkerCluster): o elemento é recriado
+            // a cada vez que entra no mapa, então o estado é reaplicado no evento 'add'.
+            // Marcadores já indexados são de um lote anterior do mesmo Tipo
+            var percorrer = function(camada) {{
+                camada.eachLayer(function(layer) {{
+                    if (layer.options && layer.options.pointIdx) {{
+                        if (layer._segmentoFiltro) return;
+                        layer._segmentoFiltro = seg;
+                        var pos = layer.options.pointIdx - 1;
+                        seg.camadas[pos] = layer;
+                        layer.on('add', function() {{
+                            window.aplicarEstadoMarcador(seg, pos);
+                            var el = window.elementoMarcador(seg, pos);
+                            if (el) window.aplicarRotulo(el, window.currentFilters.labelType);
+                        }});
+                    }} else if (layer.eachLayer) {{
+                        percorrer(layer);
+                    }}
+                }});
+            }};
+            if (!seg.pontos) percorrer(grupo);
+
+            window.markerIndex.segmentos.push(seg);
+            (window.markerIndex.porTipo[tipo] = window.markerIndex.porTipo[tipo] || []).push(seg);
+        }};
+
+        window.elementoMarcador = function(seg, i) {{
+            var layer = seg.camadas[i];
+            var container = (layer && layer.getElement) ? layer.getElement() : null;
+            return container ? container.querySelector('.marker-circle') : null;
+        }};
+
+        // Aplica seg.estado[i] ao ponto i (camada canvas ou elemento do DivIcon)
+        window.aplicarEstadoMarcador = function(seg, i) {{
+            var estado = seg.estado[i];
+
+            if (seg.pontos) {{
+                var ponto = seg.pontos[i];
+                if (estado === 0) {{
+                    if (ponto.visivel) {{
+                        ponto.grupo.removeLayer(ponto.layer);
+                        ponto.visivel = false;
+                    }}
+                    return;
+                }}
+                if (!ponto.visivel) {{
+                    ponto.grupo.addLayer(ponto.layer);
+                    ponto.visivel = true;
+                }}
+                ponto.destaque = (estado === 2);
+                ponto.layer.setStyle(ponto.destaque
+                    ? {{ fillColor: 'yellow', color: 'black' }}
+                    : {{ fillColor: ponto.color, color: 'white' }});
+                if (ponto.destaque) ponto.layer.bringToFront();
+                return;
+            }}
+
+            var el = window.elementoMarcador(seg, i);
+            if (!el) return;  // Fora do mapa: aplicado quando a camada for adicionada
+            var container = el.closest('.leaflet-marker-icon');
+            el.setAttribute('data-originalcolor', seg.cores[i]);
+
+            if (estado !== 0) {{
+                // REMOVE TODAS AS CLASSES DE OCULTAÇÃO
+                if (container) {{
+                    container.classList.remove('marker-hidden', 'marker-faded');
+                    container.style.display = 'block';
+                    container.style.opacity = '1';
+                    container.style.visibility = 'visible';
+                }}
+                el.style.display = 'flex';
+
+                // DESTAQUE AMARELO CORRIGIDO - apenas background amarelo
+                if (estado === 2) {{
+                    el.style.backgroundColor = 'yellow';
+                    el.style.color = 'black';
+                    el.style.fontWeight = 'bold';
+                    if (container) {{
+                        container.classList.add('marker-yellow');
+                        container.style.zIndex = "1000";
+                    }}
+                }} else {{
+                    el.style.backgroundColor = seg.cores[i];
+                    el.style.color = 'white';
+                    el.style.fontWeight = 'normal';
+                    if (container) {{
+                        container.classList.remove('marker-yellow');
+                        container.style.zIndex = "1";
+                    }}
+                }}
+            }} else {{
+                // OCULTAÇÃO COMPLETA
+                if (container) {{
+                    container.classList.add('marker-hidden');
+                    container.style.display = 'none';
+                    container.style.visibility = 'hidden';
+                    container.style.opacity = '0';
+                }}
+                el.style.display = 'none';
+            }}
+        }};
+
         window.updateTypeColor = function(tipo, novaCor) {{
             window.saveFilterState();
             var useDegrade = document.getElementById('useDegrade').checked;
-            var pontosDoTipo = document.querySelectorAll('.marker-circle[data-veiculo="' + tipo.toLowerCase() + '"]');
-            pontosDoTipo.forEach(function(el, i) {{
-                var corFinal = novaCor;
-                if (useDegrade) {{
-                    var factor = (pontosDoTipo.length <= 1) ? 1.0 : 0.3 + (0.7 * (i / (pontosDoTipo.length - 1)));
-                    corFinal = window.adjustBrightness(novaCor, factor);
+            (window.markerIndex.porTipo[tipo.toLowerCase()] || []).forEach(function(seg) {{
+                for (var i = 0; i < seg.n; i++) {{
+                    var corFinal = novaCor;
+                    if (useDegrade) {{
+                        var factor = (seg.n <= 1) ? 1.0 : 0.3 + (0.7 * (i / (seg.n - 1)));
+                        corFinal = window.adjustBrightness(novaCor, factor);
+                    }}
+                    seg.cores[i] = corFinal;
+                    if (seg.pontos) {{
+                        // Pontos da camada de dados (modo canvas)
+                        var ponto = seg.pontos[i];
+                        ponto.color = corFinal;
+                        if (!ponto.destaque) ponto.layer.setStyle({{ fillColor: corFinal }});
+                        continue;
+                    }}
+                    var el = window.elementoMarcador(seg, i);
+                    if (el) {{
+                        el.setAttribute('data-originalcolor', corFinal);
+                        // Só atualiza a cor se não estiver em destaque amarelo
+                        if (seg.estado[i] !== 2) el.style.backgroundColor = corFinal;
+                    }}
                 }}
-                el.setAttribute('data-originalcolor', corFinal);
-                // Só atualiza a cor se não estiver em destaque amarelo
-                if (el.style.backgroundColor !== 'yellow') el.style.backgroundColor = corFinal;
             }});
+            window.clusterColors = window.clusterColors || {{}};
+            window.clusterColors[tipo.toLowerCase()] = novaCor;
             if(window.{map_name}) {{
                 window.{map_name}.eachLayer(function(layer) {{
                     if (layer.options && layer.options.isTrajeto && layer.options.vehicleType === tipo.toLowerCase()) {{
                         layer.setStyle({{ color: novaCor }});
                     }}
+                    // Agrupamentos (MarkerCluster) do Tipo redesenham o ícone com a nova cor
+                    if (layer.refreshClusters && layer.options && layer.options.vehicleType === tipo.toLowerCase()) {{
+                        layer.refreshClusters();
+                    }}
                 }});
             }}
             window.filterMarkers();
@@ -586,63 +759,48 @@ class FilterManager:
 
             var filtrosAtivos = (evSel !== '' || veSel !== '' || igSel !== '');
 
-            document.querySelectorAll('.marker-circle').forEach(function(el) {{
-                var idx = parseInt(el.getAttribute('data-idx'));
-                var eventosStr = el.getAttribute('data-eventos') || '';
-                var mEv = !evSel || eventosStr.toLowerCase().includes(evSel);
-                var mVe = !veSel || el.getAttribute('data-veiculo').toLowerCase() === veSel;
-
-                // CORREÇÃO DO FILTRO DE IGNIÇÃO
-                var ignicaoAttr = el.getAttribute('data-ignicao') || '';
-                var ignicaoNormalizada = window.normalizeIgnicao(ignicaoAttr);
-                var mIg = !igSel || ignicaoNormalizada === igSel;
-
-                var inRange = (idx >= start && idx <= end);
-                var isMatch = mEv && mVe && mIg;
-
-                // VISIBILIDADE: Se hide tá on, precisa de range E match. Se hide tá off, só range.
-                var shouldBeVisible = hide ? (inRange && isMatch) : inRange;
-
-                var container = el.closest('.leaflet-marker-icon');
+            // Novo estado de cada ponto a partir do índice; só os pontos cujo
+            // estado mudou têm o elemento/camada alterado
+            var visiveisPorTipo = {{}};
+            window.markerIndex.segmentos.forEach(function(seg) {{
+                var mVe = !veSel || seg.tipo === veSel;
+
+                // Eventos do Tipo que casam com o filtro, como máscara de bits
+                var mascara = null;
+                if (evSel) {{
+                    mascara = new Uint32Array(seg.palavras);
+                    seg.eventos.forEach(function(nome, id) {{
+                        if (nome.includes(evSel)) mascara[id >>> 5] |= (1 << (id & 31));
+                    }});
+                }}
+                // CORREÇÃO DO FILTRO DE IGNIÇÃO (resolvida uma vez por valor distinto)
+                var ignOk = seg.ignicoes.map(function(valor) {{
+                    return !igSel || window.normalizeIgnicao(valor) === igSel;
+                }});
 
-                if (shouldBeVisible) {{
-                    // REMOVE TODAS AS CLASSES DE OCULTAÇÃO
-                    if (container) {{
-                        container.classList.remove('marker-hidden', 'marker-faded');
-                        container.style.display = 'block';
-                        container.style.opacity = '1';
-                        container.style.visibility = 'visible';
-                    }}
-                    el.style.display = 'flex';
-
-                    // DESTAQUE AMARELO CORRIGIDO - apenas background amarelo
-                    if (filtrosAtivos && isMatch) {{
-                        el.style.backgroundColor = 'yellow';
-                        el.style.color = 'black';
-                        el.style.fontWeight = 'bold';
-                        if (container) {{
-                            container.classList.add('marker-yellow');
-                            container.style.zIndex = "1000";
-                        }}
-                    }} else {{
-                        el.style.backgroundColor = el.getAttribute('data-originalcolor');
-                        el.style.color = 'white';
-                        el.style.fontWeight = 'normal';
-                        if (container) {{
-                            container.classList.remove('marker-yellow');
-                            container.style.zIndex = "1";
+                var visiveis = 0;
+                for (var i = 0; i < seg.n; i++) {{
+                    var mEv = true;
+                    if (mascara) {{
+                        mEv = false;
+                        for (var w = 0, base = i * seg.palavras; w < seg.palavras; w++) {{
+                            if (seg.bits[base + w] & mascara[w]) {{ mEv = true; break; }}
                         }}
                     }}
-                }} else {{
-                    // OCULTAÇÃO COMPLETA
-                    if (container) {{
-                        container.classList.add('marker-hidden');
-                        container.style.display = 'none';
-                        container.style.visibility = 'hidden';
-                        container.style.opacity = '0';
+                    var idx = seg.seq[i];
+                    var inRange = (idx >= start && idx <= end);
+                    var isMatch = mVe && mEv && ignOk[seg.ignicao[i]];
+
+                    // VISIBILIDADE: Se hide tá on, precisa de range E match. Se hide tá off, só range.
+                    var shouldBeVisible = hide ? (inRange && isMatch) : inRange;
+                    var novo = shouldBeVisible ? ((filtrosAtivos && isMatch) ? 2 : 1) : 0;
+                    if (novo !== 0) visiveis++;
+                    if (novo !== seg.estado[i]) {{
+                        seg.estado[i] = novo;
+                        window.aplicarEstadoMarcador(seg, i);
                     }}
-                    el.style.display = 'none';
                 }}
+                visiveisPorTipo[seg.tipo] = (visiveisPorTipo[seg.tipo] || 0) + visiveis;
             }});
 
             // Ajusta linhas também se necessário
@@ -651,8 +809,7 @@ class FilterManager:
                     if (layer.options && layer.options.isTrajeto && hide) {{
                         // Verificar se há marcadores visíveis para este trajeto
                         var tipo = layer.options.vehicleType;
-                        var markersVisiveis = document.querySelectorAll('.marker-circle[data-veiculo="' + tipo + '"]:not([style*="display: none"])');
-                        if (markersVisiveis.length === 0) {{
+                        if (!visiveisPorTipo[tipo]) {{
                             layer.setStyle({{ opacity: 0, weight: 0 }});
                         }} else {{
                             var weight = document.getElementById('lineWeight').value;
@@ -674,82 +831,87 @@ class FilterManager:
             }}
 
             document.querySelectorAll('.marker-circle').forEach(function(el) {{
-                var spanNum = el.querySelector('.m-num');
-                var spanHora = el.querySelector('.m-hora');
-                var spanDataHora = el.querySelector('.m-data-hora');
-                var spanNome = el.querySelector('.m-nome');
-
-                // Esconder todos primeiro
-                if (spanNum) spanNum.style.display = 'none';
-                if (spanHora) spanHora.style.display = 'none';
-                if (spanDataHora) spanDataHora.style.display = 'none';
-                if (spanNome) spanNome.style.display = 'none';
-
-                // Resetar completamente o estilo do marcador para o padrão
-                el.style.width = '22px';
-                el.style.height = '22px';
-                el.style.borderRadius = '50%';
-                el.style.fontSize = '10px';
-                el.style.padding = '0';
-                el.style.minWidth = '';
-                el.setAttribute('data-isplaying', selectedType);
-
-                // Mostrar apenas o selecionado e ajustar estilo
-                switch(selectedType) {{
-                    case 'hora':
-                        if (spanHora) {{
-                            spanHora.style.display = 'block';
-                            el.style.width = '38px';
-                            el.style.borderRadius = '6px';
-                            el.style.height = '18px';
-                            el.style.fontSize = '9px';
-                        }}
-                        break;
-                    case 'datahora':
-                        if (spanDataHora) {{
-                            spanDataHora.style.display = 'block';
-                            el.style.width = '85px';
-                            el.style.borderRadius = '6px';
-                            el.style.height = '18px';
-                            el.style.fontSize = '8px';
-                        }}
-                        break;
-                    case 'nome':
-                        if (spanNome && el.getAttribute('data-hasname') === 'true') {{
-                            spanNome.style.display = 'block';
-                            el.style.width = 'auto';
-                            el.style.minWidth = 'auto';
-                            el.style.padding = '0 10px';
-                            el.style.borderRadius = '4px';
-                            el.style.height = '20px';
-                            el.style.fontSize = '9px';
-                            el.style.whiteSpace = 'nowrap';
-                            el.style.overflow = 'visible';
-                        }} else {{
-                            // Se não tem nome, mostra número
-                            if (spanNum) {{
-                                spanNum.style.display = 'block';
-                                el.style.width = '22px';
-                                el.style.height = '22px';
-                                el.style.borderRadius = '50%';
-                                el.style.fontSize = '10px';
-                            }}
-                        }}
-                        break;
-                    default: // numero
+                window.aplicarRotulo(el, selectedType);
+            }});
+        }};
+
+        // Rótulo (número, hora, data/hora ou nome) de um marcador DivIcon
+        window.aplicarRotulo = function(el, selectedType) {{
+            var spanNum = el.querySelector('.m-num');
+            var spanHora = el.querySelector('.m-hora');
+            var spanDataHora = el.querySelector('.m-data-hora');
+            var spanNome = el.querySelector('.m-nome');
+
+            // Esconder todos primeiro
+            if (spanNum) spanNum.style.display = 'none';
+            if (spanHora) spanHora.style.display = 'none';
+            if (spanDataHora) spanDataHora.style.display = 'none';
+            if (spanNome) spanNome.style.display = 'none';
+
+            // Resetar completamente o estilo do marcador para o padrão
+            el.style.width = '22px';
+            el.style.height = '22px';
+            el.style.borderRadius = '50%';
+            el.style.fontSize = '10px';
+            el.style.padding = '0';
+            el.style.minWidth = '';
+            el.setAttribute('data-isplaying', selectedType);
+
+            // Mostrar apenas o selecionado e ajustar estilo
+            switch(selectedType) {{
+                case 'hora':
+                    if (spanHora) {{
+                        spanHora.style.display = 'block';
+                        el.style.width = '38px';
+                        el.style.borderRadius = '6px';
+                        el.style.height = '18px';
+                        el.style.fontSize = '9px';
+                    }}
+                    break;
+                case 'datahora':
+                    if (spanDataHora) {{
+                        spanDataHora.style.display = 'block';
+                        el.style.width = '85px';
+                        el.style.borderRadius = '6px';
+                        el.style.height = '18px';
+                        el.style.fontSize = '8px';
+                    }}
+                    break;
+                case 'nome':
+                    if (spanNome && el.getAttribute('data-hasname') === 'true') {{
+                        spanNome.style.display = 'block';
+                        el.style.width = 'auto';
+                        el.style.minWidth = 'auto';
+                        el.style.padding = '0 10px';
+                        el.style.borderRadius = '4px';
+                        el.style.height = '20px';
+                        el.style.fontSize = '9px';
+                        el.style.whiteSpace = 'nowrap';
+                        el.style.overflow = 'visible';
+                    }} else {{
+                        // Se não tem nome, mostra número
                         if (spanNum) {{
                             spanNum.style.display = 'block';
-                            // Garantir tamanho e fonte padrão
                             el.style.width = '22px';
                             el.style.height = '22px';
                             el.style.borderRadius = '50%';
                             el.style.fontSize = '10px';
-                            el.style.padding = '0';
-                            el.style.minWidth = '';
                         }}
-                        break;
-                }}
-            }});
+                    }}
+                    break;
+                default: // numero
+                    if (spanNum) {{
+                        spanNum.style.display = 'block';
+                        // Garantir tamanho e fonte padrão
+                        el.style.width = '22px';
+                        el.style.height = '22px';
+                        el.style.borderRadius = '50%';
+                        el.style.fontSize = '10px';
+                        el.style.padding = '0';
+                        el.style.minWidth = '';
+                    }}
+                    break;
+            }}
         }};
 
         window.resetAllFilters = function() {{
@@ -780,6 +942,13 @@ class FilterManager:
 
             // Limpar marcador de busca
             window.clearSearchMarker();
+
+            // Limpar seleção de cliente dos checkpoints KMZ
+            var kmzSel = document.getElementById('kmzClienteFiltro');
+            if (kmzSel) {{
+                kmzSel.value = '';
+                window.filterKmzCliente('');
+            }}
         }};
 
         document.addEventListener('DOMContentLoaded', function() {{
@@ -791,7 +960,8 @@ class FilterManager:
                 this.textContent = (c.style.display === 'none') ? '+' : '–';
             }};
 
-            // Configurar observer para camadas do mapa
+            // Reaplicar filtros nos eventos de camadas/zoom do mapa
+            window.setupTrajetoLOD();
             window.setupMapLayerObserver();
 
             // Inicializar filtros após um breve delay
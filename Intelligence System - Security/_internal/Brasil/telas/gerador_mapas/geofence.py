@@ -0,0 +1,174 @@
+"""
+Passagens dos veículos pelos checkpoints do KMZ (geocercas circulares).
+
+As leituras da planilha (ExcelParser) são cruzadas com os checkpoints (KMZParser)
+por um índice espacial (cKDTree) em coordenadas cartesianas da esfera: só os
+pares a até raio_m metros são examinados, em vez de leituras x checkpoints.
+"""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from ui_helpers import normalize_string, format_duration
+from trajectory_processing import RAIO_TERRA_M, sphere_xyz
+
+
+def _corda_para_metros(corda: np.ndarray) -> np.ndarray:
+    """Distância em linha reta (corda) -> distância sobre a superfície."""
+    return 2 * RAIO_TERRA_M * np.arcsin(np.clip(corda / (2 * RAIO_TERRA_M), 0.0, 1.0))
+
+
+class GeofenceEngine:
+    """
+    Visitas de cada Tipo a cada checkpoint: sequências de leituras consecutivas
+    (em ordem cronológica, por Tipo) a até raio_m metros do checkpoint.
+
+    A entrada é a primeira leitura dentro do raio e a saída, a última. Leituras
+    fora do raio por até intervalo_max_s segundos (GPS oscilando na borda da
+    geocerca) não encerram a visita: as duas partes viram uma só.
+    """
+
+    RAIO_PADRAO_M = 100.0
+    INTERVALO_PADRAO_S = 300.0
+    # Eventos acrescentados aos pontos do mapa (aparecem no filtro de Evento)
+    EVENTO_ENTRADA = 'ENTRADA CHECKPOINT'
+    EVENTO_SAIDA = 'SAÍDA CHECKPOINT'
+    COLUNAS = ('Tipo', 'Checkpoint', 'Cliente', 'Chave', 'Endereço', 'Entrada', 'Saída',
+               'Permanencia_s', 'Leituras', 'Distancia_min_m')
+
+    def __init__(self, pontos_info: List[Dict], raio_m: float = RAIO_PADRAO_M,
+                 intervalo_max_s: Optional[float] = None):
+        self.raio_m = float(raio_m)
+        self.intervalo_max_s = self.INTERVALO_PADRAO_S if intervalo_max_s is None else float(intervalo_max_s)
+        self.nomes = [(p.get('name') or f'CP {i}').strip() for i, p in enumerate(pontos_info, start=1)]
+        self.chaves = [normalize_string(nome) for nome in self.nomes]
+        self.enderecos = [p.get('address') or '' for p in pontos_info]
+        self.arvore = None
+        if pontos_info:
+            lat = [p['lat'] for p in pontos_info]
+            lon = [p['lon'] for p in pontos_info]
+            self.arvore = cKDTree(sphere_xyz(lat, lon))
+
+    def match(self, leituras: pd.DataFrame) -> pd.DataFrame:
+        """
+        Visitas (colunas COLUNAS, mais 'ponto_entrada' / 'ponto_saida' com a linha
+        de origem das leituras de entrada e saída), ordenadas por Entrada.
+        """
+        colunas = list(self.COLUNAS) + ['ponto_entrada', 'ponto_saida']
+        if self.arvore is None or leituras.empty or self.raio_m <= 0:
+            return pd.DataFrame(columns=colunas)
+
+        # Leituras de cada Tipo contíguas e em ordem cronológica
+        tipo_id, tipos = pd.factorize(leituras['Tipo'])
+        datas = pd.to_datetime(leituras['Data/Hora']).to_numpy()
+        ordem = np.lexsort((datas, tipo_id))
+        tipo_id, datas = tipo_id[ordem], datas[ordem]
+        xyz = sphere_xyz(leituras['Latitude'].to_numpy()[ordem], leituras['Longitude'].to_numpy()[ordem])
+
+        # Pares (leitura, checkpoint) dentro do raio
+        corda = 2 * RAIO_TERRA_M * np.sin(self.raio_m / (2 * RAIO_TERRA_M))
+        pares = cKDTree(xyz).sparse_distance_matrix(self.arvore, corda, output_type='ndarray')
+        if len(pares) == 0:
+            return pd.DataFrame(columns=colunas)
+        k, cp, dist = pares['i'], pares['j'], _corda_para_metros(pares['v'])
+
+        # Visita: leituras consecutivas do mesmo Tipo junto ao mesmo checkpoint
+        seq = np.lexsort((k, cp))
+        k, cp, dist = k[seq], cp[seq], dist[seq]
+        nova = np.ones(len(k), dtype=bool)
+        nova[1:] = (cp[1:] != cp[:-1]) | (k[1:] != k[:-1] + 1) | (tipo_id[k[1:]] != tipo_id[k[:-1]])
+        inicios = np.flatnonzero(nova)
+        fins = np.append(inicios[1:], len(k)) - 1
+        if self.intervalo_max_s > 0 and len(inicios) > 1:
+            # Visitas seguidas ao mesmo checkpoint pelo mesmo Tipo: junta quando o tempo
+            # fora do raio (saída de uma até a entrada da seguinte) é curto
+            fora_s = (datas[k[inicios[1:]]] - datas[k[fins[:-1]]]) / np.timedelta64(1, 's')
+            continua = np.zeros(len(inicios), dtype=bool)
+            continua[1:] = ((cp[inicios[1:]] == cp[inicios[:-1]])
+                            & (tipo_id[k[inicios[1:]]] == tipo_id[k[inicios[:-1]]])
+                            & (fora_s <= self.intervalo_max_s))
+            inicios, fins = inicios[~continua], fins[np.append(~continua[1:], True)]
+
+        entrada, saida = datas[k[inicios]], datas[k[fins]]
+        checkpoints = cp[inicios]
+        pontos = leituras['ponto'].to_numpy()[ordem] if 'ponto' in leituras else np.full(len(ordem), -1)
+        visitas = pd.DataFrame({
+            'Tipo': np.asarray(tipos)[tipo_id[k[inicios]]],
+            'Checkpoint': checkpoints + 1,
+            'Cliente': np.asarray(self.nomes, dtype=object)[checkpoints],
+            'Chave': np.asarray(self.chaves, dtype=object)[checkpoints],
+            'Endereço': np.asarray(self.enderecos, dtype=object)[checkpoints],
+            'Entrada': entrada,
+            'Saída': saida,
+            'Permanencia_s': (saida - entrada) / np.timedelta64(1, 's'),
+            'Leituras': fins - inicios + 1,
+            'Distancia_min_m': np.round(np.minimum.reduceat(dist, inicios), 1),
+            'ponto_entrada': pontos[k[inicios]],
+            'ponto_saida': pontos[k[fins]],
+        })
+        return visitas.sort_values(['Entrada', 'Checkpoint'], kind='stable').reset_index(drop=True)
+
+
+def apply_visit_events(excel_parser, visitas: pd.DataFrame) -> None:
+    """
+    Acrescenta as entradas e saídas como eventos dos pontos do mapa (df_eventos),
+    na ordem cronológica de cada ponto; o filtro de Evento e o histórico do
+    popup passam a mostrá-las. df_grouped e df_eventos são substituídos, não alterados.
+    Depois disso, get_readings contaria os novos eventos como leituras: as análises
+    que usam as leituras devem recebê-las de antes desta chamada.
+    """
+    if visitas.empty:
+        return
+    grupos = excel_parser.df_grouped
+    eventos = excel_parser.df_eventos
+    ordem, ponto_atual = excel_parser.get_event_points()
+
+    permanencia = [format_duration(s) for s in visitas['Permanencia_s'].tolist()]
+    novos = pd.DataFrame({
+        'Data/Hora': pd.concat([visitas['Entrada'], visitas['Saída']], ignore_index=True)
+                       .astype(eventos['Data/Hora'].dtype),
+        'Evento': [GeofenceEngine.EVENTO_ENTRADA] * len(visitas) + [GeofenceEngine.EVENTO_SAIDA] * len(visitas),
+        'Observações': visitas['Cliente'].tolist() + [f"{c} (permanência {p})" for c, p in
+                                                      zip(visitas['Cliente'].tolist(), permanencia)],
+    })
+    ponto_novo = np.concatenate((visitas['ponto_entrada'].to_numpy(), visitas['ponto_saida'].to_numpy()))
+
+    todos = pd.concat([eventos, novos[list(eventos.columns)]], ignore_index=True)
+    ponto = np.concatenate((ponto_atual, ponto_novo)).astype(np.int64)
+    # Eventos de cada ponto contíguos, seguindo a ordem de ev_inicio; dentro do ponto, por Data/Hora
+    posicao = np.empty(len(grupos), dtype=np.int64)
+    posicao[ordem] = np.arange(len(grupos))
+    sequencia = np.lexsort((todos['Data/Hora'].to_numpy(), posicao[ponto]))
+    excel_parser.df_eventos = todos.iloc[sequencia].reset_index(drop=True)
+
+    contagem = np.bincount(ponto, minlength=len(grupos))
+    fins = np.cumsum(contagem[ordem])
+    ev_inicio = np.empty(len(grupos), dtype=np.int64)
+    ev_inicio[ordem] = fins - contagem[ordem]
+    excel_parser.df_grouped = grupos.assign(ev_inicio=ev_inicio, ev_fim=ev_inicio + contagem)
+
+
+def save_visits_table(visitas: pd.DataFrame, caminho: str) -> str:
+    """
+    Grava a tabela de visitas: .xlsx pelo openpyxl ou, para qualquer outra
+    extensão, CSV com ';' e BOM (abre direto no Excel em português).
+    """
+    tabela = visitas[list(GeofenceEngine.COLUNAS)].copy()
+    tabela.insert(tabela.columns.get_loc('Permanencia_s') + 1, 'Permanência',
+                  [format_duration(s) for s in tabela['Permanencia_s'].tolist()])
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(pasta, exist_ok=True)
+    if caminho.lower().endswith('.xlsx'):
+        tabela.to_excel(caminho, index=False)
+    else:
+        tabela.to_csv(caminho, sep=';', index=False, encoding='utf-8-sig', date_format='%d/%m/%Y %H:%M:%S')
+    return caminho
+
+
+def visits_table_path(output_path: str, extensao: str = '.csv') -> str:
+    """Tabela de visitas ao lado do mapa: Mapa_x.html -> Mapa_x_visitas.csv."""
+    base = output_path[:-3] if output_path.lower().endswith('.gz') else output_path
+    return os.path.splitext(base)[0] + '_visitas' + extensao
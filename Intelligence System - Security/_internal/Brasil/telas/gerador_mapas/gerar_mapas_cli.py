@@ -0,0 +1,231 @@
+"""
+Gerador de mapas em lote, sem interface gráfica.
+
+Exemplos:
+    python gerar_mapas_cli.py ocorrencia.xlsx -o mapa.html
+    python gerar_mapas_cli.py pasta_planilhas/ -o mapas/ --cor "ISCA 1=#ff0000" --workers 4
+    python gerar_mapas_cli.py ocorrencia.xlsx -o mapa.html --kmz clientes.kmz --geofence 150 --desvio 300
+"""
+import sys
+import os
+import json
+import glob
+import argparse
+import multiprocessing
+import time
+from typing import Dict, List, Optional
+
+# Ajuste de path para encontrar os arquivos locais
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from batch_runner import BatchMapRunner
+from map_builder import MapBuilder
+from map_pipeline import default_output_name, COMPRESSOES
+from tile_cache import PORTA_PADRAO, local_tiles_url
+
+EXTENSOES_EXCEL = ('.xlsx', '.xlsm', '.xls')
+
+def expand_inputs(entradas: List[str]) -> List[str]:
+    """Arquivos, pastas (todas as planilhas dentro) ou padrões glob -> lista de planilhas."""
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = sorted(glob.glob(os.path.join(entrada, '*')))
+        else:
+            candidatos = sorted(glob.glob(entrada)) or [entrada]
+        for caminho in candidatos:
+            nome = os.path.basename(caminho)
+            # Ignora arquivos temporários do Excel (~$planilha.xlsx)
+            if nome.lower().endswith(EXTENSOES_EXCEL) and not nome.startswith('~$'):
+                arquivos.append(caminho)
+    return arquivos
+
+
+def parse_colors(arquivo_cores: Optional[str], pares: List[str]) -> Dict[str, str]:
+    """Cores de um JSON {"TIPO": "#hex"} e/ou de pares TIPO=#hex (os pares têm prioridade)."""
+    cores = {}
+    if arquivo_cores:
+        with open(arquivo_cores, encoding='utf-8') as f:
+            cores.update(json.load(f))
+    for par in pares:
+        if '=' not in par:
+            raise ValueError(f"Cor inválida: {par!r} (use TIPO=#RRGGBB)")
+        tipo, cor = par.split('=', 1)
+        cores[tipo.strip()] = cor.strip()
+    return cores
+
+
+def output_paths(arquivos: List[str], saida: Optional[str]) -> List[str]:
+    """Um único arquivo pode ir direto para um .html; vários vão para a pasta de saída."""
+    if saida and saida.lower().endswith('.html'):
+        if len(arquivos) > 1:
+            raise ValueError("Com várias planilhas, --saida deve ser uma pasta")
+        return [saida]
+    pasta = saida or os.getcwd()
+    return [os.path.join(pasta, default_output_name(a)) for a in arquivos]
+
+
+def parse_coordinates(texto: Optional[str], minimo: int) -> Optional[List[List[float]]]:
+    """'lat,lon;lat,lon;...' -> [[lat, lon], ...] (None quando não informado)."""
+    if not texto:
+        return None
+    pares = [p for p in texto.split(';') if p.strip()]
+    coordenadas = []
+    for par in pares:
+        try:
+            lat, lon = (float(v) for v in par.split(','))
+        except ValueError:
+            raise ValueError(f"Coordenada inválida: {par!r} (use LAT,LON)") from None
+        coordenadas.append([lat, lon])
+    if len(coordenadas) < minimo:
+        raise ValueError(f"Informe ao menos {minimo} coordenadas: {texto!r}")
+    return coordenadas
+
+
+def print_progress(concluidas: int, total: int, resultado: Dict) -> None:
+    """Uma linha por planilha concluída, com tempos ou o erro."""
+    nome = os.path.basename(resultado['arquivo'])
+    if resultado['ok']:
+        t = resultado['tempos']
+        origem = " (cache)" if resultado['from_cache'] else ""
+        print(f"[{concluidas}/{total}] ✓ {nome}{origem} -> {resultado['saida']} "
+              f"({resultado['pontos']} pontos, {resultado['bytes'] / 1024:.0f} KB; leitura {t['leitura']:.1f}s, mapa {t['mapa']:.1f}s, "
+              f"salvar {t['salvar']:.1f}s)")
+        if resultado['checkpoints']:
+            print(f"      {resultado['checkpoints']} checkpoints do KMZ")
+        if resultado['tabela_visitas']:
+            print(f"      {resultado['visitas']} visitas a checkpoints -> {resultado['tabela_visitas']}")
+        if resultado['tabela_desvios']:
+            print(f"      {resultado['desvios']} trechos fora da rota -> {resultado['tabela_desvios']}")
+        if resultado['recursos_faltando']:
+            print(f"      {len(resultado['recursos_faltando'])} recursos não embutidos (sem cópia local nem acesso à CDN)")
+        if resultado['filtered_out_rows']:
+            print(f"      {resultado['filtered_out_rows']} linhas fora dos filtros de leitura")
+        if resultado['datetime_fallback_rows']:
+            print(f"      {resultado['datetime_fallback_rows']} linhas de Data/Hora fora do formato detectado")
+    else:
+        print(f"[{concluidas}/{total}] ✗ {nome}: {resultado['erro']}")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Gera mapas HTML a partir de planilhas de rastreamento, sem interface.")
+    parser.add_argument('entradas', nargs='+', help="Planilhas, pastas ou padrões (ex.: dados/*.xlsx)")
+    parser.add_argument('-o', '--saida', help="Arquivo .html (uma planilha) ou pasta de saída (padrão: pasta atual)")
+    parser.add_argument('--cores', help="JSON com o mapeamento {\"TIPO\": \"#RRGGBB\"}")
+    parser.add_argument('--cor', action='append', default=[], metavar='TIPO=#RRGGBB',
+                        help="Cor de um Tipo (pode repetir); demais Tipos usam a paleta padrão")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processos em paralelo (padrão: 1, tudo no mesmo processo; 0 = todos os núcleos)")
+    parser.add_argument('--render-mode', choices=MapBuilder.RENDER_MODES, default='divicon')
+    parser.add_argument('--lazy-popups', action='store_true', help="Monta os popups só ao clicar")
+    parser.add_argument('--cluster', dest='cluster_markers', action='store_true',
+                        help="Agrupa os marcadores próximos em clusters")
+    parser.add_argument('--route-tolerance', type=float, default=0.0, metavar='METROS',
+                        help="Simplifica as linhas do trajeto (Douglas-Peucker)")
+    parser.add_argument('--route-lod', action='store_true', help="Níveis de detalhe do trajeto por zoom")
+    parser.add_argument('--compacto', action='store_true',
+                        help="HTML compacto: estilos de marcadores e popups em classes CSS compartilhadas")
+    parser.add_argument('--offline', action='store_true',
+                        help="Embute JS/CSS no HTML (baixados uma vez para --recursos-dir); o mapa abre sem CDNs")
+    parser.add_argument('--recursos-dir', help="Pasta com a cópia local dos JS/CSS (padrão: pasta do usuário)")
+    parser.add_argument('--tiles', help="URL dos tiles ({z}/{x}/{y}) ou pasta local com os tiles")
+    parser.add_argument('--tiles-locais', action='store_true',
+                        help="Usa o servidor de cache de tiles local (python tile_cache.py servir)")
+    parser.add_argument('--tiles-porta', type=int, default=PORTA_PADRAO, metavar='PORTA',
+                        help=f"Com --tiles-locais: porta do servidor (a mesma de 'servir --porta'; padrão: {PORTA_PADRAO})")
+    parser.add_argument('--compressao', choices=COMPRESSOES,
+                        help="gzip: grava .html.gz; autoextraivel: .html comprimido que se expande ao abrir")
+    parser.add_argument('--kmz', help="KML/KMZ com os checkpoints dos clientes e a rota planejada (vale para todas as planilhas)")
+    parser.add_argument('--geofence', type=float, default=0.0, metavar='METROS',
+                        help="Com --kmz: registra entradas/saídas a até METROS de cada checkpoint "
+                             "(eventos no mapa + tabela <mapa>_visitas.csv)")
+    parser.add_argument('--geofence-intervalo', type=float, metavar='MINUTOS',
+                        help="Tempo fora do raio que ainda não encerra a visita ao checkpoint (padrão: 5)")
+    parser.add_argument('--desvio', type=float, default=0.0, metavar='METROS',
+                        help="Com --kmz: destaca os trechos a mais de METROS da rota planejada "
+                             "(camada no mapa + tabela <mapa>_desvios.csv)")
+    parser.add_argument('--snap-radius', type=float, default=0.0, metavar='METROS',
+                        help="Junta leituras a até METROS umas das outras num único ponto (ruído do GPS parado)")
+    parser.add_argument('--snap-window', type=float, metavar='MINUTOS',
+                        help="Intervalo máximo entre leituras juntadas pelo --snap-radius (padrão: 30)")
+    parser.add_argument('--paradas', type=float, default=0.0, metavar='MINUTOS',
+                        help="Resume em um único ponto, com a duração, cada parada de pelo menos MINUTOS")
+    filtros = parser.add_argument_group('filtros de leitura (aplicados antes do agrupamento)')
+    filtros.add_argument('--inicio', help="Data/Hora inicial (dd/mm/aaaa HH:MM)")
+    filtros.add_argument('--fim', help="Data/Hora final (dd/mm/aaaa HH:MM)")
+    filtros.add_argument('--bbox', metavar='LAT,LON;LAT,LON', help="Região retangular: dois cantos opostos (coordenadas negativas: --bbox=\"-22.3,-46.0;-22.1,-45.8\")")
+    filtros.add_argument('--poligono', metavar='LAT,LON;LAT,LON;...', help="Região poligonal (3 ou mais vértices; mesmo formato do --bbox)")
+    filtros.add_argument('--tipo', action='append', default=[], help="Mantém só este Tipo (pode repetir)")
+    filtros.add_argument('--evento', action='append', default=[], help="Mantém só este evento (pode repetir)")
+    parser.add_argument('--sem-cache', action='store_true', help="Não usa o cache de planilhas processadas")
+    parser.add_argument('--cache-dir', help="Pasta do cache (padrão: pasta do usuário)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+
+    arquivos = expand_inputs(args.entradas)
+    if not arquivos:
+        print("Nenhuma planilha encontrada.")
+        return 1
+
+    # Erros de uso (cores, coordenadas, saída) viram mensagem do argparse, não traceback
+    try:
+        cores = parse_colors(args.cores, args.cor)
+        cantos = parse_coordinates(args.bbox, 2)
+        poligono = parse_coordinates(args.poligono, 3)
+        saidas = output_paths(arquivos, args.saida)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    map_options = {
+        'render_mode': args.render_mode,
+        'lazy_popups': args.lazy_popups,
+        'route_tolerance_m': args.route_tolerance,
+        'route_lod': args.route_lod,
+        'compact_html': args.compacto,
+        'offline_assets': args.offline,
+        'asset_cache_dir': args.recursos_dir,
+        'tiles': local_tiles_url(args.tiles_porta) if args.tiles_locais else args.tiles,
+    }
+    if (args.geofence > 0 or args.desvio > 0) and not args.kmz:
+        print("--geofence e --desvio requerem --kmz.")
+        return 1
+    if args.cluster_markers:
+        map_options['cluster_markers'] = True
+    geofence_gap_s = args.geofence_intervalo * 60 if args.geofence_intervalo is not None else None
+
+    parse_options = {'snap_radius_m': args.snap_radius, 'stop_min_s': args.paradas * 60}
+    if args.snap_window is not None:
+        parse_options['snap_window_s'] = args.snap_window * 60
+    parse_options.update({
+        'time_start': args.inicio,
+        'time_end': args.fim,
+        'bbox': (min(c[0] for c in cantos), min(c[1] for c in cantos),
+                 max(c[0] for c in cantos), max(c[1] for c in cantos)) if cantos else None,
+        'polygon': poligono,
+        'tipos': args.tipo or None,
+        'eventos': args.evento or None,
+    })
+
+    runner = BatchMapRunner(workers=args.workers or None, cache_dir=args.cache_dir,
+                            usar_cache=not args.sem_cache, progress=print_progress)
+    inicio = time.perf_counter()
+    resultados = runner.run(list(zip(arquivos, saidas)), cores, parse_options, args.compressao,
+                            args.kmz, args.geofence, args.desvio, geofence_gap_s, **map_options)
+
+    resumo = BatchMapRunner.summary(resultados)
+    print(f"\n{resumo['sucesso']}/{resumo['total']} mapas gerados em {time.perf_counter() - inicio:.1f}s")
+    for r in resultados:
+        if not r['ok']:
+            print(f"  ✗ {r['arquivo']}: {r['erro']}")
+
+    return 0 if resumo['falhas'] == 0 else 2
+
+
+if __name__ == '__main__':
+    # Executável do PyInstaller no Windows: os workers reexecutam o próprio .exe
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,25 +1,87 @@
 """
 Construtor principal do mapa - Versão com Checkpoints Temporários.
 """
+import os
 import folium
 from typing import List, Dict, Optional
-from map_components import MapMarkerFactory, MapControls
+from map_components import (MapMarkerFactory, MapControls, PointDataLayer, LazyPopupTable, MarkerFilterIndex,
+                            CheckpointDataLayer)
 from filter_manager import FilterManager
 from checkpoint_system import CheckpointSystem
+from trajectory_processing import split_runs, simplify_runs, build_lod_levels
+from offline_assets import AssetCache, embed_assets, local_tiles_url
 from ui_helpers import (
     html_escape,
     get_vehicle_color,
-    get_vehicle_marker_color
+    get_vehicle_marker_colors,
+    valid_name_mask
 )
 
 class MapBuilder:
-    def __init__(self, center_location: List[float], zoom_start: int = 12):
+    # Mapa base padrão (CartoDB Voyager)
+    TILES_PADRAO = 'https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}{r}.png'
+    TILES_ATTR = '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors &copy; <a href="https://carto.com/attributions">CARTO</a>'
+
+    # 'divicon': um folium.Marker com DivIcon por ponto (número/hora/nome visíveis no mapa)
+    # 'canvas': uma camada de dados por Tipo desenhada em canvas (PointDataLayer)
+    RENDER_MODES = ('divicon', 'canvas')
+
+    # Agrupamento em zoom baixo; só os marcadores dentro da área visível são criados
+    CLUSTER_OPTIONS = {
+        'disableClusteringAtZoom': 17,
+        'maxClusterRadius': 60,
+        'chunkedLoading': True,
+        'removeOutsideVisibleBounds': True,
+        'spiderfyOnMaxZoom': False,
+        'showCoverageOnHover': False,
+    }
+
+    # Checkpoints e rota planejada do KMZ
+    KMZ_COR_CHECKPOINT = '#6a1b9a'
+    KMZ_COR_ROTA = '#555555'
+    # Trechos do trajeto fora da rota planejada
+    COR_DESVIO = '#e53935'
+
+    # Níveis de detalhe do trajeto: (zoom mínimo, zoom máximo, tolerância em metros)
+    ROUTE_LOD_LEVELS = (
+        (0, 12, 40.0),
+        (13, 15, 8.0),
+        (16, 30, 0.0),
+    )
+
+    def __init__(self, center_location: List[float], zoom_start: int = 12, render_mode: str = 'divicon',
+                 lazy_popups: bool = False, cluster_markers: bool = False,
+                 route_tolerance_m: float = 0.0, route_lod: bool = False, compact_html: bool = False,
+                 offline_assets: bool = False, asset_cache_dir: Optional[str] = None,
+                 tiles: Optional[str] = None):
+        if render_mode not in self.RENDER_MODES:
+            raise ValueError(f"render_mode inválido: {render_mode!r} (use {', '.join(self.RENDER_MODES)})")
+        self.render_mode = render_mode
+        # Popups montados no navegador ao clicar, a partir de uma tabela de dados por Tipo
+        self.lazy_popups = lazy_popups
+        # Marcadores de cada Tipo dentro de um MarkerCluster (agrupamento + recorte pela área visível)
+        self.cluster_markers = cluster_markers
+        # Simplificação (Douglas-Peucker) só das linhas do trajeto; os pontos continuam exatos.
+        # Com route_lod=True usa ROUTE_LOD_LEVELS, trocados pelo navegador conforme o zoom.
+        self.route_tolerance_m = route_tolerance_m
+        self.route_lod = route_lod
+        # Marcadores e popups com classes CSS compartilhadas e sem espaços (HTML menor)
+        self.compact_html = compact_html
+        # JS/CSS embutidos no HTML a partir do cache local (AssetCache): o mapa abre sem CDNs
+        self.offline_assets = offline_assets
+        self.asset_cache_dir = asset_cache_dir
+        self.assets_missing: List[str] = []
+        # Tiles: URL no formato {z}/{x}/{y} (ex.: tile_cache.TILES_LOCAIS_URL, servidor de
+        # cache local) ou pasta local com os tiles
+        if tiles and os.path.isdir(tiles):
+            tiles = local_tiles_url(tiles)
+
         # Usando CartoDB Voyager - visual similar ao OpenStreetMap mas funciona sem servidor
         self.mapa = folium.Map(
             location=center_location,
             zoom_start=zoom_start,
-            tiles='https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}{r}.png',
-            attr='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors &copy; <a href="https://carto.com/attributions">CARTO</a>'
+            tiles=tiles or self.TILES_PADRAO,
+            attr=self.TILES_ATTR
         )
         self.marker_coords = []
         self.marker_colors = []
@@ -28,6 +90,8 @@ class MapBuilder:
 
         self.category_groups = {}
         self.mapeamento_cores = {}
+        # Clientes dos checkpoints KMZ ({chave normalizada: nome}) para o seletor do filtro
+        self.kmz_clientes: Dict[str, str] = {}
 
         # Componentes
         self.map_controls = MapControls()
@@ -37,9 +101,17 @@ class MapBuilder:
         # Adicionar controles básicos
         self.map_controls.add_measure_control(self.mapa)
 
-    def add_vehicle_data(self, df_grouped, mapeamento_cores: dict) -> None:
-        """Adiciona os dados ao mapa usando as cores definidas pela UI."""
+        if self.compact_html:
+            self.mapa.get_root().header.add_child(folium.Element(MapMarkerFactory.CSS_COMPACTO))
+
+    def add_vehicle_data(self, df_grouped, mapeamento_cores: dict, df_eventos) -> None:
+        """
+        Adiciona os dados ao mapa usando as cores definidas pela UI.
+        df_eventos: eventos em colunas planas (ExcelParser.df_eventos), indexados por
+        ev_inicio/ev_fim de df_grouped.
+        """
         self.mapeamento_cores = mapeamento_cores
+        planos = MapMarkerFactory.flat_event_columns(df_eventos)
         max_points = 0
 
         for tipo_nome, group in df_grouped.groupby('Tipo'):
@@ -56,30 +128,92 @@ class MapBuilder:
 
             group_sorted = group.sort_values('Data_Inicial')
 
-            for i, (_, row) in enumerate(group_sorted.iterrows()):
-                lat, lon = row['Latitude'], row['Longitude']
+            # Cores, nomes e ignição calculados por coluna; marcadores emitidos em lote
+            icon_colors = get_vehicle_marker_colors(tipo_nome, len(group_sorted), self.mapeamento_cores)
+            coords = group_sorted[['Latitude', 'Longitude']].values.tolist()
+            has_names = valid_name_mask(group_sorted['NOME_PESSOA']).tolist()
 
-                # Verificar se tem nome válido
-                nome_pessoa = str(row.get('NOME_PESSOA', '')).strip()
-                invalidos = ['nan', 'n/i', 'none', 'null', '', '0']
-                tem_nome_valido = nome_pessoa and nome_pessoa.lower() not in invalidos
+            grupo = self.category_groups[tipo_nome]['group']
+            destino = grupo
+            if self.cluster_markers:
+                destino = MapMarkerFactory.create_vehicle_cluster(
+                    tipo_nome, self.category_groups[tipo_nome]['color'], self.CLUSTER_OPTIONS)
+                grupo.add_child(destino)
 
-                # Gera o degradê baseado na cor escolhida
-                icon_color = get_vehicle_marker_color(tipo_nome, i, len(group_sorted), self.mapeamento_cores)
+            if self.render_mode == 'canvas':
+                pontos = MapMarkerFactory.create_vehicle_point_records(
+                    group_sorted, icon_colors, tipo_nome, planos, lazy_popups=self.lazy_popups,
+                    compact=self.compact_html)
+                destino.add_child(PointDataLayer(tipo_nome, pontos))
+            else:
+                markers = MapMarkerFactory.create_vehicle_markers(
+                    group_sorted, icon_colors, tipo_nome, planos, lazy_popups=self.lazy_popups,
+                    compact=self.compact_html)
+                for marker in markers:
+                    destino.add_child(marker)
 
-                marker = MapMarkerFactory.create_vehicle_marker(row, i, icon_color, tipo_nome)
-                self.category_groups[tipo_nome]['group'].add_child(marker)
-                self.category_groups[tipo_nome]['coords'].append([lat, lon])
-                self.category_groups[tipo_nome]['has_names'].append(tem_nome_valido)
+            if self.lazy_popups:
+                registros = MapMarkerFactory.create_popup_records(group_sorted, icon_colors, planos)
+                grupo.add_child(LazyPopupTable(tipo_nome, registros))
 
-                self.marker_coords.append([lat, lon])
-                self.marker_colors.append(icon_color)
+            indice = MapMarkerFactory.create_filter_index(group_sorted, icon_colors, planos)
+            grupo.add_child(MarkerFilterIndex(tipo_nome, indice))
+
+            self.category_groups[tipo_nome]['coords'].extend(coords)
+            self.category_groups[tipo_nome]['has_names'].extend(has_names)
+            self.marker_coords.extend(coords)
+            self.marker_colors.extend(icon_colors)
 
             if len(group_sorted) > max_points:
                 max_points = len(group_sorted)
 
         self.total_markers = max_points
 
+    def add_kmz_checkpoints(self, pontos_info: List[Dict], linhas: Optional[List] = None) -> None:
+        """
+        Checkpoints do KMZ (KMZParser.parse) em uma única camada de dados e,
+        se houver, as LineStrings como rota planejada. Deve ser chamado antes
+        de add_filter_system, que monta o seletor de clientes.
+        """
+        if pontos_info:
+            registros, self.kmz_clientes = MapMarkerFactory.create_checkpoint_records(pontos_info)
+            grupo = folium.FeatureGroup(name=f'Checkpoints KMZ ({len(registros)})')
+            grupo.add_child(CheckpointDataLayer(registros, self.KMZ_COR_CHECKPOINT))
+            grupo.add_to(self.mapa)
+
+        partes = [linha.tolist() for linha in (linhas or []) if len(linha) >= 2]
+        if partes:
+            rota = folium.FeatureGroup(name='Rota planejada (KMZ)')
+            folium.PolyLine(
+                locations=partes,
+                color=self.KMZ_COR_ROTA,
+                weight=3,
+                opacity=0.7,
+                dash_array='6 6',
+                tooltip='Rota planejada'
+            ).add_to(rota)
+            rota.add_to(self.mapa)
+
+    def add_route_deviations(self, trechos) -> None:
+        """
+        Trechos fora da rota planejada (RouteDeviationAnalyzer.analyze) como uma
+        camada de linhas destacadas, com Tipo, horário e distância máxima no tooltip.
+        """
+        if trechos is None or trechos.empty:
+            return
+        grupo = folium.FeatureGroup(name=f'Fora da rota ({len(trechos)} trechos)')
+        colunas = ('Tipo', 'Início', 'Fim', 'Leituras', 'Distancia_max_m', 'coordenadas')
+        for tipo, inicio, fim, leituras, dist_max, coords in zip(*(trechos[c] for c in colunas)):
+            folium.PolyLine(
+                locations=coords,
+                color=self.COR_DESVIO,
+                weight=6,
+                opacity=0.85,
+                tooltip=(f"Fora da rota: {html_escape(tipo)} — {inicio:%d/%m %H:%M} a {fim:%d/%m %H:%M} "
+                         f"({leituras} leituras, até {dist_max:.0f} m)")
+            ).add_to(grupo)
+        grupo.add_to(self.mapa)
+
     def add_filter_system(self, eventos_unicos: List[str],
                          categorias_unicas: List[str]) -> None:
         """Adiciona sistema de filtros injetando as cores iniciais da interface."""
@@ -87,7 +221,7 @@ class MapBuilder:
         filter_html = self.filter_manager.build_filter_html(
             eventos_unicos,
             categorias_unicas,
-            "",
+            self.filter_manager.build_kmz_cliente_opts(self.kmz_clientes),
             self.total_markers,
             self.mapeamento_cores
         )
@@ -103,23 +237,31 @@ class MapBuilder:
             coords = data['coords']
             has_names = data['has_names']
 
-            if len(coords) > 1:
-                # Criar linhas apenas entre pontos consecutivos que NÃO têm nome
-                for i in range(len(coords) - 1):
-                    # Só cria linha se ambos os pontos não tiverem nome válido
-                    if not has_names[i] and not has_names[i + 1]:
-                        line = folium.PolyLine(
-                            locations=[coords[i], coords[i + 1]],
-                            color=data['color'],
-                            weight=2,
-                            opacity=0.8,
-                            tooltip=f"Trajeto: {tipo_nome}"
-                        )
-
-                        # Metadados para o seletor de cores JS no navegador
-                        line.options['isTrajeto'] = True
-                        line.options['vehicleType'] = tipo_nome.lower()
-                        line.add_to(data['group'])
+            # Linhas apenas entre pontos consecutivos que NÃO têm nome: cada trecho
+            # contínuo vira uma parte de uma única polyline por Tipo
+            trechos = split_runs(coords, has_names)
+            if trechos:
+                if self.route_lod:
+                    niveis = build_lod_levels(trechos, self.ROUTE_LOD_LEVELS)
+                else:
+                    niveis = [(None, None, simplify_runs(trechos, self.route_tolerance_m))]
+
+                for zoom_min, zoom_max, partes in niveis:
+                    line = folium.PolyLine(
+                        locations=partes,
+                        color=data['color'],
+                        weight=2,
+                        opacity=0.8,
+                        tooltip=f"Trajeto: {tipo_nome}"
+                    )
+
+                    # Metadados para o seletor de cores JS no navegador
+                    line.options['isTrajeto'] = True
+                    line.options['vehicleType'] = tipo_nome.lower()
+                    if zoom_min is not None:
+                        line.options['lodMinZoom'] = zoom_min
+                        line.options['lodMaxZoom'] = zoom_max
+                    line.add_to(data['group'])
 
             data['group'].add_to(self.mapa)
 
@@ -130,4 +272,7 @@ class MapBuilder:
         # Adicionar controle de camadas
         self.map_controls.add_layer_control(self.mapa, collapsed=False)
 
+        if self.offline_assets:
+            self.assets_missing = embed_assets(self.mapa, AssetCache(self.asset_cache_dir))
+
         return self.mapa
\ No newline at end of file
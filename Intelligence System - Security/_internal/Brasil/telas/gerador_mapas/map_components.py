@@ -1,55 +1,314 @@
+import json
 import folium
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
 from folium.features import DivIcon
-from folium.plugins import MeasureControl
-from typing import Dict, List, Tuple, Optional
-from ui_helpers import html_escape, is_nonempty_desc
+from folium.plugins import MeasureControl, MarkerCluster
+from typing import Dict, List, Tuple
+from ui_helpers import (html_escape, is_nonempty_desc, valid_name_mask, format_duration,
+                        normalize_string)
 
 
 class MapMarkerFactory:
     """Fábrica de marcadores para o mapa."""
 
+    # Modo compacto (compact=True): os estilos repetidos em cada marcador e popup
+    # viram classes, injetadas uma única vez no <head> do mapa. Só as propriedades
+    # que o filtro nunca altera pelo JS mantêm !important.
+    CSS_COMPACTO = (
+        '<style>'
+        '.marker-circle{display:flex;justify-content:center!important;align-items:center!important;'
+        'color:white;font-weight:bold;font-size:10px;border:2px solid white!important;'
+        'box-shadow:0 0 4px rgba(0,0,0,0.6)!important;white-space:nowrap;transition:all 0.2s ease;'
+        'cursor:pointer;width:22px;height:22px;border-radius:50%;padding:0;min-width:auto;box-sizing:border-box}'
+        '.marker-circle .m-hora,.marker-circle .m-data-hora,.marker-circle .m-nome{display:none}'
+        '.pp{font-family:Arial,sans-serif;font-size:12px;width:340px;max-height:450px;overflow:auto;'
+        'color:#333;padding-right:5px;box-sizing:border-box}'
+        '.pp-tit{color:white;padding:8px;border-radius:4px 4px 0 0;font-weight:bold;text-align:center;'
+        'margin-bottom:10px;position:sticky;top:0;z-index:10}'
+        '.pp-corpo{padding:0 5px}'
+        '.pp-corpo table{width:100%;margin-bottom:10px;border-collapse:collapse;min-width:320px}'
+        '.pp-corpo td{padding:3px 0;vertical-align:top}'
+        '.pp-corpo td.r{color:#666;width:90px}'
+        '.pp-corpo td.nw{white-space:nowrap}'
+        '.pp-corpo td.mono{font-size:11px;font-family:monospace;white-space:nowrap}'
+        '.pp-hist{max-height:200px;overflow:auto;padding:8px;background:#f9f9f9;border-radius:4px;'
+        'border:1px solid #eee;margin-top:10px;min-width:320px}'
+        '.pp-hist b{display:block;margin-bottom:8px;color:#555;font-size:11px;position:sticky;top:0;'
+        'background:#f9f9f9;padding:2px 0}'
+        '.pp-hist ul{padding-left:15px;margin:0;list-style:none;font-size:11px;min-width:300px}'
+        '.pp-hist li{margin-bottom:3px;padding:2px 0;border-bottom:1px dotted #eee}'
+        '.pp-hist li span{color:#007bff;font-weight:bold}'
+        '.pp-obs{margin-top:8px;border-top:1px solid #eee;padding-top:8px}'
+        '.pp-obs div{max-height:150px;overflow-y:auto;padding:5px;background:#f9f9f9;border-radius:4px;margin-top:5px}'
+        '.pp-obs ul{padding-left:15px;margin:5px 0;font-size:11px}'
+        '.pp-obs li{margin-bottom:2px;padding:2px 0}'
+        '</style>'
+    )
+
+    @staticmethod
+    def create_vehicle_markers(group_sorted, icon_colors: List[str], vehicle_name: str, planos: Tuple,
+                               lazy_popups: bool = False, compact: bool = False) -> List[folium.Marker]:
+        """Marcadores (folium.Marker) dos pontos de um Tipo já ordenado."""
+        return [
+            MapMarkerFactory.build_vehicle_marker(*campos, vehicle_name, lazy_popup=lazy_popups, parada_s=parada,
+                                                  compact=compact)
+            for campos, parada in zip(MapMarkerFactory._iter_vehicle_fields(group_sorted, icon_colors, planos),
+                                      MapMarkerFactory.stop_durations(group_sorted))
+        ]
+
+    @staticmethod
+    def create_vehicle_point_records(group_sorted, icon_colors: List[str], vehicle_name: str, planos: Tuple,
+                                     lazy_popups: bool = False, compact: bool = False) -> List[List]:
+        """Registros compactos dos pontos de um Tipo para a camada de dados (PointDataLayer)."""
+        return [
+            MapMarkerFactory.build_point_record(*campos, vehicle_name, lazy_popup=lazy_popups, parada_s=parada,
+                                                compact=compact)
+            for campos, parada in zip(MapMarkerFactory._iter_vehicle_fields(group_sorted, icon_colors, planos),
+                                      MapMarkerFactory.stop_durations(group_sorted))
+        ]
+
+    @staticmethod
+    def create_popup_records(group_sorted, icon_colors: List[str], planos: Tuple) -> List[List]:
+        """Dados brutos dos popups de um Tipo, no formato de LazyPopupTable.CAMPOS."""
+        return [
+            MapMarkerFactory.build_popup_record(*campos, parada_s=parada)
+            for campos, parada in zip(MapMarkerFactory._iter_vehicle_fields(group_sorted, icon_colors, planos),
+                                      MapMarkerFactory.stop_durations(group_sorted))
+        ]
+
+    @staticmethod
+    def flat_event_columns(df_eventos: pd.DataFrame) -> Tuple[List, List, List]:
+        """Colunas planas de eventos (Data/Hora, Evento, Observações) convertidas uma única vez."""
+        obs = df_eventos['Observações'].tolist() if 'Observações' in df_eventos else [None] * len(df_eventos)
+        return df_eventos['Data/Hora'].tolist(), df_eventos['Evento'].tolist(), obs
+
+    @staticmethod
+    def stop_durations(group_sorted) -> List[float]:
+        """Duração da parada de cada ponto, em segundos (0 fora de parada ou sem detecção de paradas)."""
+        if 'Parada_s' in group_sorted:
+            return group_sorted['Parada_s'].fillna(0.0).tolist()
+        return [0.0] * len(group_sorted)
+
+    @staticmethod
+    def stop_text(horas: List, parada_s: float) -> str:
+        """Texto da linha 'Parada' do popup ('' quando o ponto não é uma parada)."""
+        if not parada_s:
+            return ''
+        texto = format_duration(parada_s)
+        if isinstance(horas, list) and len(horas) > 1:
+            texto += f" ({horas[0].strftime('%d/%m %H:%M')} a {horas[-1].strftime('%d/%m %H:%M')})"
+        return texto
+
+    @staticmethod
+    def _iter_vehicle_fields(group_sorted, icon_colors: List[str], planos: Tuple):
+        """
+        Percorre os pontos de um Tipo devolvendo os campos já normalizados.
+
+        Nome válido e campos de ignição são calculados por coluna (a ignição
+        só tem poucos valores distintos, então é resolvida uma vez por valor);
+        o laço final apenas combina as colunas de cada ponto. Os eventos de cada
+        ponto são fatias ev_inicio:ev_fim das colunas planas de `planos`
+        (ver flat_event_columns).
+        """
+        n = len(group_sorted)
+        nomes = group_sorted['NOME_PESSOA'].map(str).str.strip() if 'NOME_PESSOA' in group_sorted else pd.Series([''] * n)
+        nomes_validos = valid_name_mask(nomes).tolist()
+
+        ign_raw = group_sorted['Ignição'].map(str) if 'Ignição' in group_sorted else pd.Series([''] * n)
+        ign_map = {v: MapMarkerFactory.ignition_fields(v) for v in ign_raw.unique()}
+        ign_campos = [ign_map[v] for v in ign_raw]
+
+        horas_f, eventos_f, obs_f = planos
+        limites = list(zip(group_sorted['ev_inicio'].tolist(), group_sorted['ev_fim'].tolist()))
+        horas_l = (horas_f[a:b] for a, b in limites)
+        eventos_l = (eventos_f[a:b] for a, b in limites)
+        descricoes = (obs_f[a:b] for a, b in limites)
+
+        for i, (lat, lon, horas, eventos, desc, nome, valido, ign, cor) in enumerate(zip(
+                group_sorted['Latitude'].tolist(), group_sorted['Longitude'].tolist(),
+                horas_l, eventos_l, descricoes, nomes.tolist(), nomes_validos, ign_campos, icon_colors)):
+            yield lat, lon, horas, eventos, desc, nome, valido, ign[0], ign[1], i, cor
+
+    @staticmethod
+    def ignition_fields(valor) -> Tuple[str, str]:
+        """Retorna (texto exibido, valor de filtro) da ignição; suporta L/D e texto."""
+        ign_raw = str(valor).strip().upper()
+        if ign_raw == 'L':
+            return 'Ligada', 'ligada'
+        if ign_raw == 'D':
+            return 'Desligada', 'desligada'
+        ign_lower = ign_raw.lower()
+        if 'ligada' in ign_lower or 'on' in ign_lower:
+            return ign_raw, 'ligada'
+        if 'desligada' in ign_lower or 'off' in ign_lower:
+            return ign_raw, 'desligada'
+        return ign_raw, ign_lower
+
     @staticmethod
-    def create_vehicle_marker(row: Dict, idx: int, icon_color: str, vehicle_name: str) -> folium.Marker:
+    def build_vehicle_marker(lat: float, lon: float, horas: List, eventos: List, descricoes: List,
+                             nome_pessoa: str, tem_nome_valido: bool, ign_display: str, ign_filter: str,
+                             idx: int, icon_color: str, vehicle_name: str,
+                             lazy_popup: bool = False, parada_s: float = 0.0,
+                             compact: bool = False) -> folium.Marker:
         """
-        Cria marcador com suporte para Número, Hora, Data/Hora e Nome.
+        Monta o marcador a partir dos campos já normalizados de um ponto.
+        O marcador leva options.pointIdx (posição no Tipo), usado pelo índice de
+        filtro e, com lazy_popup=True, para ligar o popup à tabela de LazyPopupTable.
+        Com compact=True o HTML usa as classes de CSS_COMPACTO, sem espaços extras.
         """
         # Extrair dados do primeiro horário do grupo
-        data_hora = row['Data/Hora'][0] if isinstance(row['Data/Hora'], list) else row['Data/Hora']
+        data_hora = horas[0] if isinstance(horas, list) else horas
         hora_resumida = data_hora.strftime('%H:%M')
         data_hora_completa = data_hora.strftime('%d/%m %H:%M')
 
-        lat, lon = row['Latitude'], row['Longitude']
-        eventos = row['Evento']
-        horas = row['Data/Hora']
-
-        # Tratamento do nome do motorista
-        nome_pessoa = str(row.get('NOME_PESSOA', '')).strip()
-        invalidos = ['nan', 'n/i', 'none', 'null', '', '0']
-        tem_nome_valido = nome_pessoa and nome_pessoa.lower() not in invalidos
         if not tem_nome_valido:
             nome_pessoa = "N/I"
 
-        # CORREÇÃO DA IGNIÇÃO: suporta L/D e texto
-        ign_raw = str(row.get('Ignição', '')).strip().upper()
-        if ign_raw == 'L':
-            ign_display = 'Ligada'
-            ign_filter = 'ligada'
-        elif ign_raw == 'D':
-            ign_display = 'Desligada'
-            ign_filter = 'desligada'
+        # Dados para filtros
+        evento_lista_str = MapMarkerFactory.eventos_filter_str(eventos)
+        # HTML do Marcador - Tamanho padrão para número (22px circular)
+        # CORREÇÃO: Removido o truncamento do nome
+        if compact:
+            marker_html = (
+                f'<div class="marker-circle" id="marker-{idx + 1}" data-idx="{idx + 1}" '
+                f'data-eventos="{evento_lista_str.lower()}" data-ignicao="{ign_filter}" '
+                f'data-veiculo="{vehicle_name.lower()}" data-originalcolor="{icon_color}" '
+                f'data-hasname="{"true" if tem_nome_valido else "false"}" data-isplaying="numero" '
+                f'style="background-color:{icon_color}" onclick="if(window.selectMarker) window.selectMarker({idx + 1})">'
+                f'<span class="m-num">{idx + 1}</span><span class="m-hora">{hora_resumida}</span>'
+                f'<span class="m-data-hora">{data_hora_completa}</span>'
+                f'<span class="m-nome">{html_escape(nome_pessoa)}</span></div>'
+            )
         else:
-            ign_lower = ign_raw.lower()
-            if 'ligada' in ign_lower or 'on' in ign_lower:
-                ign_display = ign_raw
-                ign_filter = 'ligada'
-            elif 'desligada' in ign_lower or 'off' in ign_lower:
-                ign_display = ign_raw
-                ign_filter = 'desligada'
-            else:
-                ign_display = ign_raw
-                ign_filter = ign_lower
-
-        descricoes = row.get('Observações', [])
+            marker_html = MapMarkerFactory._marker_html_completo(
+                idx, evento_lista_str, ign_filter, vehicle_name, icon_color, tem_nome_valido,
+                hora_resumida, data_hora_completa, nome_pessoa)
+
+        popup = None
+        if not lazy_popup:
+            popup_content = MapMarkerFactory.build_popup_html(
+                lat, lon, horas, eventos, descricoes, nome_pessoa, ign_display, idx, icon_color, vehicle_name,
+                parada_s=parada_s, compact=compact
+            )
+            popup = folium.Popup(popup_content, max_width=400)
+
+        marker = folium.map.Marker(
+            location=[lat, lon],
+            icon=DivIcon(
+                icon_size=(250, 22),
+                icon_anchor=(11, 11),
+                html=marker_html
+            ),
+            popup=popup
+        )
+        marker.options['pointIdx'] = idx + 1
+
+        return marker
+
+    @staticmethod
+    def _marker_html_completo(idx: int, evento_lista_str: str, ign_filter: str, vehicle_name: str,
+                              icon_color: str, tem_nome_valido: bool, hora_resumida: str,
+                              data_hora_completa: str, nome_pessoa: str) -> str:
+        """HTML do marcador com todos os estilos inline (modo padrão)."""
+        return f'''
+            <div class="marker-circle" 
+                 id="marker-{idx + 1}"
+                 data-idx="{idx + 1}" 
+                 data-eventos="{evento_lista_str.lower()}"
+                 data-ignicao="{ign_filter}"
+                 data-veiculo="{vehicle_name.lower()}"
+                 data-originalcolor="{icon_color}"
+                 data-hasname="{"true" if tem_nome_valido else "false"}"
+                 data-isplaying="numero"
+                 style="
+                    background-color: {icon_color} !important;
+                    display: flex !important;
+                    justify-content: center !important;
+                    align-items: center !important;
+                    color: white !important;
+                    font-weight: bold !important;
+                    font-size: 10px !important;
+                    border: 2px solid white !important;
+                    box-shadow: 0 0 4px rgba(0,0,0,0.6) !important;
+                    white-space: nowrap !important;
+                    transition: all 0.2s ease;
+                    cursor: pointer;
+                    width: 22px; 
+                    height: 22px; 
+                    border-radius: 50%;
+                    padding: 0 !important;
+                    min-width: auto !important;
+                    box-sizing: border-box;
+                 "
+                 onclick="if(window.selectMarker) window.selectMarker({idx + 1})">
+                <span class="m-num">{idx + 1}</span>
+                <span class="m-hora" style="display:none;">{hora_resumida}</span>
+                <span class="m-data-hora" style="display:none;">{data_hora_completa}</span>
+                <span class="m-nome" style="display:none;">{html_escape(nome_pessoa)}</span>
+            </div>
+        '''
+
+    @staticmethod
+    def build_point_record(lat: float, lon: float, horas: List, eventos: List, descricoes: List,
+                           nome_pessoa: str, tem_nome_valido: bool, ign_display: str, ign_filter: str,
+                           idx: int, icon_color: str, vehicle_name: str, lazy_popup: bool = False,
+                           parada_s: float = 0.0, compact: bool = False) -> List:
+        """Mesmos dados do marcador DivIcon, no formato de PointDataLayer.CAMPOS."""
+        data_hora = horas[0] if isinstance(horas, list) else horas
+        if not tem_nome_valido:
+            nome_pessoa = "N/I"
+
+        popup_content = None
+        if not lazy_popup:
+            popup_content = MapMarkerFactory.build_popup_html(
+                lat, lon, horas, eventos, descricoes, nome_pessoa, ign_display, idx, icon_color, vehicle_name,
+                parada_s=parada_s, compact=compact
+            )
+        return [
+            lat, lon, idx + 1, icon_color,
+            MapMarkerFactory.eventos_filter_str(eventos).lower(), ign_filter,
+            1 if tem_nome_valido else 0,
+            data_hora.strftime('%H:%M'), data_hora.strftime('%d/%m %H:%M'),
+            nome_pessoa, popup_content
+        ]
+
+    @staticmethod
+    def build_popup_record(lat: float, lon: float, horas: List, eventos: List, descricoes: List,
+                           nome_pessoa: str, tem_nome_valido: bool, ign_display: str, ign_filter: str,
+                           idx: int, icon_color: str, parada_s: float = 0.0) -> List:
+        """Campos brutos do popup (sem HTML); o navegador monta o popup no clique."""
+        parada = MapMarkerFactory.stop_text(horas, parada_s)
+        if not horas:
+            horas = []
+        elif not isinstance(horas, list):
+            horas = [horas]
+        return [
+            idx + 1, icon_color,
+            nome_pessoa if tem_nome_valido else "N/I", ign_display,
+            round(float(lat), 6), round(float(lon), 6),
+            [h.strftime('%d/%m/%Y %H:%M:%S') for h in horas],
+            [str(e) for e in (eventos or [])],
+            [str(d) if is_nonempty_desc(d) else '' for d in (descricoes or [])],
+            parada
+        ]
+
+    @staticmethod
+    def build_popup_html(lat: float, lon: float, horas: List, eventos: List, descricoes: List,
+                         nome_pessoa: str, ign_display: str, idx: int, icon_color: str,
+                         vehicle_name: str, parada_s: float = 0.0, compact: bool = False) -> str:
+        """Gera o HTML do popup com histórico de eventos e observações do ponto."""
+        data_hora = horas[0] if isinstance(horas, list) else horas
+        if compact:
+            return MapMarkerFactory._popup_html_compacto(
+                lat, lon, horas, eventos, descricoes, nome_pessoa, ign_display, idx, icon_color,
+                vehicle_name, parada_s)
+
+        parada_linha = ""
+        if parada_s:
+            parada_linha = (f'<tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Parada:</b></td>'
+                            f'<td style="padding: 3px 0;">{MapMarkerFactory.stop_text(horas, parada_s)}</td></tr>')
 
         # Processar histórico e observações para o Popup
         desc_itens = []
@@ -83,7 +342,7 @@ class MapMarkerFactory:
             eventos_html = "".join(eventos_list)
 
         # Popup com scroll vertical e horizontal
-        popup_content = f"""
+        return f"""
         <div style="
             font-family: Arial, sans-serif; 
             font-size: 12px; 
@@ -113,7 +372,7 @@ class MapMarkerFactory:
                 <table style="width: 100%; margin-bottom: 10px; border-collapse: collapse; min-width: 320px;">
                     <tr><td style="color: #666; width: 90px; padding: 3px 0; vertical-align: top;"><b>Motorista:</b></td><td style="padding: 3px 0; word-break: break-word;">{html_escape(nome_pessoa)}</td></tr>
                     <tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Ignição:</b></td><td style="padding: 3px 0;">{html_escape(ign_display)}</td></tr>
-                    <tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Data/Hora:</b></td><td style="padding: 3px 0; white-space: nowrap;">{data_hora.strftime('%d/%m/%Y %H:%M:%S')}</td></tr>
+                    <tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Data/Hora:</b></td><td style="padding: 3px 0; white-space: nowrap;">{data_hora.strftime('%d/%m/%Y %H:%M:%S')}</td></tr>{parada_linha}
                     <tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Coordenadas:</b></td><td style="padding: 3px 0; font-size: 11px; font-family: monospace; white-space: nowrap;">{lat:.6f}, {lon:.6f}</td></tr>
                 </table>
 
@@ -147,60 +406,89 @@ class MapMarkerFactory:
         </div>
         """
 
-        # Dados para filtros
-        evento_lista_str = ','.join(set(map(str, eventos))).replace("'", "").replace('"', "")
+    @staticmethod
+    def _popup_html_compacto(lat: float, lon: float, horas: List, eventos: List, descricoes: List,
+                             nome_pessoa: str, ign_display: str, idx: int, icon_color: str,
+                             vehicle_name: str, parada_s: float = 0.0) -> str:
+        """Mesmo conteúdo de build_popup_html, com as classes de CSS_COMPACTO."""
+        data_hora = horas[0] if isinstance(horas, list) else horas
 
-        # HTML do Marcador - Tamanho padrão para número (22px circular)
-        # CORREÇÃO: Removido o truncamento do nome
-        marker_html = f'''
-            <div class="marker-circle" 
-                 id="marker-{idx + 1}"
-                 data-idx="{idx + 1}" 
-                 data-eventos="{evento_lista_str.lower()}"
-                 data-ignicao="{ign_filter}"
-                 data-veiculo="{vehicle_name.lower()}"
-                 data-originalcolor="{icon_color}"
-                 data-hasname="{"true" if tem_nome_valido else "false"}"
-                 data-isplaying="numero"
-                 style="
-                    background-color: {icon_color} !important;
-                    display: flex !important;
-                    justify-content: center !important;
-                    align-items: center !important;
-                    color: white !important;
-                    font-weight: bold !important;
-                    font-size: 10px !important;
-                    border: 2px solid white !important;
-                    box-shadow: 0 0 4px rgba(0,0,0,0.6) !important;
-                    white-space: nowrap !important;
-                    transition: all 0.2s ease;
-                    cursor: pointer;
-                    width: 22px; 
-                    height: 22px; 
-                    border-radius: 50%;
-                    padding: 0 !important;
-                    min-width: auto !important;
-                    box-sizing: border-box;
-                 "
-                 onclick="if(window.selectMarker) window.selectMarker({idx + 1})">
-                <span class="m-num">{idx + 1}</span>
-                <span class="m-hora" style="display:none;">{hora_resumida}</span>
-                <span class="m-data-hora" style="display:none;">{data_hora_completa}</span>
-                <span class="m-nome" style="display:none;">{html_escape(nome_pessoa)}</span>
-            </div>
-        '''
+        obs = ''.join(f"<li>{h.strftime('%d/%m/%Y %H:%M:%S')} — {html_escape(str(d))}</li>"
+                      for h, d in zip(horas, descricoes) if is_nonempty_desc(d))
+        if obs:
+            obs = f'<div class="pp-obs"><b>Observações:</b><div><ul>{obs}</ul></div></div>'
+        eventos_html = ''
+        if eventos and horas:
+            eventos_html = ''.join(f"<li><span>{h.strftime('%d/%m/%Y %H:%M:%S')}</span>: {html_escape(str(e))}</li>"
+                                   for h, e in zip(horas, eventos))
+        parada = ''
+        if parada_s:
+            parada = f'<tr><td class="r"><b>Parada:</b></td><td>{MapMarkerFactory.stop_text(horas, parada_s)}</td></tr>'
 
-        marker = folium.map.Marker(
-            location=[lat, lon],
-            icon=DivIcon(
-                icon_size=(250, 22),
-                icon_anchor=(11, 11),
-                html=marker_html
-            ),
-            popup=folium.Popup(popup_content, max_width=400)
+        return (
+            f'<div class="pp"><div class="pp-tit" style="background-color:{icon_color}">'
+            f'Ponto #{idx + 1} - {html_escape(vehicle_name)}</div><div class="pp-corpo"><table>'
+            f'<tr><td class="r"><b>Motorista:</b></td><td style="word-break:break-word">{html_escape(nome_pessoa)}</td></tr>'
+            f'<tr><td class="r"><b>Ignição:</b></td><td>{html_escape(ign_display)}</td></tr>'
+            f'<tr><td class="r"><b>Data/Hora:</b></td><td class="nw">{data_hora.strftime("%d/%m/%Y %H:%M:%S")}</td></tr>'
+            f'{parada}'
+            f'<tr><td class="r"><b>Coordenadas:</b></td><td class="mono">{lat:.6f}, {lon:.6f}</td></tr>'
+            f'</table><div class="pp-hist"><b>Histórico de Eventos:</b><ul>{eventos_html}</ul></div>{obs}</div></div>'
         )
 
-        return marker
+    @staticmethod
+    def create_filter_index(group_sorted, icon_colors: List[str], planos: Tuple) -> Dict:
+        """
+        Dados do índice de filtro de um Tipo (ver MarkerFilterIndex).
+
+        Eventos e valores de ignição viram ids locais ao Tipo; os eventos de cada
+        ponto ficam em formato CSR (evInicio/evIds), convertidos em bitsets no navegador.
+        """
+        eventos_ids, ignicao_ids = {}, {}
+        ev_inicio, ev_ids, ign_codes = [0], [], []
+        for campos in MapMarkerFactory._iter_vehicle_fields(group_sorted, icon_colors, planos):
+            eventos, ign_filter = campos[3], campos[8]
+            nomes = {str(e).replace("'", "").replace('"', "").lower() for e in eventos}
+            ev_ids.extend(sorted(eventos_ids.setdefault(nome, len(eventos_ids)) for nome in nomes))
+            ev_inicio.append(len(ev_ids))
+            ign_codes.append(ignicao_ids.setdefault(ign_filter, len(ignicao_ids)))
+        return {
+            'eventos': list(eventos_ids),
+            'evInicio': ev_inicio,
+            'evIds': ev_ids,
+            'ignicoes': list(ignicao_ids),
+            'ign': ign_codes,
+            'cores': list(icon_colors),
+        }
+
+    @staticmethod
+    def eventos_filter_str(eventos: List) -> str:
+        """Lista de eventos do ponto no formato usado pelo filtro (data-eventos)."""
+        return ','.join(set(map(str, eventos))).replace("'", "").replace('"', "")
+
+    @staticmethod
+    def create_vehicle_cluster(vehicle_name: str, base_color: str, options: Dict) -> MarkerCluster:
+        """
+        MarkerCluster de um Tipo. O ícone do agrupamento mostra a quantidade de
+        pontos na cor do Tipo (window.clusterColors, atualizada pelo seletor de cores).
+        """
+        tipo = vehicle_name.lower()
+        icon_js = f"""
+            function(cluster) {{
+                var cor = (window.clusterColors || {{}})[{json.dumps(tipo)}] || {json.dumps(base_color)};
+                var n = cluster.getChildCount();
+                var tam = n < 100 ? 28 : (n < 1000 ? 34 : 40);
+                return L.divIcon({{
+                    html: '<div style="background:' + cor + '; color: white; font-weight: bold; font-size: 11px; ' +
+                          'width: ' + tam + 'px; height: ' + tam + 'px; line-height: ' + tam + 'px; border-radius: 50%; ' +
+                          'text-align: center; border: 2px solid white; box-shadow: 0 0 4px rgba(0,0,0,0.6);">' + n + '</div>',
+                    className: 'vehicle-cluster',
+                    iconSize: L.point(tam, tam)
+                }});
+            }}
+        """
+        cluster_options = dict(options, vehicleType=tipo)
+        return MarkerCluster(control=False, icon_create_function=icon_js, options=cluster_options)
 
     @staticmethod
     def create_kmz_marker(ponto_info: Dict, i: int, color: str) -> folium.Marker:
@@ -238,6 +526,280 @@ class MapMarkerFactory:
         return marker
 
 
+    @staticmethod
+    def create_checkpoint_records(pontos_info: List[Dict]) -> Tuple[List[List], Dict[str, str]]:
+        """
+        Registros dos checkpoints KMZ para o CheckpointDataLayer e os clientes
+        encontrados ({chave normalizada: nome exibido}, na ordem do arquivo).
+        """
+        registros = []
+        clientes = {}
+        for i, ponto in enumerate(pontos_info, start=1):
+            nome = (ponto.get('name') or f'CP {i}').strip()
+            chave = normalize_string(nome)
+            clientes.setdefault(chave, nome)
+            registros.append([round(float(ponto['lat']), 6), round(float(ponto['lon']), 6), i, nome, chave,
+                              ponto.get('address') or '', ponto.get('valor_fmt') or ''])
+        return registros, clientes
+
+class PointDataLayer(MacroElement):
+    """
+    Todos os pontos de um Tipo em um único array JSON, desenhados no navegador
+    como L.circleMarker sobre um renderer canvas compartilhado.
+
+    Substitui um folium.Marker + DivIcon por ponto: o HTML cresce apenas com os
+    dados e o Leaflet não cria um nó DOM por ponto. Estilo, rótulo e filtros são
+    aplicados a partir dos registros em window.dataPoints / window.dataPointsByTipo.
+    Deve ser adicionado ao FeatureGroup do Tipo. window.dataPointsByTipo[tipo] guarda
+    só os pontos da última camada do Tipo: LazyPopupTable e MarkerFilterIndex do mesmo
+    lote, renderizados logo depois, usam exatamente esses pontos (com índices 1..n).
+    """
+
+    # 'popup' é None quando os popups são montados sob demanda (LazyPopupTable)
+    CAMPOS = ('lat', 'lon', 'idx', 'cor', 'eventos', 'ignicao', 'tem_nome',
+              'hora', 'data_hora', 'nome', 'popup')
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var grupo = {{ this._parent.get_name() }};
+            var tipo = {{ this.tipo|tojson }};
+            var pontos = {{ this.pontos|tojson }};
+
+            window.dataPoints = window.dataPoints || [];
+            window.dataPointsByTipo = window.dataPointsByTipo || {};
+            window.pointCanvasRenderer = window.pointCanvasRenderer || L.canvas({ padding: 0.5 });
+            window.dataPointLabel = window.dataPointLabel || function(ponto) {
+                var tipoLabel = window.currentFilters ? window.currentFilters.labelType : 'numero';
+                if (tipoLabel === 'hora') return ponto.hora;
+                if (tipoLabel === 'datahora') return ponto.dataHora;
+                if (tipoLabel === 'nome' && ponto.hasName) return ponto.nome;
+                return String(ponto.idx);
+            };
+
+            var lista = window.dataPointsByTipo[tipo] = [];
+            pontos.forEach(function(p) {
+                var ponto = {
+                    tipo: tipo, idx: p[2], color: p[3], eventos: p[4], ignicao: p[5],
+                    hasName: p[6] === 1, hora: p[7], dataHora: p[8], nome: p[9],
+                    grupo: grupo, visivel: true, destaque: false
+                };
+                ponto.layer = L.circleMarker([p[0], p[1]], {
+                    renderer: window.pointCanvasRenderer,
+                    radius: 8, color: 'white', weight: 2,
+                    fillColor: p[3], fillOpacity: 1
+                });
+                ponto.layer.bindTooltip(function() {
+                    return window.dataPointLabel(ponto);
+                }, { direction: 'top' });
+                if (p[10]) ponto.layer.bindPopup(p[10], { maxWidth: 400 });
+                grupo.addLayer(ponto.layer);
+                lista.push(ponto);
+                window.dataPoints.push(ponto);
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, tipo: str, pontos: List[List]):
+        super().__init__()
+        self._name = 'PointDataLayer'
+        self.tipo = tipo.lower()
+        self.pontos = pontos
+
+
+class LazyPopupTable(MacroElement):
+    """
+    Tabela compartilhada com os dados brutos dos popups de um Tipo.
+
+    Em vez de um popup HTML pré-renderizado por ponto (~3 KB cada), o mapa leva
+    apenas horários, eventos, observações, motorista e ignição; o HTML é montado
+    por window.buildPointPopup quando o ponto é clicado. Deve ser adicionado ao
+    FeatureGroup do Tipo depois dos marcadores (ou do PointDataLayer).
+    """
+
+    # 'parada': duração e intervalo da parada ('' quando o ponto não é uma parada)
+    CAMPOS = ('idx', 'cor', 'nome', 'ignicao', 'lat', 'lon', 'horas', 'eventos', 'observacoes', 'parada')
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var grupo = {{ this._parent.get_name() }};
+            var tipo = {{ this.tipo|tojson }};
+            var nomeTipo = {{ this.nome_tipo|tojson }};
+            var tabela = {{ this.registros|tojson }};
+
+            window.escapeHtml = window.escapeHtml || function(s) {
+                return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+                    .replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+            };
+
+            window.buildPointPopup = window.buildPointPopup || function(r, nomeTipo) {
+                var esc = window.escapeHtml;
+                var eventosHtml = '';
+                var obsHtml = '';
+                for (var i = 0; i < r[6].length; i++) {
+                    if (i < r[7].length) {
+                        eventosHtml += "<li style='margin-bottom: 3px; padding: 2px 0; border-bottom: 1px dotted #eee;'>" +
+                            "<span style='color: #007bff; font-weight: bold;'>" + r[6][i] + "</span>: " + esc(r[7][i]) + "</li>";
+                    }
+                    if (r[8][i]) {
+                        obsHtml += "<li style='margin-bottom:2px; padding: 2px 0;'>" + r[6][i] + " — " + esc(r[8][i]) + "</li>";
+                    }
+                }
+                if (obsHtml) {
+                    obsHtml = '<div style="margin-top:8px; border-top: 1px solid #eee; padding-top: 8px;"><b>Observações:</b>' +
+                        '<div style="max-height: 150px; overflow-y: auto; padding: 5px; background: #f9f9f9; border-radius: 4px; margin-top: 5px;">' +
+                        '<ul style="padding-left: 15px; margin: 5px 0; font-size: 11px;">' + obsHtml + '</ul></div></div>';
+                }
+                return '<div style="font-family: Arial, sans-serif; font-size: 12px; width: 340px; max-height: 450px; overflow: auto; color: #333; padding-right: 5px; box-sizing: border-box;">' +
+                    '<div style="background-color: ' + r[1] + '; color: white; padding: 8px; border-radius: 4px 4px 0 0; font-weight: bold; text-align: center; margin-bottom: 10px; position: sticky; top: 0; z-index: 10;">' +
+                    'Ponto #' + r[0] + ' - ' + esc(nomeTipo) + '</div>' +
+                    '<div style="padding: 0 5px;"><table style="width: 100%; margin-bottom: 10px; border-collapse: collapse; min-width: 320px;">' +
+                    '<tr><td style="color: #666; width: 90px; padding: 3px 0; vertical-align: top;"><b>Motorista:</b></td><td style="padding: 3px 0; word-break: break-word;">' + esc(r[2]) + '</td></tr>' +
+                    '<tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Ignição:</b></td><td style="padding: 3px 0;">' + esc(r[3]) + '</td></tr>' +
+                    '<tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Data/Hora:</b></td><td style="padding: 3px 0; white-space: nowrap;">' + (r[6][0] || '') + '</td></tr>' +
+                    (r[9] ? '<tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Parada:</b></td><td style="padding: 3px 0;">' + esc(r[9]) + '</td></tr>' : '') +
+                    '<tr><td style="color: #666; padding: 3px 0; vertical-align: top;"><b>Coordenadas:</b></td><td style="padding: 3px 0; font-size: 11px; font-family: monospace; white-space: nowrap;">' + r[4].toFixed(6) + ', ' + r[5].toFixed(6) + '</td></tr>' +
+                    '</table>' +
+                    '<div style="max-height: 200px; overflow-y: auto; overflow-x: auto; padding: 8px; background: #f9f9f9; border-radius: 4px; border: 1px solid #eee; margin-top: 10px; min-width: 320px;">' +
+                    '<div style="font-weight: bold; margin-bottom: 8px; color: #555; font-size: 11px; position: sticky; top: 0; background: #f9f9f9; padding: 2px 0;">Histórico de Eventos:</div>' +
+                    '<ul style="padding-left: 15px; margin: 0; list-style: none; font-size: 11px; min-width: 300px;">' + eventosHtml + '</ul></div>' +
+                    obsHtml + '</div></div>';
+            };
+
+            var ligarPopup = function(layer, registro) {
+                layer.bindPopup(function() {
+                    return window.buildPointPopup(registro, nomeTipo);
+                }, { maxWidth: 400 });
+            };
+
+            // Modo DivIcon: marcadores do grupo (ou do MarkerCluster dentro dele) trazem options.pointIdx;
+            // os que já têm tabela são de um lote anterior do mesmo Tipo (outro add_vehicle_data)
+            var percorrer = function(camada) {
+                camada.eachLayer(function(layer) {
+                    if (layer.options && layer.options.pointIdx) {
+                        if (layer._tabelaPopup) return;
+                        layer._tabelaPopup = true;
+                        ligarPopup(layer, tabela[layer.options.pointIdx - 1]);
+                    } else if (layer.eachLayer) {
+                        percorrer(layer);
+                    }
+                });
+            };
+            percorrer(grupo);
+            // Modo canvas: pontos registrados pelo PointDataLayer
+            ((window.dataPointsByTipo || {})[tipo] || []).forEach(function(ponto) {
+                ligarPopup(ponto.layer, tabela[ponto.idx - 1]);
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, tipo: str, registros: List[List]):
+        super().__init__()
+        self._name = 'LazyPopupTable'
+        self.tipo = tipo.lower()
+        self.nome_tipo = tipo
+        self.registros = registros
+
+
+class MarkerFilterIndex(MacroElement):
+    """
+    Registra os pontos de um Tipo no índice de filtro do navegador
+    (window.registrarIndiceFiltro, definido em FilterManager.build_filter_js).
+
+    O índice guarda sequência, ignição e eventos em arrays tipados, além da
+    camada Leaflet de cada ponto, para que filterMarkers não precise varrer o DOM.
+    Deve ser adicionado ao FeatureGroup do Tipo depois dos marcadores (ou do PointDataLayer).
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        if (window.registrarIndiceFiltro) {
+            window.registrarIndiceFiltro({{ this.tipo|tojson }}, {{ this.dados|tojson }}, {{ this._parent.get_name() }});
+        }
+        {% endmacro %}
+    """)
+
+    def __init__(self, tipo: str, dados: Dict):
+        super().__init__()
+        self._name = 'MarkerFilterIndex'
+        self.tipo = tipo.lower()
+        self.dados = dados
+
+
+class CheckpointDataLayer(MacroElement):
+    """
+    Checkpoints do KMZ (pontos de entrega dos clientes) em um único array JSON,
+    desenhados como L.circleMarker num renderer canvas próprio.
+
+    Cada checkpoint entra em window.kmzIndex pela chave normalizada do cliente
+    (data-clientkey), de modo que o filtro de cliente (window.filterKmzCliente)
+    é uma consulta direta ao índice e só altera os checkpoints envolvidos.
+    Deve ser adicionado ao FeatureGroup dos checkpoints.
+    """
+
+    CAMPOS = ('lat', 'lon', 'numero', 'nome', 'clientkey', 'endereco', 'valor')
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var grupo = {{ this._parent.get_name() }};
+            var cor = {{ this.cor|tojson }};
+            var pontos = {{ this.pontos|tojson }};
+            var mapa = {{ this._parent._parent.get_name() }};
+
+            window.kmzIndex = window.kmzIndex || {};
+            window.kmzSelecionados = window.kmzSelecionados || [];
+            window.kmzCanvasRenderer = window.kmzCanvasRenderer || L.canvas({ padding: 0.5 });
+            window.escapeHtml = window.escapeHtml || function(s) {
+                return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+                    .replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+            };
+
+            pontos.forEach(function(p) {
+                var cp = {
+                    numero: p[2], nome: p[3], clientkey: p[4], endereco: p[5], valor: p[6],
+                    estilo: { radius: 7, color: 'white', weight: 1.5, fillColor: cor, fillOpacity: 1 }
+                };
+                cp.layer = L.circleMarker([p[0], p[1]], L.extend({ renderer: window.kmzCanvasRenderer }, cp.estilo));
+                cp.layer.bindTooltip(String(cp.numero), { direction: 'top' });
+                cp.layer.bindPopup(function() {
+                    var esc = window.escapeHtml;
+                    return '<b>Checkpoint:</b> ' + esc(cp.nome) +
+                        (cp.endereco ? '<br><b>Endereço:</b> ' + esc(cp.endereco) : '') +
+                        (cp.valor ? '<br><b>Valor:</b> ' + esc(cp.valor) : '');
+                }, { maxWidth: 200 });
+                grupo.addLayer(cp.layer);
+                (window.kmzIndex[cp.clientkey] = window.kmzIndex[cp.clientkey] || []).push(cp);
+            });
+
+            // Destaca os checkpoints de um cliente (chave normalizada; '' limpa a seleção).
+            // Só os checkpoints da seleção anterior e da nova são alterados.
+            window.filterKmzCliente = window.filterKmzCliente || function(chave) {
+                window.kmzSelecionados.forEach(function(cp) { cp.layer.setStyle(cp.estilo); });
+                window.kmzSelecionados = (chave && window.kmzIndex[chave]) || [];
+                if (!window.kmzSelecionados.length) return;
+                var limites = L.latLngBounds([]);
+                window.kmzSelecionados.forEach(function(cp) {
+                    cp.layer.setStyle({ radius: 11, color: 'yellow', weight: 4 });
+                    cp.layer.bringToFront();
+                    limites.extend(cp.layer.getLatLng());
+                });
+                mapa.fitBounds(limites, { maxZoom: 16, padding: [40, 40] });
+            };
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, pontos: List[List], cor: str):
+        super().__init__()
+        self._name = 'CheckpointDataLayer'
+        self.pontos = pontos
+        self.cor = cor
+
+
 class MapControls:
     @staticmethod
     def add_measure_control(mapa: folium.Map) -> None:
@@ -0,0 +1,193 @@
+"""
+Etapas do gerador de mapas sem interface: planilha -> dados agrupados -> mapa HTML.
+Usadas pela tela (run_gerador_mapas.py) e pelo modo em lote (gerar_mapas_cli.py).
+"""
+import os
+import gzip
+import base64
+import time
+import folium
+from typing import Dict, List, Optional
+
+from data_parsers import ExcelParser, KMZParser
+from dataset_cache import DatasetCache
+from geofence import GeofenceEngine, apply_visit_events, save_visits_table, visits_table_path
+from route_deviation import RouteDeviationAnalyzer, save_deviation_table, deviation_table_path
+from map_builder import MapBuilder
+from ui_helpers import default_color_mapping
+
+# Planilhas acima deste tamanho são lidas em lotes
+STREAMING_MIN_BYTES = 20 * 1024 * 1024
+# Formatos de saída comprimida: .html.gz ou um .html que se descomprime no navegador
+COMPRESSOES = ('gzip', 'autoextraivel')
+
+# Página mínima que descomprime (DecompressionStream) e escreve o mapa original
+_HTML_AUTOEXTRAIVEL = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Mapa</title></head><body>
+<p id="aviso" style="font-family:Arial,sans-serif">Carregando o mapa...</p>
+<script>
+(function() {
+    if (!window.DecompressionStream) {
+        document.getElementById('aviso').textContent = 'Navegador sem suporte a arquivos comprimidos; atualize-o para abrir este mapa.';
+        return;
+    }
+    var bin = atob('__DADOS__');
+    var bytes = new Uint8Array(bin.length);
+    for (var i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    var fluxo = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+    new Response(fluxo).text().then(function(html) {
+        document.open();
+        document.write(html);
+        document.close();
+    });
+})();
+</script>
+</body></html>
+"""
+
+
+def load_dataset(excel_path: str, cache: Optional[DatasetCache] = None, **parse_options) -> ExcelParser:
+    """
+    Lê e agrupa a planilha (ou recupera do cache); retorna o parser já processado.
+    parse_options vão para o ExcelParser (junção de posições, paradas e filtros de leitura).
+    """
+    streaming = os.path.getsize(excel_path) > STREAMING_MIN_BYTES
+    excel_parser = ExcelParser(excel_path, streaming=streaming, cache=cache, **parse_options)
+    excel_parser.parse()
+    return excel_parser
+
+
+def load_kmz(kmz_path: str) -> KMZParser:
+    """Lê os checkpoints e a rota planejada de um KML/KMZ; retorna o parser já processado."""
+    kmz_parser = KMZParser()
+    kmz_parser.parse(kmz_path)
+    return kmz_parser
+
+
+def resolve_colors(tipos, mapeamento_cores: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Paleta padrão para todos os Tipos, sobrescrita pelas cores informadas
+    (nome do Tipo sem diferenciar maiúsculas/minúsculas).
+    """
+    cores = default_color_mapping(tipos)
+    if mapeamento_cores:
+        informadas = {str(k).strip().lower(): v for k, v in mapeamento_cores.items()}
+        for tipo in cores:
+            if tipo.lower() in informadas:
+                cores[tipo] = informadas[tipo.lower()]
+    return cores
+
+
+def build_map(excel_parser: ExcelParser, mapeamento_cores: Dict[str, str],
+              recursos_faltando: Optional[List[str]] = None, kmz_parser: Optional[KMZParser] = None,
+              desvios=None, **map_options) -> folium.Map:
+    """
+    Monta o mapa completo (pontos, filtros, trajetos) a partir do parser processado.
+    Com offline_assets, as URLs que não puderam ser embutidas vão para recursos_faltando.
+    kmz_parser (load_kmz) acrescenta os checkpoints dos clientes e a rota planejada;
+    desvios (RouteDeviationAnalyzer.analyze), os trechos fora da rota.
+    """
+    map_builder = MapBuilder(excel_parser.get_center_location(), **map_options)
+    map_builder.add_vehicle_data(excel_parser.df_grouped, mapeamento_cores, excel_parser.df_eventos)
+    if kmz_parser is not None:
+        map_builder.add_kmz_checkpoints(kmz_parser.pontos_info, kmz_parser.linhas)
+    map_builder.add_route_deviations(desvios)
+    map_builder.add_filter_system(excel_parser.get_unique_events(), excel_parser.get_unique_types())
+    mapa = map_builder.finalize()
+    if recursos_faltando is not None:
+        recursos_faltando.extend(map_builder.assets_missing)
+    return mapa
+
+
+def save_map(mapa: folium.Map, output_path: str, compressao: Optional[str] = None) -> str:
+    """
+    Salva o mapa; com compressao='gzip' grava output_path + '.gz' e com
+    'autoextraivel' grava um HTML que contém o mapa comprimido e se expande ao abrir.
+    Retorna o caminho efetivamente gravado.
+    """
+    if compressao is None:
+        mapa.save(output_path)
+        return output_path
+    if compressao not in COMPRESSOES:
+        raise ValueError(f"compressao inválida: {compressao!r} (use {', '.join(COMPRESSOES)})")
+
+    comprimido = gzip.compress(mapa.get_root().render().encode('utf-8'), compresslevel=9)
+    if compressao == 'gzip':
+        caminho = output_path if output_path.lower().endswith('.gz') else output_path + '.gz'
+        with open(caminho, 'wb') as f:
+            f.write(comprimido)
+        return caminho
+
+    dados = base64.b64encode(comprimido).decode('ascii')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(_HTML_AUTOEXTRAIVEL.replace('__DADOS__', dados))
+    return output_path
+
+
+def default_output_name(excel_path: str) -> str:
+    """Nome padrão do HTML gerado para uma planilha."""
+    return f"Mapa_{os.path.splitext(os.path.basename(excel_path))[0]}.html"
+
+
+def generate_map(excel_path: str, output_path: str, mapeamento_cores: Optional[Dict[str, str]] = None,
+                 cache: Optional[DatasetCache] = None, parse_options: Optional[Dict] = None,
+                 compressao: Optional[str] = None, kmz_path: Optional[str] = None,
+                 geofence_m: float = 0.0, deviation_m: float = 0.0, geofence_gap_s: Optional[float] = None,
+                 **map_options) -> Dict:
+    """
+    Gera o mapa de uma planilha sem nenhuma interação e salva em output_path
+    (ver save_map para a compressão). Tipos sem cor informada recebem a paleta padrão.
+    kmz_path: KML/KMZ com os checkpoints dos clientes e a rota planejada (opcional).
+    geofence_m: com kmz_path, registra as passagens a até geofence_m metros de cada
+    checkpoint como eventos do mapa e grava a tabela de visitas ao lado do HTML;
+    geofence_gap_s é o tempo fora do raio que ainda não encerra uma visita
+    (None = GeofenceEngine.INTERVALO_PADRAO_S).
+    deviation_m: com kmz_path, destaca os trechos a mais de deviation_m metros da
+    rota planejada e grava a tabela de desvios ao lado do HTML.
+    """
+    t0 = time.perf_counter()
+    excel_parser = load_dataset(excel_path, cache, **(parse_options or {}))
+    kmz_parser = load_kmz(kmz_path) if kmz_path else None
+    t1 = time.perf_counter()
+    visitas = None
+    desvios = None
+    if kmz_parser is not None and (geofence_m > 0 or deviation_m > 0):
+        # Leituras tiradas uma vez, antes de os eventos de visita entrarem em df_eventos
+        leituras = excel_parser.get_readings()
+        if geofence_m > 0:
+            visitas = GeofenceEngine(kmz_parser.pontos_info, geofence_m, geofence_gap_s).match(leituras)
+        if kmz_parser.linhas and deviation_m > 0:
+            _, desvios = RouteDeviationAnalyzer(kmz_parser.linhas, deviation_m).analyze(leituras)
+        if visitas is not None:
+            apply_visit_events(excel_parser, visitas)
+    cores = resolve_colors(excel_parser.get_unique_types(), mapeamento_cores)
+    recursos_faltando = []
+    mapa_final = build_map(excel_parser, cores, recursos_faltando, kmz_parser, desvios, **map_options)
+    t2 = time.perf_counter()
+
+    pasta = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(pasta, exist_ok=True)
+    output_path = save_map(mapa_final, output_path, compressao)
+    tabela_visitas = save_visits_table(visitas, visits_table_path(output_path)) if visitas is not None else None
+    tabela_desvios = save_deviation_table(desvios, deviation_table_path(output_path)) if desvios is not None else None
+    t3 = time.perf_counter()
+
+    return {
+        'arquivo': excel_path,
+        'saida': output_path,
+        'bytes': os.path.getsize(output_path),
+        'pontos': len(excel_parser.df_grouped),
+        'tipos': len(cores),
+        'from_cache': excel_parser.from_cache,
+        'datetime_fallback_rows': excel_parser.datetime_fallback_rows,
+        'filtered_out_rows': excel_parser.filtered_out_rows,
+        'checkpoints': len(kmz_parser.pontos_info) if kmz_parser else 0,
+        'visitas': len(visitas) if visitas is not None else 0,
+        'tabela_visitas': tabela_visitas,
+        'desvios': len(desvios) if desvios is not None else 0,
+        'tabela_desvios': tabela_desvios,
+        # JS/CSS que continuaram apontando para a CDN (modo offline sem cópia local)
+        'recursos_faltando': recursos_faltando,
+        # Tempos por etapa, em segundos
+        'tempos': {'leitura': t1 - t0, 'mapa': t2 - t1, 'salvar': t3 - t2, 'total': t3 - t0},
+    }
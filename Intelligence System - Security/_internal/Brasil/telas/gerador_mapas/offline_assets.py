@@ -0,0 +1,152 @@
+"""
+Recursos do mapa (JS/CSS do Leaflet, plugins e fontes) embutidos no próprio HTML,
+para abrir o mapa sem acesso às CDNs.
+"""
+import os
+import re
+import base64
+import hashlib
+import mimetypes
+import urllib.request
+from urllib.parse import urljoin, urlparse
+from typing import Dict, List, Optional
+
+import folium
+
+
+class AssetCache:
+    """
+    Cópia local dos arquivos das CDNs usados pelo folium, um arquivo por URL.
+
+    Com acesso à internet, os arquivos ausentes são baixados na primeira vez;
+    depois disso o mapa é gerado e aberto sem rede.
+    """
+
+    TIMEOUT_S = 20
+
+    def __init__(self, cache_dir: Optional[str] = None, permitir_download: bool = True):
+        if cache_dir is None:
+            base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+            cache_dir = os.path.join(base, 'gerador_mapas', 'recursos')
+        self.cache_dir = cache_dir
+        self.permitir_download = permitir_download
+        self._memoria: Dict[str, Optional[bytes]] = {}
+
+    def path_for(self, url: str) -> str:
+        """Arquivo local da URL (hash da URL + nome original, para facilitar a conferência)."""
+        nome = os.path.basename(urlparse(url).path) or 'recurso'
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}_{nome}")
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Conteúdo da URL a partir do cache local, baixando se permitido; None se indisponível."""
+        if url in self._memoria:
+            return self._memoria[url]
+        caminho = self.path_for(url)
+        conteudo = None
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as f:
+                conteudo = f.read()
+        elif self.permitir_download:
+            try:
+                with urllib.request.urlopen(url, timeout=self.TIMEOUT_S) as resposta:
+                    conteudo = resposta.read()
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temporario = f"{caminho}.{os.getpid()}.tmp"
+                with open(temporario, 'wb') as f:
+                    f.write(conteudo)
+                os.replace(temporario, caminho)
+            except Exception:
+                conteudo = None
+        self._memoria[url] = conteudo
+        return conteudo
+
+
+def _absoluta(url: str) -> str:
+    return 'https:' + url if url.startswith('//') else url
+
+
+def _data_uri(conteudo: bytes, url: str, tipo: Optional[str] = None) -> str:
+    tipo = tipo or mimetypes.guess_type(urlparse(url).path)[0] or 'application/octet-stream'
+    return f"data:{tipo};base64,{base64.b64encode(conteudo).decode('ascii')}"
+
+
+# url(...) dentro do CSS, com ou sem aspas
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+# Declaração src: de um @font-face
+_FONT_SRC = re.compile(r'src\s*:\s*([^;}]*)')
+
+
+def _somente_woff2(css: str) -> str:
+    """Nos @font-face com várias opções de formato, mantém só o woff2 (suportado por todos os navegadores atuais)."""
+    def trocar(m):
+        opcoes = [o.strip() for o in m.group(1).split(',')]
+        woff2 = [o for o in opcoes if 'woff2' in o]
+        return f"src:{','.join(woff2)}" if woff2 and len(woff2) < len(opcoes) else m.group(0)
+    return _FONT_SRC.sub(trocar, css)
+
+
+def _embutir_css(css: bytes, url_css: str, cache: AssetCache, faltando: List[str]) -> bytes:
+    """Troca as referências url(...) do CSS (imagens, fontes) por data URIs."""
+    texto = _somente_woff2(css.decode('utf-8', errors='replace'))
+
+    def trocar(m):
+        ref = m.group(2).strip()
+        if ref.startswith(('data:', '#')):
+            return m.group(0)
+        url = _absoluta(urljoin(url_css, ref))
+        conteudo = cache.get(url.split('#')[0])
+        if conteudo is None:
+            faltando.append(url)
+            return m.group(0)
+        return f'url("{_data_uri(conteudo, url)}")'
+
+    return _CSS_URL.sub(trocar, texto).encode('utf-8')
+
+
+def _percorrer(elemento):
+    yield elemento
+    for filho in list(elemento._children.values()):
+        yield from _percorrer(filho)
+
+
+def embed_assets(mapa: folium.Map, cache: Optional[AssetCache] = None) -> List[str]:
+    """
+    Troca os links de JS/CSS de todos os elementos do mapa (default_js /
+    default_css) por data URIs com o conteúdo do cache local; o HTML salvo não
+    faz nenhuma requisição a CDNs. Deve ser chamado depois de todos os elementos
+    terem sido adicionados. Retorna as URLs que não puderam ser obtidas (essas
+    continuam apontando para a CDN).
+    """
+    cache = cache or AssetCache()
+    faltando: List[str] = []
+    convertidos: Dict[str, str] = {}
+
+    def converter(url: str, tipo: str) -> str:
+        if url.startswith('data:'):
+            return url
+        if url not in convertidos:
+            absoluta = _absoluta(url)
+            conteudo = cache.get(absoluta)
+            if conteudo is None:
+                faltando.append(absoluta)
+                convertidos[url] = url
+            else:
+                if tipo == 'text/css':
+                    conteudo = _embutir_css(conteudo, absoluta, cache, faltando)
+                convertidos[url] = _data_uri(conteudo, absoluta, tipo)
+        return convertidos[url]
+
+    for elemento in _percorrer(mapa):
+        if getattr(elemento, 'default_js', None):
+            elemento.default_js = [(nome, converter(url, 'text/javascript')) for nome, url in elemento.default_js]
+        if getattr(elemento, 'default_css', None):
+            elemento.default_css = [(nome, converter(url, 'text/css')) for nome, url in elemento.default_css]
+    return faltando
+
+
+def local_tiles_url(pasta: str, extensao: str = 'png') -> str:
+    """URL de tiles para uma pasta local no formato {z}/{x}/{y}.<extensao> (file://)."""
+    caminho = os.path.abspath(pasta).replace(os.sep, '/')
+    if not caminho.startswith('/'):
+        caminho = '/' + caminho  # C:/... -> /C:/...
+    return f"file://{caminho}/{{z}}/{{x}}/{{y}}.{extensao}"
@@ -0,0 +1,162 @@
+"""
+Desvios do trajeto real (planilha) em relação à rota planejada do KMZ.
+
+A rota é quebrada em segmentos curtos (no máximo SEGMENTO_MAX_M) indexados
+pelo ponto médio num cKDTree; a distância exata de cada leitura é calculada
+só contra os segmentos candidatos que o índice devolve.
+"""
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from trajectory_processing import sphere_xyz
+from ui_helpers import format_duration
+
+
+class RouteDeviationAnalyzer:
+    """
+    Distância de cada leitura à rota planejada (LineStrings do KMZParser) e os
+    trechos fora da rota: leituras consecutivas do mesmo Tipo a mais de limite_m metros.
+    """
+
+    LIMITE_PADRAO_M = 200.0
+    # Comprimento máximo dos segmentos indexados: o ponto médio fica a no máximo
+    # metade disso de qualquer ponto do segmento
+    SEGMENTO_MAX_M = 50.0
+    # Vizinhos consultados por leitura (dobrado só para as leituras que precisarem)
+    VIZINHOS = 4
+    # Leituras processadas por vez (limita a memória dos candidatos)
+    BLOCO = 100000
+    COLUNAS = ('Tipo', 'Início', 'Fim', 'Duracao_s', 'Leituras', 'Distancia_max_m')
+
+    def __init__(self, linhas: List[np.ndarray], limite_m: float = LIMITE_PADRAO_M):
+        self.limite_m = float(limite_m)
+        self.seg_inicio, self.seg_fim = self._segmentos(linhas, self.SEGMENTO_MAX_M)
+        self.seg_vetor = self.seg_fim - self.seg_inicio
+        self.seg_comp2 = np.einsum('ij,ij->i', self.seg_vetor, self.seg_vetor)
+        # Maior distância entre o ponto médio e um ponto qualquer do próprio segmento
+        self.meio_max = float(np.sqrt(self.seg_comp2.max()) / 2) if len(self.seg_comp2) else 0.0
+        self.arvore = cKDTree(self.seg_inicio + self.seg_vetor / 2) if len(self.seg_inicio) else None
+
+    @staticmethod
+    def _segmentos(linhas: List[np.ndarray], passo_m: float):
+        """Segmentos (início, fim) em xyz de cada LineString, subdivididos a cada passo_m."""
+        inicios, fins = [], []
+        for linha in linhas:
+            if len(linha) < 2:
+                continue
+            xyz = sphere_xyz(linha[:, 0], linha[:, 1])
+            a, b = xyz[:-1], xyz[1:]
+            partes = np.maximum(np.ceil(np.linalg.norm(b - a, axis=1) / passo_m), 1).astype(np.int64)
+            seg = np.repeat(np.arange(len(a)), partes)
+            j = np.arange(len(seg)) - np.repeat(np.cumsum(partes) - partes, partes)
+            t0 = (j / partes[seg])[:, None]
+            t1 = ((j + 1) / partes[seg])[:, None]
+            inicios.append(a[seg] + (b - a)[seg] * t0)
+            fins.append(a[seg] + (b - a)[seg] * t1)
+        if not inicios:
+            return np.empty((0, 3)), np.empty((0, 3))
+        return np.concatenate(inicios), np.concatenate(fins)
+
+    def distances(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Distância em metros de cada (lat, lon) ao segmento de rota mais próximo (inf sem rota)."""
+        n = len(lat)
+        dist = np.full(n, np.inf)
+        if self.arvore is None or n == 0:
+            return dist
+        xyz = sphere_xyz(lat, lon)
+        for bloco in range(0, n, self.BLOCO):
+            pendentes = np.arange(bloco, min(bloco + self.BLOCO, n))
+            k = min(self.VIZINHOS, len(self.seg_inicio))
+            while len(pendentes):
+                d_medio, idx = self.arvore.query(xyz[pendentes], k=k, workers=-1)
+                d_medio, idx = d_medio.reshape(len(pendentes), -1), idx.reshape(len(pendentes), -1)
+                melhor = self._distancia_segmentos(xyz[pendentes], idx).min(axis=1)
+                # Um segmento fora dos k consultados tem o ponto médio além do k-ésimo e
+                # fica a pelo menos (essa distância - meio_max): só pode ser mais próximo
+                # se o k-ésimo ponto médio estiver a até melhor + meio_max
+                incompletos = (d_medio[:, -1] <= melhor + self.meio_max) & (k < len(self.seg_inicio))
+                dist[pendentes[~incompletos]] = melhor[~incompletos]
+                pendentes = pendentes[incompletos]
+                k = min(k * 2, len(self.seg_inicio))
+        return dist
+
+    def _distancia_segmentos(self, p: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        """Distância de cada ponto p (n, 3) aos segmentos idx (n, k)."""
+        a = self.seg_inicio[idx]
+        ab = self.seg_vetor[idx]
+        ap = p[:, None, :] - a
+        comp2 = self.seg_comp2[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(comp2 > 0, np.einsum('nki,nki->nk', ap, ab) / comp2, 0.0)
+        np.clip(t, 0.0, 1.0, out=t)
+        ap -= t[..., None] * ab
+        return np.sqrt(np.einsum('nki,nki->nk', ap, ap))
+
+    def analyze(self, leituras: pd.DataFrame):
+        """
+        (leituras em ordem cronológica por Tipo com a coluna Distancia_rota_m,
+        trechos fora da rota com as colunas COLUNAS e 'coordenadas').
+
+        As coordenadas de cada trecho incluem a leitura anterior e a seguinte do
+        mesmo Tipo, para a linha destacada sair da rota e voltar a ela no mapa.
+        """
+        datas = pd.to_datetime(leituras['Data/Hora'])
+        tipo_id, _ = pd.factorize(leituras['Tipo'])
+        ordem = np.lexsort((datas.to_numpy(), tipo_id))
+        leituras = leituras.iloc[ordem].reset_index(drop=True)
+        tipo_id = tipo_id[ordem]
+        lat, lon = leituras['Latitude'].to_numpy(), leituras['Longitude'].to_numpy()
+        dist = self.distances(lat, lon)
+        leituras['Distancia_rota_m'] = np.round(dist, 1)
+
+        fora = dist > self.limite_m
+        if not fora.any():
+            return leituras, pd.DataFrame(columns=list(self.COLUNAS) + ['coordenadas'])
+        # Início/fim de cada sequência de leituras fora da rota, sem atravessar a troca de Tipo
+        nova = fora.copy()
+        nova[1:] &= ~fora[:-1] | (tipo_id[1:] != tipo_id[:-1])
+        inicios = np.flatnonzero(nova)
+        ultima = fora.copy()
+        ultima[:-1] &= ~fora[1:] | (tipo_id[1:] != tipo_id[:-1])
+        fins = np.flatnonzero(ultima)
+
+        datas = pd.to_datetime(leituras['Data/Hora']).to_numpy()
+        coordenadas = []
+        for ini, fim in zip(inicios.tolist(), fins.tolist()):
+            de = ini - 1 if ini > 0 and tipo_id[ini - 1] == tipo_id[ini] else ini
+            ate = fim + 1 if fim + 1 < len(fora) and tipo_id[fim + 1] == tipo_id[fim] else fim
+            coordenadas.append(np.column_stack((lat[de:ate + 1], lon[de:ate + 1])).tolist())
+
+        trechos = pd.DataFrame({
+            'Tipo': leituras['Tipo'].to_numpy()[inicios],
+            'Início': datas[inicios],
+            'Fim': datas[fins],
+            'Duracao_s': (datas[fins] - datas[inicios]) / np.timedelta64(1, 's'),
+            'Leituras': fins - inicios + 1,
+            'Distancia_max_m': np.round(np.maximum.reduceat(np.where(fora, dist, 0.0), inicios), 1),
+            'coordenadas': coordenadas,
+        })
+        return leituras, trechos.sort_values('Início', kind='stable').reset_index(drop=True)
+
+
+def save_deviation_table(trechos: pd.DataFrame, caminho: str) -> str:
+    """Grava os trechos fora da rota (.xlsx ou CSV com ';' e BOM, como a tabela de visitas)."""
+    tabela = trechos[list(RouteDeviationAnalyzer.COLUNAS)].copy()
+    tabela.insert(tabela.columns.get_loc('Duracao_s') + 1, 'Duração',
+                  [format_duration(s) for s in tabela['Duracao_s'].tolist()])
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    if caminho.lower().endswith('.xlsx'):
+        tabela.to_excel(caminho, index=False)
+    else:
+        tabela.to_csv(caminho, sep=';', index=False, encoding='utf-8-sig', date_format='%d/%m/%Y %H:%M:%S')
+    return caminho
+
+
+def deviation_table_path(output_path: str, extensao: str = '.csv') -> str:
+    """Tabela de desvios ao lado do mapa: Mapa_x.html -> Mapa_x_desvios.csv."""
+    base = output_path[:-3] if output_path.lower().endswith('.gz') else output_path
+    return os.path.splitext(base)[0] + '_desvios' + extensao
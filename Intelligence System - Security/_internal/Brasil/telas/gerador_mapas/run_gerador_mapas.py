@@ -11,9 +11,11 @@ from PyQt5.QtWidgets import QWidget, QMessageBox
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from file_selector import FileSelector
-from data_parsers import ExcelParser
-from map_builder import MapBuilder
+from dataset_cache import DatasetCache
+from map_pipeline import load_dataset, load_kmz, build_map, default_output_name
 from color_picker_ui import ColorPickerUI
+from geofence import GeofenceEngine, apply_visit_events, save_visits_table, visits_table_path
+from route_deviation import RouteDeviationAnalyzer, save_deviation_table, deviation_table_path
 
 
 class GeradorMapaTela(QWidget):
@@ -78,13 +80,14 @@ class GeradorMapaTela(QWidget):
             return
 
         try:
-            # Lógica do Parser
-            excel_parser = ExcelParser(excel_path)
-            df_grouped = excel_parser.parse()
+            # Lógica do Parser (planilhas grandes são lidas em lotes)
+            excel_parser = load_dataset(excel_path, cache=DatasetCache())
             tipos_encontrados = excel_parser.get_unique_types()
-            eventos_unicos = excel_parser.get_unique_events()
 
-            print(f"   ✓ Arquivo carregado: {os.path.basename(excel_path)}")
+            origem = " (cache)" if excel_parser.from_cache else ""
+            print(f"   ✓ Arquivo carregado{origem}: {os.path.basename(excel_path)}")
+            if excel_parser.datetime_fallback_rows:
+                print(f"   ⚠ {excel_parser.datetime_fallback_rows} linhas de Data/Hora fora do formato detectado")
 
             # 2. DEFINIÇÃO DE CORES
             print("\n2. Configurando paleta de cores...")
@@ -94,22 +97,52 @@ class GeradorMapaTela(QWidget):
             if not mapeamento_cores:
                 return
 
+            # 2.1 CHECKPOINTS DOS CLIENTES (OPCIONAL)
+            kmz_parser = None
+            visitas = None
+            desvios = None
+            resposta = QMessageBox.question(self, "Checkpoints KMZ",
+                                            "Deseja incluir os checkpoints de um arquivo KMZ/KML?",
+                                            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if resposta == QMessageBox.Yes:
+                kmz_path = FileSelector.select_kmz()
+                if kmz_path and os.path.exists(kmz_path):
+                    kmz_parser = load_kmz(kmz_path)
+                    print(f"   ✓ KMZ carregado: {len(kmz_parser.pontos_info)} checkpoints, "
+                          f"{len(kmz_parser.linhas)} trechos de rota")
+
+                    # Leituras tiradas uma vez, antes de as visitas virarem eventos
+                    leituras = excel_parser.get_readings()
+                    visitas = GeofenceEngine(kmz_parser.pontos_info).match(leituras)
+                    print(f"   ✓ {len(visitas)} visitas a checkpoints (raio {GeofenceEngine.RAIO_PADRAO_M:g} m)")
+
+                    # Trechos fora da rota planejada (quando o KMZ traz a rota)
+                    if kmz_parser.linhas:
+                        _, desvios = RouteDeviationAnalyzer(kmz_parser.linhas).analyze(leituras)
+                        print(f"   ✓ {len(desvios)} trechos fora da rota "
+                              f"(mais de {RouteDeviationAnalyzer.LIMITE_PADRAO_M:g} m)")
+
+                    # Passagens pelos checkpoints viram eventos (ENTRADA/SAÍDA CHECKPOINT)
+                    apply_visit_events(excel_parser, visitas)
+
             # 3. CONSTRUÇÃO DO MAPA
             print("\n3. Gerando inteligência geográfica...")
-            center = excel_parser.get_center_location()
-            map_builder = MapBuilder(center)
-            map_builder.add_vehicle_data(df_grouped, mapeamento_cores)
-            map_builder.add_filter_system(eventos_unicos, tipos_encontrados)
-            mapa_final = map_builder.finalize()
+            mapa_final = build_map(excel_parser, mapeamento_cores, kmz_parser=kmz_parser, desvios=desvios)
 
             # 4. SALVAMENTO
             print("\n4. Finalizando exportação...")
-            nome_sugerido = f"Mapa_{os.path.splitext(os.path.basename(excel_path))[0]}.html"
+            nome_sugerido = default_output_name(excel_path)
             output_path = FileSelector.save_file_dest(nome_sugerido)
 
             if output_path:
                 mapa_final.save(output_path)
                 print(f"✅ SUCESSO! Mapa salvo em: {output_path}")
+                if visitas is not None:
+                    tabela = save_visits_table(visitas, visits_table_path(output_path))
+                    print(f"   Tabela de visitas: {tabela}")
+                if desvios is not None:
+                    tabela = save_deviation_table(desvios, deviation_table_path(output_path))
+                    print(f"   Tabela de desvios: {tabela}")
                 webbrowser.open('file://' + os.path.realpath(output_path))
 
         except Exception as e:
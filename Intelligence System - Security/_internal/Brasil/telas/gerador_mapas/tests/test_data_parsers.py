@@ -0,0 +1,138 @@
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_parsers import ExcelParser  # noqa: E402
+
+CABECALHO = ['Data/Hora', 'Latitude', 'Longitude', 'Evento', 'Ignição', 'Observações',
+             'Tipo', 'NOME_PESSOA', 'Coluna Ignorada']
+LINHAS = [
+    ['01/03/2024 08:00:00', -23.5501, -46.6301, 'POSIÇÃO', 'L', None, 'Veículo 1', None, 'x'],
+    ['01/03/2024 08:05:00', -23.5501, -46.6301, 'PARADA', 'D', 'porta aberta', 'Veículo 1', None, 'x'],
+    [datetime(2024, 3, 1, 8, 10), -23.5600, -46.6400, 'POSIÇÃO', 'L', None, 'Veículo 1', 'JOÃO', 1],
+    [None, None, None, None, None, None, None, None, None],
+    ['01/03/2024 08:20:00', -23.5700, -46.6500, 'IGNIÇÃO LIGADA', 1, 42, 'ISCA', '  ', None],
+    ['01/03/2024 08:25:00', None, -46.6500, 'POSIÇÃO', 'L', None, 'ISCA', None, None],
+    ['sem data', -23.5800, -46.6600, 'POSIÇÃO', 'L', None, 'ISCA', None, None],
+    ['01/03/2024 08:30:00', -23.5700, -46.6500, 'POSIÇÃO', None, 'fim', 'ISCA', 'MARIA', None],
+    ['02/03/2024 09:00:00', -22.9000, -43.2000, 'POSIÇÃO', 'D', None, 'Veículo 2', None, None],
+]
+
+
+@pytest.fixture
+def planilha(tmp_path):
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.append(CABECALHO)
+    for linha in LINHAS:
+        ws.append(linha)
+    caminho = tmp_path / 'dados.xlsx'
+    wb.save(caminho)
+    return str(caminho)
+
+
+def _parse(caminho, **opcoes):
+    parser = ExcelParser(caminho, **opcoes)
+    parser.parse()
+    return parser
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 100])
+def test_streaming_igual_a_leitura_direta(planilha, chunk_size):
+    direto = _parse(planilha)
+    lotes = _parse(planilha, streaming=True, chunk_size=chunk_size)
+    pd.testing.assert_frame_equal(lotes.df_grouped, direto.df_grouped)
+    pd.testing.assert_frame_equal(lotes.df_eventos, direto.df_eventos)
+    assert lotes.center_location == direto.center_location
+    assert lotes.datetime_fallback_rows == direto.datetime_fallback_rows
+
+
+def test_leitura_descarta_linhas_sem_data_ou_coordenada(planilha):
+    parser = _parse(planilha)
+    assert len(parser.df_eventos) == 6
+    assert len(parser.df_grouped) == 4
+    assert 'Coluna Ignorada' not in parser.df.columns
+
+
+def test_datas_com_fuso_viram_utc_sem_fuso():
+    datas, lentas = ExcelParser.parse_datas(pd.Series(['2024-01-01 10:00:00+00:00', 'x']))
+    assert datas.dtype == ExcelParser.DTYPE_DATA
+    assert datas.tolist()[0] == pd.Timestamp('2024-01-01 10:00:00')
+    assert pd.isna(datas.iloc[1])
+    assert lentas == 2
+
+    misturadas = pd.Series(['2024-01-01 10:00:00-03:00', '2024-01-02 10:00:00+01:00', '05/03/2024 08:00'])
+    datas, _ = ExcelParser.parse_datas(misturadas)
+    assert datas.tolist() == [pd.Timestamp('2024-01-01 13:00'), pd.Timestamp('2024-01-02 09:00'),
+                              pd.Timestamp('2024-03-05 08:00')]
+
+    com_fuso = pd.Series(pd.to_datetime(['2024-03-01 10:00']).tz_localize('America/Sao_Paulo'))
+    assert ExcelParser.parse_datas(com_fuso)[0].tolist() == [pd.Timestamp('2024-03-01 13:00')]
+
+
+def test_datas_seriais_do_excel():
+    datas, lentas = ExcelParser.parse_datas(pd.Series([45352.5, 45353.25, -1.0]))
+    assert datas.dtype == ExcelParser.DTYPE_DATA
+    assert datas.tolist()[:2] == [pd.Timestamp('2024-03-01 12:00'), pd.Timestamp('2024-03-02 06:00')]
+    assert pd.isna(datas.iloc[2])
+    assert lentas == 0
+
+    mista = pd.Series([45352.5, '01/03/2024 08:00:00', datetime(2024, 3, 1, 9), None], dtype=object)
+    datas, lentas = ExcelParser.parse_datas(mista)
+    assert datas.tolist()[:3] == [pd.Timestamp('2024-03-01 12:00'), pd.Timestamp('2024-03-01 08:00'),
+                                  pd.Timestamp('2024-03-01 09:00')]
+    assert lentas == 0
+
+
+def test_datas_fora_do_formato_detectado():
+    textos = pd.Series(['01/03/2024 08:00:00', '02/03/2024 09:00:00', '2024-03-05T10:00:00', '5/3/24 8:00'])
+    datas, lentas = ExcelParser.parse_datas(textos)
+    # Só as duas últimas saem do formato detectado; a ISO não tem dia e mês trocados
+    assert lentas == 2
+    assert datas.tolist() == [pd.Timestamp('2024-03-01 08:00'), pd.Timestamp('2024-03-02 09:00'),
+                              pd.Timestamp('2024-03-05 10:00'), pd.Timestamp('2024-03-05 08:00')]
+
+
+# Filtros de leitura -> linhas válidas (de 6) que sobram
+FILTROS = {
+    'intervalo': ({'time_start': '01/03/2024 08:05', 'time_end': '2024-03-01 08:20'}, 3),
+    'bbox': ({'bbox': (-23.565, -46.645, -23.50, -46.60)}, 3),
+    'poligono': ({'polygon': [(-23.565, -46.66), (-23.565, -46.64), (-23.58, -46.65)]}, 2),
+    'tipos': ({'tipos': [' isca ', 'VEÍCULO 2']}, 3),
+    'eventos': ({'eventos': ['posição']}, 4),
+    'combinados': ({'tipos': ['Veículo 1'], 'eventos': ['POSIÇÃO']}, 2),
+}
+
+
+@pytest.mark.parametrize('nome', list(FILTROS))
+def test_filtros_de_leitura(planilha, nome):
+    opcoes, restantes = FILTROS[nome]
+    direto = _parse(planilha, **opcoes)
+    assert len(direto.df_eventos) == restantes
+    assert direto.filtered_out_rows == 6 - restantes
+
+    lotes = _parse(planilha, streaming=True, chunk_size=2, **opcoes)
+    pd.testing.assert_frame_equal(lotes.df_grouped, direto.df_grouped)
+    pd.testing.assert_frame_equal(lotes.df_eventos, direto.df_eventos)
+    assert lotes.filtered_out_rows == direto.filtered_out_rows
+
+
+def test_filtro_por_tipo_e_evento_mantem_so_as_linhas_pedidas(planilha):
+    parser = _parse(planilha, tipos=['ISCA'], eventos=['posição'])
+    assert parser.df_grouped['Tipo'].unique().tolist() == ['ISCA']
+    assert parser.df_eventos['Evento'].tolist() == ['POSIÇÃO']
+
+
+def test_filtros_mudam_a_chave_do_cache(planilha):
+    chaves = {nome: ExcelParser(planilha, **opcoes).cache_key() for nome, (opcoes, _) in FILTROS.items()}
+    chaves['sem filtro'] = ExcelParser(planilha).cache_key()
+    assert len(set(chaves.values())) == len(chaves)
+    # Mesmos filtros em outra ordem ou caixa: mesma chave
+    assert (ExcelParser(planilha, tipos=['isca', 'veículo 2']).cache_key() ==
+            ExcelParser(planilha, tipos=['VEÍCULO 2', ' ISCA']).cache_key())
@@ -0,0 +1,86 @@
+import os
+import pickle
+import sys
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset_cache import DatasetCache  # noqa: E402
+
+
+def _planilha(tmp_path):
+    caminho = tmp_path / 'dados.xlsx'
+    caminho.write_bytes(b'conteudo da planilha')
+    return str(caminho)
+
+
+def _dados():
+    grupos = pd.DataFrame({
+        'Latitude': [-23.5, -23.6],
+        'Tipo': ['Veículo 1', 'ISCA'],
+        'Ignição': ['L', np.nan],
+        'Data_Inicial': pd.to_datetime(['2024-03-01 08:00', '2024-03-01 09:30']),
+        'ev_inicio': np.array([0, 2], dtype=np.int64),
+    })
+    eventos = pd.DataFrame({
+        'Evento': ['POSIÇÃO', 'PARADA', 'IGNIÇÃO LIGADA', 'POSIÇÃO'],
+        # NaN (célula vazia) e None (ex.: 'last' de um grupo só com nulos) continuam distintos
+        'Observações': pd.Series(['porta aberta', np.nan, 12.5, None], dtype=object),
+    })
+    return {'df_grouped': grupos, 'df_eventos': eventos, 'center_location': [np.float64(-23.55), -46.6],
+            'datetime_fallback_rows': 3}
+
+
+def test_entrada_volta_igual(tmp_path):
+    planilha = _planilha(tmp_path)
+    cache = DatasetCache(str(tmp_path / 'cache'))
+    dados = _dados()
+    cache.save(planilha, 'v1', dados)
+    lidos = cache.load(planilha, 'v1')
+    pd.testing.assert_frame_equal(lidos['df_grouped'], dados['df_grouped'])
+    pd.testing.assert_frame_equal(lidos['df_eventos'], dados['df_eventos'])
+    assert lidos['center_location'] == [-23.55, -46.6]
+    assert lidos['datetime_fallback_rows'] == 3
+    assert cache.load(planilha, 'v2') is None
+
+
+class _Payload:
+    def __init__(self, alvo):
+        self.alvo = alvo
+
+    def __reduce__(self):
+        return (open, (self.alvo, 'w'))
+
+
+def test_arquivo_adulterado_nao_executa_codigo(tmp_path):
+    planilha = _planilha(tmp_path)
+    cache = DatasetCache(str(tmp_path / 'cache'))
+    cache.save(planilha, 'v1', _dados())
+    entrada = cache._entry_path(planilha, 'v1')
+    alvo = tmp_path / 'executado'
+    with open(entrada, 'wb') as f:
+        pickle.dump(_Payload(str(alvo)), f)
+    assert cache.load(planilha, 'v1') is None
+    assert not alvo.exists()
+    assert not os.path.exists(entrada)
+
+
+def test_valor_sem_representacao_nao_e_gravado(tmp_path):
+    planilha = _planilha(tmp_path)
+    cache = DatasetCache(str(tmp_path / 'cache'))
+    dados = _dados()
+    dados['df_eventos']['Observações'] = [Decimal('1.5'), None, None, None]
+    cache.save(planilha, 'v1', dados)
+    assert cache.load(planilha, 'v1') is None
+
+
+def test_entradas_pickle_antigas_sao_removidas(tmp_path):
+    planilha = _planilha(tmp_path)
+    pasta = tmp_path / 'cache'
+    pasta.mkdir()
+    (pasta / 'antiga.pkl').write_bytes(b'x')
+    DatasetCache(str(pasta)).save(planilha, 'v1', _dados())
+    assert [n for n in os.listdir(pasta) if n.endswith('.pkl')] == []
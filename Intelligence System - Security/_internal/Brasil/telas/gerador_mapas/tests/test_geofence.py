@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geofence import GeofenceEngine  # noqa: E402
+
+CHECKPOINT = {'lat': -23.55, 'lon': -46.63, 'name': 'Cliente A'}
+# Graus de latitude por metro
+GRAU_POR_M = 1 / 111195.0
+
+
+def _leituras(distancias_m, intervalo_s=60, tipo='Veículo 1'):
+    n = len(distancias_m)
+    return pd.DataFrame({
+        'Latitude': CHECKPOINT['lat'] + np.asarray(distancias_m, dtype=float) * GRAU_POR_M,
+        'Longitude': np.full(n, CHECKPOINT['lon']),
+        'Tipo': tipo,
+        'Data/Hora': pd.Timestamp('2024-03-01 08:00') + pd.to_timedelta(np.arange(n) * intervalo_s, 's'),
+    })
+
+
+def test_uma_leitura_fora_do_raio_nao_divide_a_visita():
+    leituras = _leituras([10] * 10 + [150] + [10] * 10)
+    visitas = GeofenceEngine([CHECKPOINT], raio_m=100).match(leituras)
+    assert len(visitas) == 1
+    assert visitas['Leituras'].iloc[0] == 20
+    assert visitas['Permanencia_s'].iloc[0] == 20 * 60
+
+
+def test_sem_tolerancia_cada_trecho_e_uma_visita():
+    leituras = _leituras([10] * 10 + [150] + [10] * 10)
+    visitas = GeofenceEngine([CHECKPOINT], raio_m=100, intervalo_max_s=0).match(leituras)
+    assert len(visitas) == 2
+
+
+def test_ausencia_longa_gera_nova_visita():
+    # 10 leituras fora do raio = 11 minutos entre a saída e a nova entrada
+    leituras = _leituras([10] * 5 + [500] * 10 + [10] * 5)
+    visitas = GeofenceEngine([CHECKPOINT], raio_m=100, intervalo_max_s=300).match(leituras)
+    assert visitas['Leituras'].tolist() == [5, 5]
+
+
+def test_visitas_de_tipos_diferentes_nao_se_juntam():
+    leituras = pd.concat([_leituras([10] * 5, tipo='Veículo 1'), _leituras([10] * 5, tipo='Veículo 2')],
+                         ignore_index=True)
+    visitas = GeofenceEngine([CHECKPOINT], raio_m=100).match(leituras)
+    assert sorted(visitas['Tipo']) == ['Veículo 1', 'Veículo 2']
@@ -0,0 +1,153 @@
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_parsers import KMZParser  # noqa: E402
+from ui_helpers import format_brl, normalize_money  # noqa: E402
+
+KML = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document>
+  <name>Rota</name>
+  <Folder>
+    <Placemark>
+      <name>Cliente A</name>
+      <address>Rua A, 10</address>
+      <ExtendedData>
+        <Data name="Código"><value>123</value></Data>
+        <Data name="Valor Pedido"><value>R$ 1.234,56</value></Data>
+      </ExtendedData>
+      <Point><coordinates>-46.6301,-23.5501,0</coordinates></Point>
+    </Placemark>
+    <Placemark>
+      <name>Cliente B</name>
+      <description>Entrega - VALOR: 850,00</description>
+      <Point><coordinates>
+        -46.64,-23.56
+      </coordinates></Point>
+    </Placemark>
+    <Placemark>
+      <name>Cliente C</name>
+      <description>sem valor</description>
+      <ExtendedData><Data name="valor"><value></value></Data></ExtendedData>
+      <MultiGeometry>
+        <Point><coordinates>-46.65,-23.57</coordinates></Point>
+        <LineString><coordinates>-46.65,-23.57 -46.66,-23.58</coordinates></LineString>
+      </MultiGeometry>
+    </Placemark>
+    <Placemark><name>Sem geometria</name></Placemark>
+    <Placemark><name>Vazio</name><Point><coordinates> </coordinates></Point></Placemark>
+  </Folder>
+  <Placemark>
+    <name>Rota planejada</name>
+    <LineString><coordinates>
+      -46.60,-23.50,10 -46.61,-23.51,10 -46.62,-23.52,10
+    </coordinates></LineString>
+  </Placemark>
+  <Placemark>
+    <name>Trecho com tupla inválida</name>
+    <LineString><coordinates>-46.70,-23.60 abc -46.71,-23.61</coordinates></LineString>
+  </Placemark>
+</Document>
+</kml>
+"""
+
+
+def _parser_antigo(kml_bytes):
+    """Leitura anterior (árvore inteira + findall), com as LineStrings concatenadas."""
+    ns = {'kml': 'http://www.opengis.net/kml/2.2'}
+    parser = KMZParser()
+    root = ET.fromstring(kml_bytes)
+
+    def texto(no, caminho):
+        el = no.find(caminho, ns)
+        return (el.text or '').strip() if el is not None and el.text else ''
+
+    pontos = []
+    for pm in root.findall('.//kml:Placemark', ns):
+        coords_el = pm.find('.//kml:Point/kml:coordinates', ns)
+        if coords_el is None or not (coords_el.text or '').strip():
+            continue
+        coords = parser._parse_coordinates_block(coords_el.text)
+        if not coords:
+            continue
+        valor = None
+        for data in pm.findall('.//kml:ExtendedData/kml:Data', ns):
+            bruto = texto(data, 'kml:value')
+            if bruto and 'valor' in (data.get('name') or '').strip().lower():
+                valor = normalize_money(bruto)
+                if valor is not None:
+                    break
+        if not valor:
+            m = re.search(r'VALOR.*?(\d[\d\s.,]*)', texto(pm, 'kml:description'), flags=re.I)
+            valor = normalize_money(m.group(1)) if m else None
+        pontos.append({'lat': coords[0][0], 'lon': coords[0][1],
+                       'name': texto(pm, 'kml:name'), 'address': texto(pm, 'kml:address'),
+                       'valor_raw': valor, 'valor_fmt': format_brl(valor) if valor else None})
+    linhas = []
+    for el in root.findall('.//kml:LineString/kml:coordinates', ns):
+        linhas += parser._parse_coordinates_block(el.text)
+    return pontos, linhas
+
+
+@pytest.fixture
+def kml(tmp_path):
+    caminho = tmp_path / 'rota.kml'
+    caminho.write_text(KML, encoding='utf-8')
+    return str(caminho)
+
+
+def test_passada_unica_igual_ao_parser_antigo(kml):
+    pontos, linhas = KMZParser().parse(kml)
+    pontos_antigos, linhas_antigas = _parser_antigo(KML.encode('utf-8'))
+    assert pontos == pontos_antigos
+    assert np.concatenate(linhas).tolist() == [list(c) for c in linhas_antigas]
+
+
+def test_checkpoints_e_linhas(kml):
+    parser = KMZParser()
+    pontos, linhas = parser.parse(kml)
+    assert [p['name'] for p in pontos] == ['Cliente A', 'Cliente B', 'Cliente C']
+    assert [str(p['valor_raw']) if p['valor_raw'] else None for p in pontos] == ['1234.56', '850.00', None]
+    assert pontos[0]['address'] == 'Rua A, 10'
+    assert (pontos[1]['lat'], pontos[1]['lon']) == (-23.56, -46.64)
+    # Uma array [lat, lon] por LineString, sem ligar rotas diferentes
+    assert [len(linha) for linha in linhas] == [2, 3, 2]
+    assert linhas[1].tolist() == [[-23.50, -46.60], [-23.51, -46.61], [-23.52, -46.62]]
+    assert linhas[2].tolist() == [[-23.60, -46.70], [-23.61, -46.71]]
+    assert parser.pontos_info == pontos and parser.linhas == linhas
+
+
+def test_kml_sem_namespace(kml, tmp_path):
+    sem_ns = tmp_path / 'sem_ns.kml'
+    sem_ns.write_text(KML.replace(' xmlns="http://www.opengis.net/kml/2.2"', ''), encoding='utf-8')
+    pontos, linhas = KMZParser().parse(str(sem_ns))
+    esperado_pontos, esperado_linhas = KMZParser().parse(kml)
+    assert pontos == esperado_pontos
+    assert [linha.tolist() for linha in linhas] == [linha.tolist() for linha in esperado_linhas]
+
+
+def test_kmz_igual_ao_kml(kml, tmp_path):
+    kmz = tmp_path / 'rota.kmz'
+    with zipfile.ZipFile(kmz, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('files/icone.png', b'png')
+        z.writestr('doc.kml', KML.encode('utf-8'))
+    pontos, linhas = KMZParser().parse(str(kmz))
+    esperado_pontos, esperado_linhas = KMZParser().parse(kml)
+    assert pontos == esperado_pontos
+    assert [linha.tolist() for linha in linhas] == [linha.tolist() for linha in esperado_linhas]
+
+
+def test_kmz_sem_kml(tmp_path):
+    kmz = tmp_path / 'vazio.kmz'
+    with zipfile.ZipFile(kmz, 'w') as z:
+        z.writestr('leiame.txt', 'nada')
+    with pytest.raises(RuntimeError):
+        KMZParser().parse(str(kmz))
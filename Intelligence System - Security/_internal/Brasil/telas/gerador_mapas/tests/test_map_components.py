@@ -0,0 +1,238 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import folium
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filter_manager import FilterManager  # noqa: E402
+from map_components import LazyPopupTable, MapMarkerFactory  # noqa: E402
+from ui_helpers import (NOMES_INVALIDOS, adjust_color_brightness, get_vehicle_marker_colors,  # noqa: E402
+                        valid_name_mask)
+
+CORES = {'Veículo 1': '#1f77b4'}
+
+
+def _grupo(mista=True):
+    """
+    Pontos de um Tipo com os valores que a planilha costuma trazer em NOME_PESSOA
+    e Ignição: colunas mistas (object) ou só texto e nulos (dtype de texto do pandas).
+    """
+    if mista:
+        nomes = pd.Series(['JOÃO', '  ', 'nan', np.nan, 0, ' Maria '], dtype=object)
+        ignicao = pd.Series(['L', 'D', np.nan, 'IGNIÇÃO OFF', 1, 'l'], dtype=object)
+    else:
+        nomes = pd.Series(['JOÃO', '  ', 'nan', np.nan, '0', ' Maria '])
+        ignicao = pd.Series(['L', 'D', np.nan, 'IGNIÇÃO OFF', 'on', 'l'])
+    grupo = pd.DataFrame({
+        'Latitude': [-23.50, -23.51, -23.52, -23.53, -23.54, -23.55],
+        'Longitude': [-46.60, -46.61, -46.62, -46.63, -46.64, -46.65],
+        'Tipo': 'Veículo 1',
+        'NOME_PESSOA': nomes,
+        'Ignição': ignicao,
+        'ev_inicio': [0, 2, 3, 4, 6, 7],
+        'ev_fim': [2, 3, 4, 6, 7, 8],
+    })
+    horas = list(pd.date_range('2024-03-01 08:00', periods=8, freq='5min'))
+    eventos = ['POSIÇÃO', 'PARADA', 'POSIÇÃO', 'IGNIÇÃO LIGADA', 'POSIÇÃO', 'PARADA', 'POSIÇÃO', 'FIM']
+    observacoes = [None, 'porta aberta', None, None, 'x', None, None, None]
+    return grupo, (horas, eventos, observacoes)
+
+
+def _campos_por_linha(grupo, planos, cores):
+    """Referência linha a linha (como no antigo laço com iterrows)."""
+    horas, eventos, observacoes = planos
+    for i, row in enumerate(grupo.to_dict('records')):
+        nome = str(row['NOME_PESSOA']).strip()
+        valido = bool(nome) and nome.lower() not in NOMES_INVALIDOS
+        ign_display, ign_filter = MapMarkerFactory.ignition_fields(row['Ignição'])
+        a, b = row['ev_inicio'], row['ev_fim']
+        yield (row['Latitude'], row['Longitude'], horas[a:b], eventos[a:b], observacoes[a:b],
+               nome, valido, ign_display, ign_filter, i, cores[i])
+
+
+def _popup_html(marcador):
+    popup = next(c for c in marcador._children.values() if isinstance(c, folium.Popup))
+    # Sem os ids aleatórios que o folium gera para cada elemento
+    return re.sub(r'_[0-9a-f]{32}', '', popup.html.render())
+
+
+def _popup_js():
+    """escapeHtml e buildPointPopup, como saem no HTML de LazyPopupTable."""
+    mapa = folium.Map()
+    grupo = folium.FeatureGroup().add_to(mapa)
+    grupo.add_child(LazyPopupTable('Veículo 1', []))
+    html = mapa.get_root().render()
+    return html[html.index('window.escapeHtml'):html.index('var ligarPopup')]
+
+
+def _node(script):
+    """Executa o script no node (com window = globalThis) e devolve o JSON escrito na saída."""
+    saida = subprocess.run(['node', '-e', 'var window = globalThis;' + script],
+                           capture_output=True, text=True, check=True).stdout
+    return json.loads(saida)
+
+
+def _atributos_marcador(html):
+    """Atributos data-*/id/onclick e textos dos spans do marcador (o que filtros e rótulos leem)."""
+    atributos = dict(re.findall(r'\s((?:data-[a-z]+|id|onclick))="([^"]*)"', html))
+    spans = re.findall(r'<span class="(m-[a-z-]+)"[^>]*>([^<]*)</span>', html)
+    return atributos, spans
+
+
+def _texto(html):
+    return ' '.join(re.sub(r'<[^>]+>', ' ', html).split())
+
+
+def _sem_espacos(html):
+    """O HTML do Python é indentado e o do navegador é de uma linha só."""
+    html = re.sub(r'\s+', ' ', html)
+    return re.sub(r'\s*([<>;:"])\s*', r'\1', html).strip()
+
+
+@pytest.mark.parametrize('total', [1, 2, 7, 300])
+def test_degrade_em_lote_igual_ao_calculo_por_indice(total):
+    base = CORES['Veículo 1']
+    esperado = [adjust_color_brightness(base, 0.3 + 0.7 * (i / (total - 1)) if total > 1 else 1.0)
+                for i in range(total)]
+    assert get_vehicle_marker_colors('Veículo 1', total, CORES) == esperado
+
+
+def test_mascara_de_nomes_validos():
+    nomes = pd.Series(['JOÃO', '', '  ', 'nan', 'N/I', 'None', None, np.nan, 0, '0', ' Maria '], dtype=object)
+    assert valid_name_mask(nomes).tolist() == [True] + [False] * 9 + [True]
+
+
+@pytest.mark.parametrize('mista', [True, False])
+def test_campos_em_lote_iguais_aos_da_leitura_por_linha(mista):
+    grupo, planos = _grupo(mista)
+    cores = get_vehicle_marker_colors('Veículo 1', len(grupo), CORES)
+    em_lote = list(MapMarkerFactory._iter_vehicle_fields(grupo, cores, planos))
+    assert em_lote == list(_campos_por_linha(grupo, planos, cores))
+
+
+@pytest.mark.parametrize('mista', [True, False])
+def test_marcadores_em_lote_iguais_aos_montados_por_linha(mista):
+    grupo, planos = _grupo(mista)
+    cores = get_vehicle_marker_colors('Veículo 1', len(grupo), CORES)
+    em_lote = MapMarkerFactory.create_vehicle_markers(grupo, cores, 'Veículo 1', planos)
+    por_linha = [MapMarkerFactory.build_vehicle_marker(*campos, 'Veículo 1')
+                 for campos in _campos_por_linha(grupo, planos, cores)]
+    for marcador, referencia in zip(em_lote, por_linha):
+        assert marcador.icon.options['html'] == referencia.icon.options['html']
+        assert _popup_html(marcador) == _popup_html(referencia)
+
+
+def test_marcadores_sob_demanda_sem_popup_embutido():
+    grupo, planos = _grupo()
+    cores = get_vehicle_marker_colors('Veículo 1', len(grupo), CORES)
+    embutidos = MapMarkerFactory.create_vehicle_markers(grupo, cores, 'Veículo 1', planos)
+    sob_demanda = MapMarkerFactory.create_vehicle_markers(grupo, cores, 'Veículo 1', planos,
+                                                          lazy_popups=True)
+    registros = MapMarkerFactory.create_popup_records(grupo, cores, planos)
+    for i, (marcador, referencia) in enumerate(zip(sob_demanda, embutidos)):
+        assert not any(isinstance(c, folium.Popup) for c in marcador._children.values())
+        assert marcador.icon.options['html'] == referencia.icon.options['html']
+        # LazyPopupTable liga o popup pelo options.pointIdx do marcador
+        assert registros[marcador.options['pointIdx'] - 1][0] == i + 1
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node não disponível')
+def test_popup_sob_demanda_igual_ao_embutido():
+    grupo, planos = _grupo()
+    grupo['Parada_s'] = [0.0, 0.0, 0.0, 5400.0, 0.0, 0.0]
+    horas, eventos, observacoes = planos
+    eventos[0] = 'SAÍDA <garagem> & "pátio"'
+    observacoes[1] = "cliente d'Ávila <ausente>"
+    cores = get_vehicle_marker_colors('Veículo 1', len(grupo), CORES)
+
+    registros = MapMarkerFactory.create_popup_records(grupo, cores, planos)
+    script = (_popup_js() + 'var nomeTipo = %s; var tabela = %s;'
+              'process.stdout.write(JSON.stringify(tabela.map(function(r) {'
+              ' return window.buildPointPopup(r, nomeTipo); })));'
+              % (json.dumps('Veículo 1'), json.dumps(registros)))
+    no_navegador = _node(script)
+
+    embutidos = [MapMarkerFactory.build_popup_html(
+        lat, lon, h, e, d, nome if valido else 'N/I', ign, idx, cor, 'Veículo 1', parada_s=parada)
+        for (lat, lon, h, e, d, nome, valido, ign, _, idx, cor), parada in zip(
+            MapMarkerFactory._iter_vehicle_fields(grupo, cores, planos), grupo['Parada_s'])]
+    assert len(no_navegador) == len(embutidos)
+    for js, py in zip(no_navegador, embutidos):
+        assert _sem_espacos(js) == _sem_espacos(py)
+
+
+@pytest.mark.parametrize('mista', [True, False])
+def test_indice_de_filtro_igual_aos_atributos_dos_marcadores(mista):
+    grupo, planos = _grupo(mista)
+    cores = get_vehicle_marker_colors('Veículo 1', len(grupo), CORES)
+    indice = MapMarkerFactory.create_filter_index(grupo, cores, planos)
+
+    assert len(indice['evInicio']) == len(grupo) + 1
+    assert indice['evInicio'][0] == 0 and indice['evInicio'][-1] == len(indice['evIds'])
+    assert indice['cores'] == cores
+    for i, campos in enumerate(_campos_por_linha(grupo, planos, cores)):
+        # Mesmos valores que o filtro antigo lia de data-eventos / data-ignicao
+        ids = indice['evIds'][indice['evInicio'][i]:indice['evInicio'][i + 1]]
+        assert ids == sorted(set(ids))
+        esperado = set(MapMarkerFactory.eventos_filter_str(campos[3]).lower().split(','))
+        assert {indice['eventos'][k] for k in ids} == esperado
+        assert indice['ignicoes'][indice['ign'][i]] == campos[8]
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node não disponível')
+def test_bitset_do_indice_no_navegador():
+    grupo, planos = _grupo()
+    cores = get_vehicle_marker_colors('Veículo 1', len(grupo), CORES)
+    indice = MapMarkerFactory.create_filter_index(grupo, cores, planos)
+    # Mais de 32 eventos distintos: cada ponto ocupa mais de uma palavra do bitset
+    indice['eventos'] += [f'extra {k}' for k in range(40)]
+    indice['evIds'][-1:] = [len(indice['eventos']) - 1]
+
+    js = FilterManager().build_filter_js('mapa', [], len(grupo))
+    inicio = js.index('window.registrarIndiceFiltro')
+    script = (js[inicio:js.index('window.elementoMarcador = function', inicio)] +
+              'window.markerIndex = { segmentos: [], porTipo: {} };'
+              'window.dataPointsByTipo = { "veículo 1": [] };'
+              'window.registrarIndiceFiltro("veículo 1", %s, null);'
+              'var seg = window.markerIndex.segmentos[0];'
+              'process.stdout.write(JSON.stringify({ palavras: seg.palavras, bits: Array.from(seg.bits),'
+              ' ignicao: Array.from(seg.ignicao), seq: Array.from(seg.seq) }));' % json.dumps(indice))
+    seg = _node(script)
+
+    assert seg['palavras'] == 2
+    assert seg['ignicao'] == indice['ign']
+    assert seg['seq'] == list(range(1, len(grupo) + 1))
+    for i in range(len(grupo)):
+        ids = set(indice['evIds'][indice['evInicio'][i]:indice['evInicio'][i + 1]])
+        ligados = {k for k in range(len(indice['eventos']))
+                   if seg['bits'][i * 2 + (k >> 5)] >> (k & 31) & 1}
+        assert ligados == ids
+
+
+@pytest.mark.parametrize('mista', [True, False])
+def test_modo_compacto_mantem_dados_dos_marcadores(mista):
+    grupo, planos = _grupo(mista)
+    grupo['Parada_s'] = [0.0, 0.0, 0.0, 5400.0, 0.0, 0.0]
+    cores = get_vehicle_marker_colors('Veículo 1', len(grupo), CORES)
+    completos = MapMarkerFactory.create_vehicle_markers(grupo, cores, 'Veículo 1', planos)
+    compactos = MapMarkerFactory.create_vehicle_markers(grupo, cores, 'Veículo 1', planos, compact=True)
+    for compacto, completo in zip(compactos, completos):
+        atributos, spans = _atributos_marcador(compacto.icon.options['html'])
+        assert len(atributos) == 9 and len(spans) == 4
+        assert (atributos, spans) == _atributos_marcador(completo.icon.options['html'])
+        assert compacto.options['pointIdx'] == completo.options['pointIdx']
+        # Popup: mesmo conteúdo, só a marcação muda
+        assert _texto(_popup_html(compacto)) == _texto(_popup_html(completo))
+
+    registros = MapMarkerFactory.create_vehicle_point_records(grupo, cores, 'Veículo 1', planos)
+    compactos = MapMarkerFactory.create_vehicle_point_records(grupo, cores, 'Veículo 1', planos, compact=True)
+    assert [r[:-1] for r in compactos] == [r[:-1] for r in registros]
+    assert [_texto(r[-1]) for r in compactos] == [_texto(r[-1]) for r in registros]
@@ -0,0 +1,62 @@
+import base64
+import gzip
+import os
+import re
+import sys
+
+import folium
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from map_pipeline import save_map  # noqa: E402
+
+
+def _mapa():
+    mapa = folium.Map(location=[-23.55, -46.63], zoom_start=12)
+    folium.Marker([-23.55, -46.63], popup='Ponto #1 - Veículo 1 <Ignição: ligada>').add_to(mapa)
+    return mapa
+
+
+def _sem_ids(html):
+    # Cada mapa recebe ids aleatórios, e renderizar o mesmo mapa duas vezes repete os scripts
+    return re.sub(r'_[0-9a-f]{32}', '', html)
+
+
+@pytest.fixture
+def mapa():
+    return _mapa()
+
+
+@pytest.fixture
+def esperado():
+    return _sem_ids(_mapa().get_root().render())
+
+
+def test_sem_compressao_grava_o_html(mapa, esperado, tmp_path):
+    caminho = save_map(mapa, str(tmp_path / 'mapa.html'))
+    with open(caminho, encoding='utf-8') as f:
+        assert _sem_ids(f.read()) == esperado
+
+
+@pytest.mark.parametrize('nome', ['mapa.html', 'mapa.html.gz'])
+def test_gzip_descomprime_no_html_original(mapa, esperado, tmp_path, nome):
+    caminho = save_map(mapa, str(tmp_path / nome), compressao='gzip')
+    assert caminho == str(tmp_path / 'mapa.html.gz')
+    with gzip.open(caminho, 'rt', encoding='utf-8') as f:
+        assert _sem_ids(f.read()) == esperado
+
+
+def test_autoextraivel_contem_o_html_original(mapa, esperado, tmp_path):
+    caminho = save_map(mapa, str(tmp_path / 'mapa.html'), compressao='autoextraivel')
+    with open(caminho, encoding='utf-8') as f:
+        pagina = f.read()
+    assert '__DADOS__' not in pagina
+    dados = re.search(r"atob\('([A-Za-z0-9+/=]+)'\)", pagina).group(1)
+    assert _sem_ids(gzip.decompress(base64.b64decode(dados)).decode('utf-8')) == esperado
+
+
+def test_compressao_invalida(mapa, tmp_path):
+    with pytest.raises(ValueError):
+        save_map(mapa, str(tmp_path / 'mapa.html'), compressao='zip')
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trajectory_processing import detect_stops  # noqa: E402
+
+# Mesmos limites do ExcelParser
+VEL_MAX_KMH = 3.0
+RAIO_M = 100.0
+MIN_PARADA_S = 300.0
+# Graus de latitude por metro (plano local de _to_local_meters)
+GRAU_POR_M = 1 / 110540.0
+
+
+def _trajeto(passo_m, intervalo_s, n=40, lat0=-23.55, lon0=-46.63):
+    lat = lat0 + np.arange(n) * passo_m * GRAU_POR_M
+    lon = np.full(n, lon0)
+    tempos = np.arange(n) * float(intervalo_s)
+    return lat, lon, tempos
+
+
+def _detectar(lat, lon, tempos, desligada=False):
+    n = len(lat)
+    return detect_stops(lat, lon, tempos, np.zeros(n, dtype=np.int64), np.full(n, desligada),
+                        VEL_MAX_KMH, RAIO_M, MIN_PARADA_S)
+
+
+def test_deslocamento_lento_nao_forma_parada():
+    # 40 leituras a 45 m / 60 s (2,7 km/h): cada par parece parado, mas o
+    # veículo percorre 1,75 km em 39 minutos
+    lat, lon, tempos = _trajeto(45.0, 60)
+    parada_id, duracao = _detectar(lat, lon, tempos)
+    assert (parada_id == -1).all()
+    assert (duracao == 0).all()
+
+
+def test_deslocamento_lento_com_ignicao_desligada_nao_forma_parada():
+    lat, lon, tempos = _trajeto(45.0, 60)
+    parada_id, _ = _detectar(lat, lon, tempos, desligada=True)
+    assert (parada_id == -1).all()
+
+
+def test_ruido_do_gps_parado_forma_uma_parada():
+    rng = np.random.default_rng(0)
+    lat, lon, tempos = _trajeto(0.0, 60)
+    lat = lat + rng.uniform(-20, 20, len(lat)) * GRAU_POR_M
+    parada_id, duracao = _detectar(lat, lon, tempos)
+    assert (parada_id == 0).all()
+    assert (duracao == tempos[-1]).all()
+
+
+def test_parada_termina_ao_sair_do_raio_da_ancora():
+    # 10 leituras paradas, depois deslocamento lento
+    lat_p, lon_p, t_p = _trajeto(0.0, 60, n=10)
+    lat_m, lon_m, t_m = _trajeto(45.0, 60, n=10, lat0=lat_p[-1] + 45.0 * GRAU_POR_M)
+    lat = np.concatenate((lat_p, lat_m))
+    lon = np.concatenate((lon_p, lon_m))
+    tempos = np.concatenate((t_p, t_m + t_p[-1] + 60))
+    parada_id, duracao = _detectar(lat, lon, tempos)
+    # A 11ª e a 12ª leituras (45 e 90 m) ainda estão no raio; a 13ª (135 m) não
+    assert (parada_id[:12] == 0).all()
+    assert (parada_id[12:] == -1).all()
+    assert duracao[0] == tempos[11] - tempos[0]
@@ -0,0 +1,310 @@
+"""
+Cache local dos tiles do mapa base (CartoDB Voyager) em um arquivo MBTiles.
+
+- TileStore: MBTiles (SQLite) com limite de tamanho e descarte LRU;
+- TileCacheServer: servidor HTTP local que o mapa usa como fonte de tiles,
+  buscando na CDN só o que ainda não está no cache;
+- seed_tiles: pré-carrega uma região (bbox) numa faixa de zooms.
+
+Exemplos:
+    python tile_cache.py servir --max-mb 2048
+    python tile_cache.py semear --bbox="-23.8,-46.9;-23.3,-46.3" --zoom 10-16
+    python gerar_mapas_cli.py planilha.xlsx --tiles-locais
+"""
+import os
+import sys
+import math
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+import threading
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Mesmo mapa base do MapBuilder.TILES_PADRAO, sem o sufixo {r} de retina
+# (o cache guarda só os tiles de resolução padrão)
+TILES_ORIGEM = 'https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}.png'
+SUBDOMINIOS = 'abcd'
+PORTA_PADRAO = 8089
+
+
+def local_tiles_url(porta: int = PORTA_PADRAO) -> str:
+    """URL usada pelo mapa quando os tiles vêm do servidor local na porta indicada."""
+    return f'http://127.0.0.1:{porta}/{{z}}/{{x}}/{{y}}.png'
+
+
+TILES_LOCAIS_URL = local_tiles_url()
+
+
+def default_tile_path() -> str:
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gerador_mapas', 'tiles', 'voyager.mbtiles')
+
+
+class TileStore:
+    """
+    Tiles em um arquivo MBTiles, com limite de tamanho.
+
+    Além das tabelas padrão (tiles, metadata), guarda o último acesso de cada
+    tile; ao passar de max_bytes, os tiles usados há mais tempo são descartados
+    até sobrar 90% do limite. Seguro para uso por várias threads.
+    """
+
+    MAX_BYTES_PADRAO = 1024 * 1024 * 1024
+
+    def __init__(self, caminho: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.caminho = caminho or default_tile_path()
+        self.max_bytes = max_bytes or self.MAX_BYTES_PADRAO
+        pasta = os.path.dirname(os.path.abspath(self.caminho))
+        os.makedirs(pasta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.caminho, check_same_thread=False)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+                                              tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row));
+            CREATE TABLE IF NOT EXISTS acesso (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+                                               ultimo REAL, bytes INTEGER,
+                                               PRIMARY KEY (zoom_level, tile_column, tile_row));
+            CREATE INDEX IF NOT EXISTS acesso_ultimo ON acesso (ultimo);
+        """)
+        self._con.executemany('INSERT OR IGNORE INTO metadata VALUES (?, ?)', [
+            ('name', 'CartoDB Voyager (cache local)'), ('format', 'png'), ('type', 'baselayer'),
+        ])
+        self._con.commit()
+        self.total_bytes = self._con.execute('SELECT COALESCE(SUM(bytes), 0) FROM acesso').fetchone()[0]
+
+    @staticmethod
+    def _linha_tms(z: int, y: int) -> int:
+        # MBTiles numera as linhas de baixo para cima (TMS); o Leaflet, de cima para baixo (XYZ)
+        return (1 << z) - 1 - y
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        chave = (z, x, self._linha_tms(z, y))
+        with self._lock:
+            linha = self._con.execute(
+                'SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?', chave).fetchone()
+            if linha is None:
+                return None
+            self._con.execute(
+                'UPDATE acesso SET ultimo=? WHERE zoom_level=? AND tile_column=? AND tile_row=?', (time.time(),) + chave)
+            self._con.commit()
+        return linha[0]
+
+    def has(self, z: int, x: int, y: int) -> bool:
+        with self._lock:
+            return self._con.execute(
+                'SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?',
+                (z, x, self._linha_tms(z, y))).fetchone() is not None
+
+    def put(self, z: int, x: int, y: int, dados: bytes) -> None:
+        chave = (z, x, self._linha_tms(z, y))
+        with self._lock:
+            anterior = self._con.execute(
+                'SELECT bytes FROM acesso WHERE zoom_level=? AND tile_column=? AND tile_row=?', chave).fetchone()
+            self._con.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)', chave + (sqlite3.Binary(dados),))
+            self._con.execute('INSERT OR REPLACE INTO acesso VALUES (?, ?, ?, ?, ?)', chave + (time.time(), len(dados)))
+            self.total_bytes += len(dados) - (anterior[0] if anterior else 0)
+            if self.total_bytes > self.max_bytes:
+                self._descartar(int(self.max_bytes * 0.9))
+            self._con.commit()
+
+    def _descartar(self, alvo_bytes: int) -> None:
+        """Remove os tiles acessados há mais tempo até o cache caber em alvo_bytes (com o lock já obtido)."""
+        cursor = self._con.execute(
+            'SELECT zoom_level, tile_column, tile_row, bytes FROM acesso ORDER BY ultimo')
+        remover = []
+        for z, x, linha, tamanho in cursor:
+            if self.total_bytes <= alvo_bytes:
+                break
+            remover.append((z, x, linha))
+            self.total_bytes -= tamanho
+        self._con.executemany('DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?', remover)
+        self._con.executemany('DELETE FROM acesso WHERE zoom_level=? AND tile_column=? AND tile_row=?', remover)
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+
+def fetch_tile(z: int, x: int, y: int, origem: str = TILES_ORIGEM, timeout: float = 15) -> bytes:
+    """Baixa um tile da CDN (subdomínio sorteado)."""
+    url = origem.format(s=random.choice(SUBDOMINIOS), z=z, x=x, y=y)
+    pedido = urllib.request.Request(url, headers={'User-Agent': 'gerador_mapas-tile-cache/1.0'})
+    with urllib.request.urlopen(pedido, timeout=timeout) as resposta:
+        return resposta.read()
+
+
+def get_or_fetch(store: TileStore, z: int, x: int, y: int, origem: str = TILES_ORIGEM) -> bytes:
+    """Tile do cache; se ausente, baixa da CDN e guarda."""
+    dados = store.get(z, x, y)
+    if dados is None:
+        dados = fetch_tile(z, x, y, origem)
+        store.put(z, x, y, dados)
+    return dados
+
+
+def lat_lon_to_tile(lat: float, lon: float, z: int) -> Tuple[int, int]:
+    """Tile XYZ (Web Mercator) que contém a coordenada no zoom z."""
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 1 << z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_bbox(bbox: Tuple[float, float, float, float], zoom_min: int, zoom_max: int) -> Iterator[Tuple[int, int, int]]:
+    """Tiles (z, x, y) que cobrem o bbox (lat_min, lon_min, lat_max, lon_max) em cada zoom."""
+    lat_min, lon_min, lat_max, lon_max = bbox
+    for z in range(zoom_min, zoom_max + 1):
+        x0, y0 = lat_lon_to_tile(lat_max, lon_min, z)
+        x1, y1 = lat_lon_to_tile(lat_min, lon_max, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def seed_tiles(store: TileStore, bbox: Tuple[float, float, float, float], zoom_min: int, zoom_max: int,
+               workers: int = 4, origem: str = TILES_ORIGEM,
+               progress: Optional[Callable[[int, int, int], None]] = None) -> dict:
+    """
+    Pré-carrega no cache os tiles da região nos zooms indicados; tiles já
+    presentes não são baixados de novo. progress recebe (processados, total, falhas).
+    No máximo 4 downloads por worker ficam na fila, qualquer que seja o tamanho da região.
+    """
+    pendentes: List[Tuple[int, int, int]] = [t for t in tiles_in_bbox(bbox, zoom_min, zoom_max) if not store.has(*t)]
+    total = len(pendentes)
+    falhas = 0
+
+    def baixar(tile):
+        store.put(*tile, fetch_tile(*tile, origem))
+
+    fila = iter(pendentes)
+    em_andamento = set()
+    processados = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for tile in itertools.islice(fila, workers * 4 - len(em_andamento)):
+                em_andamento.add(pool.submit(baixar, tile))
+            if not em_andamento:
+                break
+            prontos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                processados += 1
+                if futuro.exception() is not None:
+                    falhas += 1
+                if progress:
+                    progress(processados, total, falhas)
+    return {'baixados': total - falhas, 'falhas': falhas, 'bytes_cache': store.total_bytes}
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    store: TileStore = None
+    origem: str = TILES_ORIGEM
+
+    def do_GET(self):
+        partes = self.path.split('?')[0].strip('/').split('/')
+        try:
+            z, x, y = int(partes[0]), int(partes[1]), int(partes[2].split('.')[0])
+        except (IndexError, ValueError):
+            self.send_error(404)
+            return
+        try:
+            dados = get_or_fetch(self.store, z, x, y, self.origem)
+        except Exception:
+            # Sem cache e sem rede: o Leaflet apenas deixa o tile em branco
+            self.send_error(502)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(dados)))
+        self.send_header('Cache-Control', 'max-age=86400')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+class TileCacheServer:
+    """Servidor HTTP local de tiles ({z}/{x}/{y}.png) apoiado num TileStore."""
+
+    def __init__(self, store: TileStore, porta: int = PORTA_PADRAO, origem: str = TILES_ORIGEM):
+        self.store = store
+        handler = type('TileHandler', (_TileHandler,), {'store': store, 'origem': origem})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', porta), handler)
+        self.porta = self.httpd.server_address[1]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Modelo de URL para o parâmetro tiles do MapBuilder."""
+        return local_tiles_url(self.porta)
+
+    def start(self) -> 'TileCacheServer':
+        """Atende em segundo plano (thread daemon)."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _parse_bbox(texto: str) -> Tuple[float, float, float, float]:
+    cantos = [[float(v) for v in par.split(',')] for par in texto.split(';') if par.strip()]
+    if len(cantos) != 2 or any(len(c) != 2 for c in cantos):
+        raise ValueError(f"bbox inválido: {texto!r} (use LAT,LON;LAT,LON)")
+    return (min(cantos[0][0], cantos[1][0]), min(cantos[0][1], cantos[1][1]),
+            max(cantos[0][0], cantos[1][0]), max(cantos[0][1], cantos[1][1]))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cache local dos tiles do mapa base.")
+    parser.add_argument('--arquivo', help="Arquivo MBTiles do cache (padrão: pasta do usuário)")
+    parser.add_argument('--max-mb', type=int, default=1024, help="Tamanho máximo do cache (padrão: 1024)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    servir = sub.add_parser('servir', help="Servidor local de tiles para os mapas gerados")
+    servir.add_argument('--porta', type=int, default=PORTA_PADRAO)
+    semear = sub.add_parser('semear', help="Pré-carrega uma região")
+    semear.add_argument('--bbox', required=True, help='Cantos opostos: --bbox="LAT,LON;LAT,LON"')
+    semear.add_argument('--zoom', default='10-15', help="Faixa de zoom (padrão: 10-15)")
+    semear.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    store = TileStore(args.arquivo, args.max_mb * 1024 * 1024)
+    if args.comando == 'servir':
+        servidor = TileCacheServer(store, args.porta)
+        print(f"Servindo tiles em {servidor.url} (cache: {store.caminho}). Ctrl+C para encerrar.")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            servidor.stop()
+        return 0
+
+    zoom_min, _, zoom_max = args.zoom.partition('-')
+    zoom_min, zoom_max = int(zoom_min), int(zoom_max or zoom_min)
+
+    def progresso(feitos, total, falhas):
+        if feitos == total or feitos % 100 == 0:
+            print(f"  {feitos}/{total} tiles ({falhas} falhas)")
+
+    resumo = seed_tiles(store, _parse_bbox(args.bbox), zoom_min, zoom_max, args.workers, progress=progresso)
+    print(f"{resumo['baixados']} tiles baixados, {resumo['falhas']} falhas; "
+          f"cache com {resumo['bytes_cache'] / 1024 / 1024:.1f} MB")
+    store.close()
+    return 0 if resumo['falhas'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+Processamento dos trajetos desenhados no mapa (linhas entre pontos).
+"""
+from typing import List, Optional, Tuple
+import numpy as np
+
+RAIO_TERRA_M = 6371008.8
+
+
+def split_runs(coords: List[List[float]], has_names: List[bool]) -> List[List[List[float]]]:
+    """
+    Divide o trajeto em trechos contínuos de pontos sem nome.
+
+    Uma linha só liga dois pontos consecutivos quando nenhum dos dois tem nome
+    válido; cada trecho retornado é a sequência máxima de pontos ligados
+    (ao menos 2 pontos), pronta para uma polyline de vários vértices.
+    """
+    if len(coords) < 2:
+        return []
+
+    sem_nome = ~np.asarray(has_names, dtype=bool)
+    # Segmento i liga os pontos i e i+1
+    segmentos = sem_nome[:-1] & sem_nome[1:]
+    if not segmentos.any():
+        return []
+
+    # Início/fim de cada sequência de segmentos ativos
+    borda = np.diff(np.concatenate(([0], segmentos.astype(np.int8), [0])))
+    inicios = np.flatnonzero(borda == 1)
+    fins = np.flatnonzero(borda == -1)  # exclusivo em segmentos -> último ponto do trecho
+
+    return [coords[ini:fim + 1] for ini, fim in zip(inicios, fins)]
+
+
+def _to_local_meters(pontos: np.ndarray) -> np.ndarray:
+    """Projeta (lat, lon) em metros num plano local (equirretangular na latitude média)."""
+    lat0 = np.radians(pontos[:, 0].mean())
+    return np.column_stack((pontos[:, 1] * 111320.0 * np.cos(lat0), pontos[:, 0] * 110540.0))
+
+
+def sphere_xyz(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    (lat, lon) em graus -> pontos (x, y, z) em metros na esfera de raio RAIO_TERRA_M.
+    A distância em linha reta entre dois pontos próximos é a distância sobre a superfície.
+    """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return RAIO_TERRA_M * np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def douglas_peucker_mask(pontos: np.ndarray, tolerancia_m: float) -> np.ndarray:
+    """
+    Máscara dos vértices mantidos pelo Douglas-Peucker com tolerância em metros.
+
+    Versão iterativa (pilha de intervalos) com a distância ao segmento calculada
+    em bloco pelo numpy; primeiro e último pontos são sempre mantidos.
+    """
+    n = len(pontos)
+    manter = np.zeros(n, dtype=bool)
+    if n == 0:
+        return manter
+    manter[0] = manter[-1] = True
+    if n < 3 or tolerancia_m <= 0:
+        manter[:] = True
+        return manter
+
+    xy = _to_local_meters(np.asarray(pontos, dtype=float))
+    pilha = [(0, n - 1)]
+    while pilha:
+        ini, fim = pilha.pop()
+        if fim - ini < 2:
+            continue
+        a, b = xy[ini], xy[fim]
+        meio = xy[ini + 1:fim]
+        ab = b - a
+        comp2 = ab @ ab
+        if comp2 == 0.0:
+            dist = np.hypot(*(meio - a).T)
+        else:
+            t = np.clip(((meio - a) @ ab) / comp2, 0.0, 1.0)
+            dist = np.hypot(*(meio - (a + t[:, None] * ab)).T)
+        k = int(dist.argmax())
+        if dist[k] > tolerancia_m:
+            pos = ini + 1 + k
+            manter[pos] = True
+            pilha.append((ini, pos))
+            pilha.append((pos, fim))
+    return manter
+
+
+def simplify_runs(trechos: List[List[List[float]]], tolerancia_m: float) -> List[List[List[float]]]:
+    """Simplifica cada trecho do trajeto; os marcadores não são afetados."""
+    if tolerancia_m <= 0:
+        return trechos
+    simplificados = []
+    for trecho in trechos:
+        pontos = np.asarray(trecho, dtype=float)
+        simplificados.append(pontos[douglas_peucker_mask(pontos, tolerancia_m)].tolist())
+    return simplificados
+
+
+def build_lod_levels(trechos: List[List[List[float]]],
+                     niveis: Tuple[Tuple[int, int, float], ...]) -> List[Tuple[int, int, List[List[List[float]]]]]:
+    """
+    Pré-calcula o trajeto em vários níveis de detalhe.
+
+    niveis: tuplas (zoom mínimo, zoom máximo, tolerância em metros), do menos
+    para o mais detalhado; tolerância 0 mantém o trajeto exato.
+    Retorna (zoom mínimo, zoom máximo, trechos simplificados) por nível.
+    """
+    return [(zoom_min, zoom_max, simplify_runs(trechos, tolerancia))
+            for zoom_min, zoom_max, tolerancia in niveis]
+
+
+def snap_positions(lat: np.ndarray, lon: np.ndarray, tempos_s: np.ndarray, grupos: np.ndarray,
+                   raio_m: float, janela_s: float, fixos: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Junta posições quase idênticas (ruído do GPS com o veículo parado).
+
+    Linhas em ordem cronológica; cada grupo (Tipo) é percorrido separadamente.
+    Uma posição a até raio_m da âncora atual, e a no máximo janela_s segundos da
+    última posição incorporada, recebe as coordenadas da âncora; caso contrário
+    vira a nova âncora. Linhas marcadas em `fixos` nunca são alteradas.
+    Retorna novas arrays de latitude e longitude.
+    """
+    lat = np.array(lat, dtype=float)
+    lon = np.array(lon, dtype=float)
+    n = len(lat)
+    if n < 2 or raio_m <= 0:
+        return lat, lon
+
+    xy = _to_local_meters(np.column_stack((lat, lon)))
+    x, y = xy[:, 0].tolist(), xy[:, 1].tolist()
+    t = np.asarray(tempos_s, dtype=float).tolist()
+    livre = (~np.asarray(fixos, dtype=bool) if fixos is not None else np.ones(n, dtype=bool)).tolist()
+    raio2 = raio_m * raio_m
+
+    # Para cada linha, o índice da âncora cujas coordenadas ela recebe
+    alvo = list(range(n))
+    ordem = np.argsort(grupos, kind='stable')
+    limites = np.flatnonzero(np.diff(np.asarray(grupos)[ordem])) + 1
+    for indices in np.split(ordem, limites):
+        ancora = -1
+        ultimo_t = 0.0
+        for i in indices.tolist():
+            if not livre[i]:
+                continue
+            if (ancora >= 0 and t[i] - ultimo_t <= janela_s
+                    and (x[i] - x[ancora]) ** 2 + (y[i] - y[ancora]) ** 2 <= raio2):
+                alvo[i] = ancora
+            else:
+                ancora = i
+            ultimo_t = t[i]
+
+    destino = np.asarray(alvo)
+    return lat[destino], lon[destino]
+
+
+def detect_stops(lat: np.ndarray, lon: np.ndarray, tempos_s: np.ndarray, grupos: np.ndarray,
+                 ignicao_desligada: np.ndarray, vel_max_kmh: float, raio_m: float, min_parada_s: float,
+                 fixos: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Segmenta o trajeto em paradas.
+
+    Duas leituras consecutivas do mesmo grupo (Tipo) estão paradas quando a
+    distância entre elas é de até raio_m e a velocidade média é de até
+    vel_max_kmh, ou a ignição está desligada nas duas (o GPS oscila mesmo com o
+    veículo desligado). Como em snap_positions, a primeira leitura da sequência
+    é a âncora: uma leitura a mais de raio_m dela encerra a sequência e vira a
+    âncora da próxima, para que um deslocamento lento e contínuo não forme uma
+    parada. Sequências com
+    duração mínima de min_parada_s formam uma parada; linhas marcadas em
+    `fixos` interrompem a sequência.
+
+    Retorna (id da parada por linha, -1 quando em movimento; duração da parada
+    em segundos por linha, 0 quando em movimento).
+    """
+    n = len(lat)
+    parada_id = np.full(n, -1, dtype=np.int64)
+    duracao = np.zeros(n, dtype=float)
+    if n < 2:
+        return parada_id, duracao
+
+    # Leituras de cada grupo ficam contíguas, mantendo a ordem cronológica
+    ordem = np.argsort(grupos, kind='stable')
+    xy = _to_local_meters(np.column_stack((np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))))[ordem]
+    t = np.asarray(tempos_s, dtype=float)[ordem]
+    g = np.asarray(grupos)[ordem]
+    desligada = np.asarray(ignicao_desligada, dtype=bool)[ordem]
+    livre = ~np.asarray(fixos, dtype=bool)[ordem] if fixos is not None else np.ones(n, dtype=bool)
+
+    # Ligação i: entre as leituras i e i+1 (na ordem do grupo)
+    dist = np.hypot(*np.diff(xy, axis=0).T)
+    dt = np.diff(t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocidade = np.where(dt > 0, dist / dt * 3.6, np.where(dist > 0, np.inf, 0.0))
+    parado = ((g[:-1] == g[1:]) & livre[:-1] & livre[1:] & (dist <= raio_m)
+              & ((velocidade <= vel_max_kmh) | (desligada[:-1] & desligada[1:])))
+    if not parado.any():
+        return parada_id, duracao
+
+    borda = np.diff(np.concatenate(([0], parado.astype(np.int8), [0])))
+    inicios, fins = [], []
+    # Cada sequência de ligações paradas é cortada onde uma leitura se afasta
+    # mais de raio_m da âncora; a distância à âncora é calculada em blocos que
+    # dobram de tamanho, para um deslocamento lento não custar O(n²)
+    for ini, fim in zip(np.flatnonzero(borda == 1).tolist(), np.flatnonzero(borda == -1).tolist()):
+        while ini < fim:
+            corte, bloco, de = fim + 1, 16, ini + 1
+            while de <= fim:
+                ate = min(de + bloco, fim + 1)
+                longe = np.flatnonzero(np.hypot(*(xy[de:ate] - xy[ini]).T) > raio_m)
+                if len(longe):
+                    corte = de + int(longe[0])
+                    break
+                de, bloco = ate, bloco * 2
+            if corte - 1 > ini:
+                inicios.append(ini)
+                fins.append(corte - 1)
+            ini = corte
+    inicios = np.asarray(inicios, dtype=np.int64)
+    fins = np.asarray(fins, dtype=np.int64)  # última leitura da sequência
+    duracoes = t[fins] - t[inicios]
+    validas = duracoes >= min_parada_s
+    inicios, fins, duracoes = inicios[validas], fins[validas], duracoes[validas]
+
+    for k, (ini, fim, dur) in enumerate(zip(inicios.tolist(), fins.tolist(), duracoes.tolist())):
+        linhas = ordem[ini:fim + 1]
+        parada_id[linhas] = k
+        duracao[linhas] = dur
+    return parada_id, duracao
+
+
+def points_in_polygon(lat: np.ndarray, lon: np.ndarray, poligono: List[Tuple[float, float]]) -> np.ndarray:
+    """
+    Máscara dos pontos dentro do polígono (vértices (lat, lon), fechado ou não).
+
+    Ray casting vetorizado: um laço por aresta, todos os pontos de uma vez.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    vertices = np.asarray(poligono, dtype=float)
+    dentro = np.zeros(len(lat), dtype=bool)
+    if len(vertices) < 3:
+        return dentro
+    for (lat1, lon1), (lat2, lon2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        cruza = (lat1 > lat) != (lat2 > lat)
+        if not cruza.any():
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lon_corte = lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+        dentro ^= cruza & (lon < lon_corte)
+    return dentro
@@ -4,7 +4,8 @@ Utilitários para formatação, normalização e manipulação de strings.
 import re
 import hashlib
 from decimal import Decimal
-from typing import Optional
+from typing import Optional, List
+import numpy as np
 import pandas as pd
 
 # =================================================================
@@ -23,6 +24,10 @@ CONFIG_TIPOS = {
     "TRAVA_CILTRONC": "#469E92",
 }
 
+# Valores de NOME_PESSOA que não representam um motorista identificado
+NOMES_INVALIDOS = ('nan', 'n/i', 'none', 'null', '', '0')
+
+
 def html_escape(s: str) -> str:
     """
     Escapa caracteres especiais para HTML.
@@ -80,6 +85,21 @@ def is_nonempty_desc(x) -> bool:
     return True
 
 
+def valid_name_mask(nomes: pd.Series) -> pd.Series:
+    """
+    Verifica, para uma coluna inteira, quais NOME_PESSOA identificam de fato
+    um motorista (não vazios e fora de NOMES_INVALIDOS).
+
+    Args:
+        nomes: Série com os nomes
+
+    Returns:
+        Série booleana indicando os nomes válidos
+    """
+    nomes = nomes.map(str).str.strip()
+    return nomes.ne('') & ~nomes.str.lower().isin(NOMES_INVALIDOS)
+
+
 def format_brl(num) -> Optional[str]:
     """
     Formata valor (Decimal ou string) como 'R$ 1.234,56'.
@@ -109,6 +129,21 @@ def format_brl(num) -> Optional[str]:
     return f"{neg}R$ {milhar},{dec}"
 
 
+def format_duration(segundos: float) -> str:
+    """
+    Formata uma duração como '2h 15min' (ou '45min').
+
+    Args:
+        segundos: Duração em segundos
+
+    Returns:
+        String formatada
+    """
+    minutos = int(round(segundos / 60))
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas}h {minutos:02d}min" if horas else f"{minutos}min"
+
+
 def normalize_money(texto: str) -> Optional[Decimal]:
     """
     Converte strings monetárias para Decimal.
@@ -151,6 +186,19 @@ def normalize_money(texto: str) -> Optional[Decimal]:
     except Exception:
         return None
 
+# Paleta padrão atribuída aos Tipos em ordem alfabética (tela de cores e modo sem interface)
+CORES_PADRAO = (
+    "#2563eb", "#dc2626", "#16a34a", "#9333ea",
+    "#ea580c", "#0891b2", "#ca8a04", "#db2777",
+    "#0d9488", "#4f46e5", "#f59e0b", "#8b5cf6"
+)
+
+
+def default_color_mapping(tipos: List[str]) -> dict:
+    """Mapeamento Tipo -> cor com a paleta padrão, na mesma ordem da ColorPickerUI."""
+    return {tipo: CORES_PADRAO[i % len(CORES_PADRAO)] for i, tipo in enumerate(sorted(tipos))}
+
+
 def get_vehicle_color(name: str, mapeamento_cores: dict = None) -> str:
     """Retorna a cor vinda do mapeamento dinâmico ou cinza por padrão."""
     if mapeamento_cores and name in mapeamento_cores:
@@ -171,12 +219,24 @@ def adjust_color_brightness(hex_color: str, factor: float) -> str:
     return '#{:02x}{:02x}{:02x}'.format(*new_rgb)
 
 
-def get_vehicle_marker_color(name: str, index: int, total: int, mapeamento_cores: dict = None) -> str:
-    """Calcula o degradê baseado na cor base fornecida pelo dicionário dinâmico."""
-    base_color = get_vehicle_color(name, mapeamento_cores)
-    # Lógica de brilho (degradê)
-    factor = 0.3 + (0.7 * (index / (total - 1))) if total > 1 else 1.0
-    return adjust_color_brightness(base_color, factor)
+def get_vehicle_marker_colors(name: str, total: int, mapeamento_cores: dict = None) -> List[str]:
+    """
+    Calcula de uma vez o degradê de todos os pontos de um Tipo, do mais claro
+    (primeiro ponto, fator 0.3) até a cor base (último ponto).
+    """
+    if total <= 0:
+        return []
+    base_color = get_vehicle_color(name, mapeamento_cores).lstrip('#')
+    rgb = np.array([int(base_color[i:i + 2], 16) for i in (0, 2, 4)])
+
+    if total > 1:
+        factor = 0.3 + (0.7 * (np.arange(total) / (total - 1)))
+    else:
+        factor = np.ones(1)
+
+    # Mesma mistura com branco de adjust_color_brightness, truncando como int()
+    canais = (rgb[None, :] + (255 - rgb[None, :]) * (1 - factor[:, None])).astype(int)
+    return ['#{:02x}{:02x}{:02x}'.format(*c) for c in canais.tolist()]
 
 def extract_vehicle_from_name(nome: str) -> Optional[str]:
     """